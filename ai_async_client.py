@@ -0,0 +1,68 @@
+"""
+外部AI服务异步HTTP客户端
+供ASGI服务路径使用，基于httpx.AsyncClient；重试策略与 ai_http_client 保持一致
+"""
+
+import asyncio
+
+import httpx
+
+from ai_http_client import RETRY_STATUS_CODES, _backoff_delay, _parse_retry_after
+from config import Config
+
+_client = None
+
+
+def get_async_client():
+    """获取当前进程共享的异步HTTP客户端（首次调用时创建）"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=Config.AI_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.AI_ASYNC_MAX_KEEPALIVE
+            ),
+            timeout=httpx.Timeout(
+                Config.AI_HTTP_READ_TIMEOUT,
+                connect=Config.AI_HTTP_CONNECT_TIMEOUT,
+                pool=None
+            )
+        )
+    return _client
+
+
+async def close_async_client():
+    """关闭共享客户端并释放连接池"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def post_json(url, headers, payload, stream=False):
+    """异步发送JSON POST请求，429/5xx及连接失败时退避重试，返回最后一次响应
+
+    stream=True 时响应体未读取，调用方需在使用完毕后 await response.aclose()。
+    """
+    client = get_async_client()
+    attempt = 0
+
+    while True:
+        request = client.build_request('POST', url, headers=headers, json=payload)
+        try:
+            response = await client.send(request, stream=stream)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            if attempt >= Config.AI_HTTP_MAX_RETRIES:
+                raise
+            await asyncio.sleep(_backoff_delay(attempt))
+            attempt += 1
+            continue
+
+        if response.status_code in RETRY_STATUS_CODES and attempt < Config.AI_HTTP_MAX_RETRIES:
+            delay = _backoff_delay(attempt, _parse_retry_after(response))
+            await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+
+        return response
@@ -0,0 +1,98 @@
+"""
+外部AI服务HTTP客户端
+维护进程级共享的连接池，复用TCP/TLS连接，并对429/5xx响应进行带抖动的退避重试
+"""
+
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+# 需要重试的HTTP状态码
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """获取进程级共享的HTTP会话（首次调用时创建）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # 每个主机一个连接池，连接保持keep-alive；池满时阻塞等待而不是新建连接
+                adapter = HTTPAdapter(
+                    pool_connections=Config.AI_HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=Config.AI_HTTP_POOL_MAXSIZE,
+                    pool_block=True,
+                    max_retries=0
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def close_session():
+    """关闭共享会话并释放连接池"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _parse_retry_after(response):
+    """解析Retry-After响应头（仅支持秒数格式）"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+def _backoff_delay(attempt, retry_after=None):
+    """计算第attempt次重试前的等待秒数（指数退避 + full jitter）"""
+    if retry_after is not None:
+        return min(retry_after, Config.AI_HTTP_BACKOFF_MAX)
+    cap = min(Config.AI_HTTP_BACKOFF_MAX, Config.AI_HTTP_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+def post_json(url, headers, payload, stream=False):
+    """发送JSON POST请求，429/5xx及连接失败时退避重试，返回最后一次响应
+
+    读超时不重试，避免单次请求的总耗时成倍增长。
+    """
+    session = get_session()
+    timeout = (Config.AI_HTTP_CONNECT_TIMEOUT, Config.AI_HTTP_READ_TIMEOUT)
+    attempt = 0
+
+    while True:
+        try:
+            response = session.post(url, headers=headers, json=payload,
+                                    timeout=timeout, stream=stream)
+        except requests.ConnectionError:
+            if attempt >= Config.AI_HTTP_MAX_RETRIES:
+                raise
+            time.sleep(_backoff_delay(attempt))
+            attempt += 1
+            continue
+
+        if response.status_code in RETRY_STATUS_CODES and attempt < Config.AI_HTTP_MAX_RETRIES:
+            delay = _backoff_delay(attempt, _parse_retry_after(response))
+            # 释放连接回连接池
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        return response
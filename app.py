@@ -1,10 +1,34 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
 import os
+import json
+import time
+import atexit
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
-import requests
+from functools import wraps
+from config import Config
+from ai_http_client import post_json
+from reply_cache import ReplyCache
+from dashboard_cache import dashboard_cache
+from etags import conditional_get
+from compression import init_compression
+from circuit_breaker import CircuitBreaker
+from singleflight import SingleFlight
+from keyword_matcher import KeywordMatcher
+from conversation_context import ConversationContext
+from conversation_store import ConversationStore, SQLiteSpillStorage
+from conversation_persistence import ConversationWriter, DatabaseSpillStorage, UserIdResolver
+from search_index import ConversationSearchIndex
+from health_metrics import start_partition_maintenance
+from models import db
+from repositories import UserRepository, WorkoutRepository, GoalRepository, engine_options
+from metrics import (
+    REGISTRY, CallbackMetric, AI_UPSTREAM_LATENCY, AI_UPSTREAM_TTFT, AI_UPSTREAM_REQUESTS,
+    AI_FALLBACKS, FALLBACK_NO_KEY, FALLBACK_HTTP_ERROR, FALLBACK_EXCEPTION, FALLBACK_BREAKER_OPEN,
+    record_usage
+)
 
 # 加载环境变量
 load_dotenv()
@@ -14,48 +38,228 @@ DEEPSEEK_API_KEY = os.getenv('OPENAI_API_KEY')
 DEEPSEEK_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.deepseek.com/v1')
 DEEPSEEK_MODEL = os.getenv('OPENAI_MODEL', 'deepseek-chat')
 
+# AI回复缓存（仅缓存上游成功返回的回复）
+reply_cache = ReplyCache(max_size=Config.AI_REPLY_CACHE_SIZE, ttl=Config.AI_REPLY_CACHE_TTL)
+
+# DeepSeek上游熔断器，熔断期间直接使用模拟回复
+ai_breaker = CircuitBreaker(
+    'deepseek',
+    failure_rate_threshold=Config.AI_BREAKER_FAILURE_RATE,
+    slow_call_seconds=Config.AI_BREAKER_SLOW_CALL_SECONDS,
+    slow_call_rate_threshold=Config.AI_BREAKER_SLOW_CALL_RATE,
+    window_seconds=Config.AI_BREAKER_WINDOW_SECONDS,
+    minimum_calls=Config.AI_BREAKER_MIN_CALLS,
+    open_seconds=Config.AI_BREAKER_OPEN_SECONDS,
+    half_open_max_calls=Config.AI_BREAKER_HALF_OPEN_CALLS
+)
+
+# 相同问题的并发请求合并为一次上游调用
+ai_singleflight = SingleFlight()
+
+# 对话上下文（最近若干轮 + 滚动摘要，受token预算约束）
+conversation_context = ConversationContext(
+    token_budget=Config.AI_CONTEXT_TOKEN_BUDGET,
+    recent_messages=Config.AI_CONTEXT_RECENT_MESSAGES,
+    summary_max_tokens=Config.AI_CONTEXT_SUMMARY_TOKENS,
+    max_states=Config.AI_CONTEXT_MAX_STATES
+)
+
+# 缓存、请求合并、熔断器的统计一并通过 /metrics 暴露
+REGISTRY.register(CallbackMetric(
+    'ai_reply_cache_hits_total', 'Reply cache hits', lambda: reply_cache.hits, type_name='counter'))
+REGISTRY.register(CallbackMetric(
+    'ai_reply_cache_misses_total', 'Reply cache misses', lambda: reply_cache.misses, type_name='counter'))
+REGISTRY.register(CallbackMetric(
+    'ai_singleflight_coalesced_total', 'Callers that shared an in-flight upstream call',
+    lambda: ai_singleflight.coalesced, type_name='counter'))
+REGISTRY.register(CallbackMetric(
+    'ai_circuit_breaker_state', 'Current circuit breaker state (1 for the active state)',
+    lambda: [((state,), int(ai_breaker.state == state))
+             for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)],
+    labelnames=['state']))
+REGISTRY.register(CallbackMetric(
+    'dashboard_cache_hits_total', 'Dashboard cache hits by endpoint',
+    lambda: [((name,), count) for name, count in dashboard_cache.stats()['hits'].items()],
+    labelnames=['endpoint'], type_name='counter'))
+REGISTRY.register(CallbackMetric(
+    'dashboard_cache_misses_total', 'Dashboard cache misses by endpoint',
+    lambda: [((name,), count) for name, count in dashboard_cache.stats()['misses'].items()],
+    labelnames=['endpoint'], type_name='counter'))
+REGISTRY.register(CallbackMetric(
+    'dashboard_cache_invalidations_total', 'Dashboard cache invalidations caused by user writes',
+    lambda: dashboard_cache.invalidations, type_name='counter'))
+
 # 外部AI服务调用函数
-def call_external_ai_service(message, service_type="nutritionist"):
+def is_ai_service_configured():
+    """是否配置了可用的API密钥"""
+    return bool(DEEPSEEK_API_KEY) and DEEPSEEK_API_KEY != 'your_openai_api_key_here'
+
+def build_chat_request(message, service_type, stream=False, context=None):
+    """构建DeepSeek对话补全请求的URL、请求头和请求体
+
+    context 为插入在系统提示词与当前消息之间的历史上下文消息。
+    """
+    # 构建提示词
+    system_prompt = get_system_prompt(service_type)
+    
+    headers = {
+        'Authorization': f'Bearer {DEEPSEEK_API_KEY}',
+        'Content-Type': 'application/json'
+    }
+    
+    data = {
+        'model': DEEPSEEK_MODEL,
+        'messages': [
+            {'role': 'system', 'content': system_prompt},
+            *(context or []),
+            {'role': 'user', 'content': message}
+        ],
+        'temperature': 0.7,
+        'max_tokens': 500,
+        'stream': stream
+    }
+    if stream:
+        # 在最后一个数据块中返回token用量
+        data['stream_options'] = {'include_usage': True}
+    
+    return f'{DEEPSEEK_BASE_URL}/chat/completions', headers, data
+
+def fallback_reply(message, service_type, reason):
+    """记录回退原因并返回模拟回复"""
+    AI_FALLBACKS.inc(service_type=service_type, reason=reason)
+    return get_simulated_reply(message, service_type)
+
+def record_upstream_success(service_type, started, usage=None):
+    """记录一次成功的上游调用（熔断器 + 指标）"""
+    latency = time.monotonic() - started
+    ai_breaker.record_success(latency)
+    AI_UPSTREAM_LATENCY.observe(latency, service_type=service_type)
+    AI_UPSTREAM_REQUESTS.inc(service_type=service_type, outcome='success')
+    record_usage(service_type, usage)
+
+def record_upstream_failure(service_type, started, reason):
+    """记录一次失败的上游调用（熔断器 + 指标）"""
+    latency = time.monotonic() - started
+    ai_breaker.record_failure(latency)
+    AI_UPSTREAM_LATENCY.observe(latency, service_type=service_type)
+    AI_UPSTREAM_REQUESTS.inc(service_type=service_type, outcome=reason)
+
+def call_external_ai_service(message, service_type="nutritionist", context=None):
     """调用外部AI服务获取回复"""
     
     # 如果没有配置API密钥，使用模拟回复
-    if not DEEPSEEK_API_KEY or DEEPSEEK_API_KEY == 'your_openai_api_key_here':
-        return get_simulated_reply(message, service_type)
+    if not is_ai_service_configured():
+        return fallback_reply(message, service_type, FALLBACK_NO_KEY)
     
+    # 命中缓存时跳过上游调用；带历史上下文时缓存键包含上下文摘要，不会串用其他对话的回复
+    cache_key = ReplyCache.make_key(service_type, SYSTEM_PROMPT_VERSION, message, context)
+    cached_reply = reply_cache.get(cache_key)
+    if cached_reply is not None:
+        return cached_reply
+    
+    # 相同问题（及相同上下文）的并发请求共享同一次上游调用
+    return ai_singleflight.do(cache_key, lambda: _fetch_ai_reply(message, service_type, cache_key, context))
+
+def _fetch_ai_reply(message, service_type, cache_key, context=None):
+    """实际访问上游获取回复，失败时返回模拟回复"""
+    
+    # 熔断期间不访问网络
+    if not ai_breaker.allow_request():
+        return fallback_reply(message, service_type, FALLBACK_BREAKER_OPEN)
+    
+    started = time.monotonic()
     try:
-        # 构建提示词
-        system_prompt = get_system_prompt(service_type)
-        
         # 调用DeepSeek API
-        headers = {
-            'Authorization': f'Bearer {DEEPSEEK_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
-        data = {
-            'model': DEEPSEEK_MODEL,
-            'messages': [
-                {'role': 'system', 'content': system_prompt},
-                {'role': 'user', 'content': message}
-            ],
-            'temperature': 0.7,
-            'max_tokens': 500,
-            'stream': False
-        }
-        
-        response = requests.post(f'{DEEPSEEK_BASE_URL}/chat/completions', 
-                                headers=headers, json=data, timeout=30)
+        url, headers, data = build_chat_request(message, service_type, context=context)
+        response = post_json(url, headers, data)
         
         if response.status_code == 200:
             result = response.json()
-            return result['choices'][0]['message']['content'].strip()
+            ai_reply = result['choices'][0]['message']['content'].strip()
+            record_upstream_success(service_type, started, result.get('usage'))
+            reply_cache.set(cache_key, ai_reply)
+            return ai_reply
         else:
+            record_upstream_failure(service_type, started, FALLBACK_HTTP_ERROR)
             print(f"AI服务调用失败: {response.status_code} - {response.text}")
-            return get_simulated_reply(message, service_type)
+            return fallback_reply(message, service_type, FALLBACK_HTTP_ERROR)
             
     except Exception as e:
+        record_upstream_failure(service_type, started, FALLBACK_EXCEPTION)
         print(f"AI服务调用异常: {e}")
-        return get_simulated_reply(message, service_type)
+        return fallback_reply(message, service_type, FALLBACK_EXCEPTION)
+
+def stream_external_ai_service(message, service_type="nutritionist", context=None):
+    """以流式方式调用外部AI服务，逐段产出回复文本
+
+    上游在输出任何内容之前失败时，整段产出模拟回复；输出中途失败则直接结束。
+    """
+    
+    if not is_ai_service_configured():
+        yield fallback_reply(message, service_type, FALLBACK_NO_KEY)
+        return
+    
+    cache_key = ReplyCache.make_key(service_type, SYSTEM_PROMPT_VERSION, message, context)
+    cached_reply = reply_cache.get(cache_key)
+    if cached_reply is not None:
+        yield cached_reply
+        return
+    
+    if not ai_breaker.allow_request():
+        yield fallback_reply(message, service_type, FALLBACK_BREAKER_OPEN)
+        return
+    
+    emitted = False
+    recorded = False
+    parts = []
+    usage = None
+    started = time.monotonic()
+    try:
+        url, headers, data = build_chat_request(message, service_type, stream=True, context=context)
+        response = post_json(url, headers, data, stream=True)
+        
+        if response.status_code != 200:
+            record_upstream_failure(service_type, started, FALLBACK_HTTP_ERROR)
+            recorded = True
+            print(f"AI服务调用失败: {response.status_code} - {response.text}")
+            yield fallback_reply(message, service_type, FALLBACK_HTTP_ERROR)
+            return
+        
+        with response:
+            response.encoding = 'utf-8'
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                chunk = line[5:].strip()
+                if chunk == '[DONE]':
+                    record_upstream_success(service_type, started, usage)
+                    recorded = True
+                    reply_cache.set(cache_key, ''.join(parts).strip())
+                    break
+                payload = json.loads(chunk)
+                usage = payload.get('usage') or usage
+                choices = payload.get('choices') or []
+                delta = choices[0].get('delta', {}).get('content') if choices else None
+                if delta:
+                    if not emitted:
+                        AI_UPSTREAM_TTFT.observe(time.monotonic() - started, service_type=service_type)
+                    emitted = True
+                    parts.append(delta)
+                    yield delta
+                    
+    except Exception as e:
+        record_upstream_failure(service_type, started, FALLBACK_EXCEPTION)
+        recorded = True
+        print(f"AI服务流式调用异常: {e}")
+        if not emitted:
+            yield fallback_reply(message, service_type, FALLBACK_EXCEPTION)
+    finally:
+        # 客户端中途断开等情况下没有可判定的结果
+        if not recorded:
+            ai_breaker.release()
+
+# 系统提示词版本号，修改提示词内容时需递增以使回复缓存失效
+SYSTEM_PROMPT_VERSION = 1
 
 def get_system_prompt(service_type):
     """根据服务类型获取系统提示词"""
@@ -81,40 +285,44 @@ def get_system_prompt(service_type):
     
     return prompts.get(service_type, "你是一名专业的AI助手，请用专业、友好的语气回复用户的问题。")
 
+# 营养师关键词匹配回复（按顺序，越靠前优先级越高）
+NUTRITION_RESPONSES = {
+    "营养概况": "根据您的饮食记录，您今天的蛋白质摄入量已达到目标的75%，碳水化合物82%，脂肪80%。",
+    "饮食记录": "您今天的饮食记录：早餐牛奶面包，午餐鸡胸肉沙拉，晚餐鱼肉糙米饭。",
+    "营养目标": "您的营养目标：每日蛋白质60g，热量控制1800kcal，每周减重0.5kg。",
+    "膳食计划": "本周膳食计划：周一高蛋白早餐+轻食午餐+低脂晚餐，周二水果早餐+均衡午餐+素食晚餐。",
+    "减肥": "减肥期间建议：控制总热量摄入，增加蛋白质比例，减少精制碳水化合物。",
+    "增肌": "增肌期间建议：增加蛋白质摄入至1.6-2.2g/kg体重，配合力量训练。",
+    "糖尿病": "糖尿病患者饮食建议：控制碳水化合物总量，选择低GI食物，定时定量。",
+    "高血压": "高血压患者饮食建议：低盐饮食，增加钾摄入，控制体重。"
+}
+
+# 健身教练关键词匹配回复
+FITNESS_RESPONSES = {
+    "体能概况": "根据您的运动记录，您本周已完成3次训练，总消耗1200卡路里。",
+    "训练计划": "当前训练计划：周一力量训练，周三有氧运动，周五柔韧性训练。",
+    "运动记录": "您最近一次运动是力量训练，消耗300卡路里。",
+    "健身目标": "您的减重目标已完成50%，继续保持！"
+}
+
+# 关键词表只在启动时编译一次
+_nutrition_matcher = KeywordMatcher(NUTRITION_RESPONSES.items())
+_fitness_matcher = KeywordMatcher(FITNESS_RESPONSES.items())
+
 def get_simulated_reply(message, service_type):
     """模拟AI回复（当外部服务不可用时使用）"""
     
     if service_type == "nutritionist":
-        # 营养师关键词匹配回复
-        nutrition_responses = {
-            "营养概况": "根据您的饮食记录，您今天的蛋白质摄入量已达到目标的75%，碳水化合物82%，脂肪80%。",
-            "饮食记录": "您今天的饮食记录：早餐牛奶面包，午餐鸡胸肉沙拉，晚餐鱼肉糙米饭。",
-            "营养目标": "您的营养目标：每日蛋白质60g，热量控制1800kcal，每周减重0.5kg。",
-            "膳食计划": "本周膳食计划：周一高蛋白早餐+轻食午餐+低脂晚餐，周二水果早餐+均衡午餐+素食晚餐。",
-            "减肥": "减肥期间建议：控制总热量摄入，增加蛋白质比例，减少精制碳水化合物。",
-            "增肌": "增肌期间建议：增加蛋白质摄入至1.6-2.2g/kg体重，配合力量训练。",
-            "糖尿病": "糖尿病患者饮食建议：控制碳水化合物总量，选择低GI食物，定时定量。",
-            "高血压": "高血压患者饮食建议：低盐饮食，增加钾摄入，控制体重。"
-        }
-        
-        for keyword, response in nutrition_responses.items():
-            if keyword in message:
-                return response
+        response = _nutrition_matcher.match(message)
+        if response is not None:
+            return response
         
         return "我理解您想了解营养相关信息。请告诉我您具体想了解什么？比如营养概况、饮食记录、营养目标或膳食计划等。"
     
     else:  # fitness_trainer
-        # 健身教练关键词匹配回复
-        fitness_responses = {
-            "体能概况": "根据您的运动记录，您本周已完成3次训练，总消耗1200卡路里。",
-            "训练计划": "当前训练计划：周一力量训练，周三有氧运动，周五柔韧性训练。",
-            "运动记录": "您最近一次运动是力量训练，消耗300卡路里。",
-            "健身目标": "您的减重目标已完成50%，继续保持！"
-        }
-        
-        for keyword, response in fitness_responses.items():
-            if keyword in message:
-                return response
+        response = _fitness_matcher.match(message)
+        if response is not None:
+            return response
         
         return "我理解您想了解健身相关信息。请告诉我您具体想了解什么？比如体能概况、训练计划、运动记录或健身目标等。"
 
@@ -131,84 +339,88 @@ CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS, "methods": ["GET", "PO
 # 初始化JWT
 jwt = JWTManager(app)
 
+# 初始化数据库
+app.config['SQLALCHEMY_DATABASE_URI'] = Config.DATABASE_URL
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(Config.DATABASE_URL)
+db.init_app(app)
+
 # 导入并注册蓝图
 from routes.auth_routes import auth_bp
-from routes.fitness_routes import fitness_bp
+from routes.fitness_routes import fitness_bp, json_response
 
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(fitness_bp, url_prefix='/api')
 
-# 模拟数据库数据（实际项目中应使用真实数据库）
-users_db = {
-    "user1": {
-        "username": "user1",
-        "password": "password123",
-        "profile": {
-            "age": 30,
-            "gender": "male",
-            "height": 175,
-            "weight": 70,
-            "fitness_level": "intermediate",
-            "goals": ["weight_loss", "muscle_gain"]
-        }
-    }
-}
+# 响应压缩；前端静态文件启动时预压缩
+static_assets = init_compression(app, Config.STATIC_DIR)
 
-# 模拟健身数据
-fitness_data = {
-    "user1": {
-        "workouts": [
-            {
-                "id": 1,
-                "type": "strength",
-                "duration": 60,
-                "calories": 300,
-                "exercises": [
-                    {"name": "Bench Press", "sets": 3, "reps": 10, "weight": 60},
-                    {"name": "Squats", "sets": 3, "reps": 12, "weight": 80}
-                ],
-                "date": "2024-01-15"
-            }
-        ],
-        "fitness_goals": [
-            {
-                "id": 1,
-                "type": "weight_loss",
-                "target": 5,
-                "current": 2.5,
-                "deadline": "2024-03-01"
-            }
-        ]
-    }
-}
+# 健康指标采样表的按月分区（PostgreSQL）：启动时及之后每天确保当月和后续月份的分区存在
+if Config.HEALTH_PARTITION_MONTHS_AHEAD >= 0:
+    start_partition_maintenance(app, Config.HEALTH_PARTITION_MONTHS_AHEAD)
 
-# 模拟AI对话历史
-ai_conversations = {
-    "user1": {
-        "fitness_trainer": [
-            {
-                "id": 1,
-                "message": "我想开始健身，有什么建议吗？",
-                "sender": "user",
-                "timestamp": "2024-01-15T10:00:00"
-            },
-            {
-                "id": 2,
-                "message": "根据您的身体状况，我建议从基础力量训练开始，每周3次，每次45-60分钟。",
-                "sender": "ai",
-                "timestamp": "2024-01-15T10:01:00"
-            }
-        ],
-        "nutritionist": [
-            {
-                "id": 1,
-                "message": "您好！我是您的AI营养师，可以根据您的健康状况和饮食偏好为您提供个性化的营养建议。请问有什么我可以帮助您的吗？",
-                "sender": "ai",
-                "timestamp": "2024-01-15T10:00:00"
-            }
-        ]
-    }
-}
+# AI对话历史（每个用户、每种服务只在内存中保留最近的消息，更早的消息溢出到持久化存储）
+# database: 每条消息由后台写入器批量写入 ai_conversations 表；sqlite: 仅溢出到本地SQLite文件（无数据库的开发环境）
+conversation_writer = None
+if Config.CONVERSATION_STORAGE == 'database':
+    user_id_resolver = UserIdResolver(app)
+    conversation_writer = ConversationWriter(
+        app, user_id_resolver,
+        batch_size=Config.CONVERSATION_WRITE_BATCH_SIZE,
+        flush_interval=Config.CONVERSATION_WRITE_INTERVAL
+    )
+    conversation_writer.start()
+    conversation_storage = DatabaseSpillStorage(app, user_id_resolver, conversation_writer)
+else:
+    conversation_storage = SQLiteSpillStorage(Config.CONVERSATION_SPILL_PATH)
+
+ai_conversations = ConversationStore(
+    conversation_storage,
+    window_size=Config.CONVERSATION_WINDOW_SIZE,
+    max_conversations=Config.CONVERSATION_MAX_ACTIVE,
+    writer=conversation_writer,
+    id_block_size=Config.CONVERSATION_ID_BLOCK_SIZE
+)
+atexit.register(ai_conversations.flush)
+if conversation_writer is not None:
+    # atexit按注册的逆序执行：先停止写入器，写完队列中剩余的消息
+    atexit.register(conversation_writer.stop)
+
+# 示例对话数据（数据库模式下由 init_db.py 写入）
+if Config.CONVERSATION_STORAGE != 'database' and not ai_conversations.recent("user1", "fitness_trainer"):
+    ai_conversations.append("user1", "fitness_trainer", "我想开始健身，有什么建议吗？", "user",
+                            "2024-01-15T10:00:00")
+    ai_conversations.append("user1", "fitness_trainer",
+                            "根据您的身体状况，我建议从基础力量训练开始，每周3次，每次45-60分钟。", "ai",
+                            "2024-01-15T10:01:00")
+if Config.CONVERSATION_STORAGE != 'database' and not ai_conversations.recent("user1", "nutritionist"):
+    ai_conversations.append("user1", "nutritionist",
+                            "您好！我是您的AI营养师，可以根据您的健康状况和饮食偏好为您提供个性化的营养建议。请问有什么我可以帮助您的吗？",
+                            "ai", "2024-01-15T10:00:00")
+
+# 对话历史全文检索（用户首次检索时从对话存储加载历史建立索引，之后随新消息增量更新）
+CONVERSATION_SERVICE_TYPES = ("fitness_trainer", "nutritionist")
+
+def load_search_documents(user):
+    for service_type in CONVERSATION_SERVICE_TYPES:
+        for message in ai_conversations.history(user, service_type):
+            yield service_type, message
+
+conversation_search = ConversationSearchIndex(load_search_documents,
+                                              max_users=Config.CONVERSATION_SEARCH_MAX_USERS)
+
+REGISTRY.register(CallbackMetric(
+    'conversation_store_memory_bytes', 'Estimated bytes held by in-memory conversation windows',
+    lambda: ai_conversations.memory_usage()['bytes_in_memory']))
+
+# 管理员权限校验（需在jwt_required之后使用）
+def admin_required(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if get_jwt_identity() not in Config.ADMIN_USERS:
+            return jsonify({'error': 'Admin privileges required'}), 403
+        return fn(*args, **kwargs)
+    return wrapper
 
 # 认证路由
 @app.route('/api/auth/login', methods=['POST'])
@@ -217,18 +429,85 @@ def login():
     username = data.get('username')
     password = data.get('password')
     
-    if username in users_db and users_db[username]['password'] == password:
+    user = UserRepository.get(username)
+    if UserRepository.verify_password(user, password):
         access_token = create_access_token(identity=username)
         return jsonify({
             'access_token': access_token,
             'user': {
                 'username': username,
-                'profile': users_db[username]['profile']
+                'profile': UserRepository.profile(user)
             }
         }), 200
     
     return jsonify({'message': 'Invalid credentials'}), 401
 
+# 保存一轮对话（用户消息 + AI回复），返回AI回复的消息id
+def save_conversation(current_user, service_type, message, ai_reply):
+    user_message = ai_conversations.append(current_user, service_type, message, "user")
+    ai_message = ai_conversations.append(current_user, service_type, ai_reply, "ai")
+    conversation_search.add(current_user, service_type, user_message)
+    conversation_search.add(current_user, service_type, ai_message)
+    
+    conversation_context.record_turn(current_user, service_type,
+                                     ai_conversations.recent(current_user, service_type))
+    return ai_message["id"]
+
+# 游标分页返回对话历史：?limit=&before=<消息id> 向旧消息翻页，?after=<消息id> 向新消息翻页
+def conversation_history_response(current_user, service_type):
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
+    
+    messages, has_more = ai_conversations.page(current_user, service_type,
+                                               before=before, after=after, limit=limit)
+    
+    # next_cursor 沿请求方向继续翻页：after请求返回最后一条的id，否则返回第一条的id
+    next_cursor = None
+    if has_more and messages:
+        next_cursor = messages[-1]['id'] if after is not None else messages[0]['id']
+    
+    return jsonify({
+        'conversations': messages,
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+        'limit': limit
+    }), 200
+
+# 构建发送给LLM的历史上下文
+def get_conversation_context(current_user, service_type):
+    history = ai_conversations.recent(current_user, service_type, conversation_context.recent_messages)
+    return conversation_context.build_messages(current_user, service_type, history)
+
+# 客户端是否请求SSE流式回复（Accept: text/event-stream 或 ?stream=1）
+def wants_event_stream():
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def _sse_event(payload, event=None):
+    prefix = f'event: {event}\n' if event else ''
+    return f'{prefix}data: {json.dumps(payload, ensure_ascii=False)}\n\n'
+
+# 以SSE方式转发AI回复增量，结束后保存完整对话
+def stream_chat_response(current_user, message, service_type):
+    context = get_conversation_context(current_user, service_type)
+    
+    def generate():
+        parts = []
+        for delta in stream_external_ai_service(message, service_type, context):
+            parts.append(delta)
+            yield _sse_event({'delta': delta})
+        
+        ai_reply = ''.join(parts).strip()
+        conversation_id = save_conversation(current_user, service_type, message, ai_reply)
+        yield _sse_event({'reply': ai_reply, 'conversation_id': conversation_id}, event='done')
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 # AI健身教练对话接口
 @app.route('/api/ai/fitness/chat', methods=['POST'])
 @jwt_required()
@@ -237,46 +516,29 @@ def ai_fitness_chat():
     data = request.get_json()
     message = data.get('message', '')
     
-    # 调用外部AI服务
-    ai_reply = call_external_ai_service(message, "fitness_trainer")
+    if wants_event_stream():
+        return stream_chat_response(current_user, message, "fitness_trainer")
     
-    # 保存对话记录
-    if current_user not in ai_conversations:
-        ai_conversations[current_user] = {"fitness_trainer": []}
-    
-    conversation = ai_conversations[current_user]["fitness_trainer"]
-    user_message = {
-        "id": len(conversation) + 1,
-        "message": message,
-        "sender": "user",
-        "timestamp": datetime.now().isoformat()
-    }
-    ai_message = {
-        "id": len(conversation) + 2,
-        "message": ai_reply,
-        "sender": "ai",
-        "timestamp": datetime.now().isoformat()
-    }
+    # 调用外部AI服务（附带历史上下文）
+    context = get_conversation_context(current_user, "fitness_trainer")
+    ai_reply = call_external_ai_service(message, "fitness_trainer", context)
     
-    conversation.extend([user_message, ai_message])
+    # 保存对话记录
+    conversation_id = save_conversation(current_user, "fitness_trainer", message, ai_reply)
     
     return jsonify({
         'reply': ai_reply,
-        'conversation_id': len(conversation)
+        'conversation_id': conversation_id
     }), 200
 
 # 获取对话历史
 @app.route('/api/ai/fitness/history', methods=['GET'])
 @jwt_required()
+@conditional_get('conversations:fitness_trainer',
+                 lambda user: ai_conversations.version(user, 'fitness_trainer'))
 def get_fitness_conversation_history():
     current_user = get_jwt_identity()
-    
-    if current_user in ai_conversations and "fitness_trainer" in ai_conversations[current_user]:
-        return jsonify({
-            'conversations': ai_conversations[current_user]["fitness_trainer"]
-        }), 200
-    
-    return jsonify({'conversations': []}), 200
+    return conversation_history_response(current_user, "fitness_trainer")
 
 # AI营养师对话接口
 @app.route('/api/nutritionist/chat', methods=['POST'])
@@ -286,60 +548,82 @@ def ai_nutritionist_chat():
     data = request.get_json()
     message = data.get('message', '')
     
-    # 调用外部AI服务
-    ai_reply = call_external_ai_service(message, "nutritionist")
+    if wants_event_stream():
+        return stream_chat_response(current_user, message, "nutritionist")
     
-    # 保存对话记录
-    if current_user not in ai_conversations:
-        ai_conversations[current_user] = {"nutritionist": []}
-    
-    conversation = ai_conversations[current_user]["nutritionist"]
-    user_message = {
-        "id": len(conversation) + 1,
-        "message": message,
-        "sender": "user",
-        "timestamp": datetime.now().isoformat()
-    }
-    ai_message = {
-        "id": len(conversation) + 2,
-        "message": ai_reply,
-        "sender": "ai",
-        "timestamp": datetime.now().isoformat()
-    }
+    # 调用外部AI服务（附带历史上下文）
+    context = get_conversation_context(current_user, "nutritionist")
+    ai_reply = call_external_ai_service(message, "nutritionist", context)
     
-    conversation.extend([user_message, ai_message])
+    # 保存对话记录
+    conversation_id = save_conversation(current_user, "nutritionist", message, ai_reply)
     
     return jsonify({
         'reply': ai_reply,
-        'conversation_id': len(conversation)
+        'conversation_id': conversation_id
     }), 200
 
 # 获取营养师对话历史
 @app.route('/api/ai/chat/history', methods=['GET'])
 @jwt_required()
+@conditional_get('conversations:nutritionist',
+                 lambda user: ai_conversations.version(user, 'nutritionist'))
 def get_nutritionist_conversation_history():
     current_user = get_jwt_identity()
+    return conversation_history_response(current_user, "nutritionist")
+
+# 检索对话历史：?q=关键词&service_type=&limit=&offset=，管理员可通过 ?user= 检索其他用户
+@app.route('/api/ai/history/search', methods=['GET'])
+@jwt_required()
+def search_conversation_history():
+    current_user = get_jwt_identity()
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
     
-    if current_user in ai_conversations and "nutritionist" in ai_conversations[current_user]:
-        return jsonify({
-            'conversations': ai_conversations[current_user]["nutritionist"]
-        }), 200
+    service_type = request.args.get('service_type')
+    if service_type and service_type not in CONVERSATION_SERVICE_TYPES:
+        return jsonify({'error': f'Unknown service_type: {service_type}'}), 400
+    
+    target_user = request.args.get('user', current_user)
+    if target_user != current_user and current_user not in Config.ADMIN_USERS:
+        return jsonify({'error': 'Admin privileges required'}), 403
     
-    return jsonify({'conversations': []}), 200
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    hits, total = conversation_search.search(target_user, query, service_type=service_type,
+                                             limit=limit, offset=offset)
+    
+    return jsonify({
+        'query': query,
+        'results': hits,
+        'total': total,
+        'limit': limit,
+        'offset': offset
+    }), 200
+
+# /api/fitness/data 沿用早期的运动记录字段名（calories、date）
+def legacy_workout(workout):
+    return {
+        'id': workout['id'],
+        'type': workout['type'],
+        'duration': workout['duration'],
+        'calories': workout['calories_burned'],
+        'exercises': workout['exercises'],
+        'date': workout['workout_date']
+    }
 
 # 获取用户健身数据
 @app.route('/api/fitness/data', methods=['GET'])
 @jwt_required()
 def get_fitness_data():
     current_user = get_jwt_identity()
+    user_id = UserRepository.get_id(current_user)
     
-    if current_user in fitness_data:
-        return jsonify(fitness_data[current_user]), 200
-    
-    return jsonify({
-        'workouts': [],
-        'fitness_goals': []
-    }), 200
+    return json_response({
+        'workouts': [legacy_workout(w) for w in WorkoutRepository.all(user_id)],
+        'fitness_goals': GoalRepository.list(user_id)
+    })
 
 # 提交健身数据
 @app.route('/api/fitness/data', methods=['POST'])
@@ -348,31 +632,42 @@ def submit_fitness_data():
     current_user = get_jwt_identity()
     data = request.get_json()
     
-    if current_user not in fitness_data:
-        fitness_data[current_user] = {'workouts': [], 'fitness_goals': []}
+    user_id = UserRepository.get_id(current_user)
+    if user_id is None:
+        return jsonify({'error': 'User not found'}), 404
     
     # 处理不同类型的健身数据
-    if 'workout' in data:
-        workout = data['workout']
-        workout['id'] = len(fitness_data[current_user]['workouts']) + 1
-        workout['date'] = datetime.now().isoformat()
-        fitness_data[current_user]['workouts'].append(workout)
-    
-    if 'goal' in data:
-        goal = data['goal']
-        goal['id'] = len(fitness_data[current_user]['fitness_goals']) + 1
-        fitness_data[current_user]['fitness_goals'].append(goal)
+    try:
+        if 'workout' in data:
+            workout = data['workout']
+            WorkoutRepository.add(user_id, {
+                'type': workout.get('type', 'other'),
+                'duration': workout.get('duration', 0),
+                'calories_burned': workout.get('calories', workout.get('calories_burned', 0)),
+                'exercises': workout.get('exercises', []),
+                'notes': workout.get('notes', '')
+            })
+        
+        if 'goal' in data:
+            goal = data['goal']
+            GoalRepository.add(user_id, {**goal, 'type': goal.get('type', 'other'), 'target': goal.get('target', 0)})
+    except ValueError:
+        return jsonify({'error': 'Invalid date value'}), 400
+    finally:
+        # 运动记录与目标分别提交，任一写入后仪表盘缓存都需失效
+        dashboard_cache.invalidate(current_user)
     
     return jsonify({'message': 'Data submitted successfully'}), 201
 
 # 获取个性化训练计划
 @app.route('/api/fitness/training-plan', methods=['GET'])
 @jwt_required()
+@conditional_get('profile', UserRepository.version)
 def get_training_plan():
     current_user = get_jwt_identity()
     
     # 基于用户档案生成个性化训练计划
-    user_profile = users_db.get(current_user, {}).get('profile', {})
+    user_profile = UserRepository.profile(UserRepository.get(current_user))
     
     training_plan = {
         'weekly_schedule': [
@@ -404,6 +699,77 @@ def get_training_plan():
     
     return jsonify(training_plan), 200
 
+# AI回复缓存统计
+@app.route('/api/admin/ai/cache', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_reply_cache_stats():
+    return jsonify(reply_cache.stats()), 200
+
+# 清空AI回复缓存
+@app.route('/api/admin/ai/cache', methods=['DELETE'])
+@jwt_required()
+@admin_required
+def flush_reply_cache():
+    flushed = reply_cache.clear()
+    return jsonify({'message': 'Reply cache flushed', 'flushed': flushed}), 200
+
+# 仪表盘缓存统计
+@app.route('/api/admin/dashboard/cache', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_dashboard_cache_stats():
+    return jsonify(dashboard_cache.stats()), 200
+
+# 清空仪表盘缓存
+@app.route('/api/admin/dashboard/cache', methods=['DELETE'])
+@jwt_required()
+@admin_required
+def flush_dashboard_cache():
+    flushed = dashboard_cache.clear()
+    return jsonify({'message': 'Dashboard cache flushed', 'flushed': flushed}), 200
+
+# 对话存储内存占用
+@app.route('/api/admin/conversations/memory', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_conversation_memory_usage():
+    return jsonify(ai_conversations.memory_usage()), 200
+
+# 对话写入器状态
+@app.route('/api/admin/conversations/writer', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_conversation_writer_stats():
+    if conversation_writer is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify({'enabled': True, **conversation_writer.stats()}), 200
+
+# 对话检索索引状态
+@app.route('/api/admin/conversations/search', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_conversation_search_stats():
+    return jsonify(conversation_search.stats()), 200
+
+# 请求合并统计
+@app.route('/api/admin/ai/singleflight', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_singleflight_stats():
+    return jsonify(ai_singleflight.stats()), 200
+
+# AI上游熔断器状态
+@app.route('/api/ai/breaker', methods=['GET'])
+@jwt_required()
+def get_ai_breaker_state():
+    return jsonify(ai_breaker.snapshot()), 200
+
+# Prometheus指标
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(REGISTRY.render(), content_type=REGISTRY.CONTENT_TYPE)
+
 # 健康检查端点
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -0,0 +1,280 @@
+"""
+AI对话接口的异步(ASGI)服务入口
+/api/ai/fitness/chat、/api/nutritionist/chat、/api/ai/chat 在事件循环中处理，等待上游时不占用线程；
+其余路由原样转交Flask应用（WSGI）处理。
+
+运行方式: uvicorn asgi_app:application --host 0.0.0.0 --port 5000
+"""
+
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import decode_token
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from ai_async_client import close_async_client, post_json
+from app import (
+    app as flask_app, CORS_ORIGINS, SYSTEM_PROMPT_VERSION, ai_breaker, ai_singleflight, reply_cache,
+    build_chat_request, fallback_reply, get_conversation_context, is_ai_service_configured,
+    record_upstream_failure, record_upstream_success, save_conversation, _sse_event
+)
+from metrics import (
+    AI_UPSTREAM_TTFT, FALLBACK_BREAKER_OPEN, FALLBACK_EXCEPTION, FALLBACK_HTTP_ERROR, FALLBACK_NO_KEY
+)
+from reply_cache import ReplyCache
+from routes.fitness_routes import fitness_service, load_user_context
+
+
+async def call_external_ai_service_async(message, service_type="nutritionist", context=None):
+    """异步调用外部AI服务获取回复（与 call_external_ai_service 行为一致）"""
+
+    if not is_ai_service_configured():
+        return fallback_reply(message, service_type, FALLBACK_NO_KEY)
+
+    cache_key = ReplyCache.make_key(service_type, SYSTEM_PROMPT_VERSION, message, context)
+    cached_reply = reply_cache.get(cache_key)
+    if cached_reply is not None:
+        return cached_reply
+
+    return await ai_singleflight.do_async(
+        cache_key, lambda: _fetch_ai_reply_async(message, service_type, cache_key, context)
+    )
+
+
+async def _fetch_ai_reply_async(message, service_type, cache_key, context=None):
+    """实际访问上游获取回复，失败时返回模拟回复"""
+
+    if not ai_breaker.allow_request():
+        return fallback_reply(message, service_type, FALLBACK_BREAKER_OPEN)
+
+    started = time.monotonic()
+    try:
+        url, headers, data = build_chat_request(message, service_type, context=context)
+        response = await post_json(url, headers, data)
+
+        if response.status_code == 200:
+            result = response.json()
+            ai_reply = result['choices'][0]['message']['content'].strip()
+            record_upstream_success(service_type, started, result.get('usage'))
+            reply_cache.set(cache_key, ai_reply)
+            return ai_reply
+        else:
+            record_upstream_failure(service_type, started, FALLBACK_HTTP_ERROR)
+            print(f"AI服务调用失败: {response.status_code} - {response.text}")
+            return fallback_reply(message, service_type, FALLBACK_HTTP_ERROR)
+
+    except Exception as e:
+        record_upstream_failure(service_type, started, FALLBACK_EXCEPTION)
+        print(f"AI服务调用异常: {e}")
+        return fallback_reply(message, service_type, FALLBACK_EXCEPTION)
+
+
+async def stream_external_ai_service_async(message, service_type="nutritionist", context=None):
+    """异步流式调用外部AI服务，逐段产出回复文本（与 stream_external_ai_service 行为一致）"""
+
+    if not is_ai_service_configured():
+        yield fallback_reply(message, service_type, FALLBACK_NO_KEY)
+        return
+
+    cache_key = ReplyCache.make_key(service_type, SYSTEM_PROMPT_VERSION, message, context)
+    cached_reply = reply_cache.get(cache_key)
+    if cached_reply is not None:
+        yield cached_reply
+        return
+
+    if not ai_breaker.allow_request():
+        yield fallback_reply(message, service_type, FALLBACK_BREAKER_OPEN)
+        return
+
+    emitted = False
+    recorded = False
+    parts = []
+    usage = None
+    started = time.monotonic()
+    try:
+        url, headers, data = build_chat_request(message, service_type, stream=True, context=context)
+        response = await post_json(url, headers, data, stream=True)
+
+        try:
+            if response.status_code != 200:
+                body = await response.aread()
+                record_upstream_failure(service_type, started, FALLBACK_HTTP_ERROR)
+                recorded = True
+                print(f"AI服务调用失败: {response.status_code} - {body.decode('utf-8', 'replace')}")
+                yield fallback_reply(message, service_type, FALLBACK_HTTP_ERROR)
+                return
+
+            async for line in response.aiter_lines():
+                if not line or not line.startswith('data:'):
+                    continue
+                chunk = line[5:].strip()
+                if chunk == '[DONE]':
+                    record_upstream_success(service_type, started, usage)
+                    recorded = True
+                    reply_cache.set(cache_key, ''.join(parts).strip())
+                    break
+                payload = json.loads(chunk)
+                usage = payload.get('usage') or usage
+                choices = payload.get('choices') or []
+                delta = choices[0].get('delta', {}).get('content') if choices else None
+                if delta:
+                    if not emitted:
+                        AI_UPSTREAM_TTFT.observe(time.monotonic() - started, service_type=service_type)
+                    emitted = True
+                    parts.append(delta)
+                    yield delta
+        finally:
+            await response.aclose()
+
+    except Exception as e:
+        record_upstream_failure(service_type, started, FALLBACK_EXCEPTION)
+        recorded = True
+        print(f"AI服务流式调用异常: {e}")
+        if not emitted:
+            yield fallback_reply(message, service_type, FALLBACK_EXCEPTION)
+    finally:
+        if not recorded:
+            ai_breaker.release()
+
+
+def _cors_headers(request):
+    """与Flask-CORS配置一致的跨域响应头（预检请求仍由Flask处理）"""
+    origin = request.headers.get('origin')
+    if origin and origin in CORS_ORIGINS:
+        return {
+            'Access-Control-Allow-Origin': origin,
+            'Access-Control-Allow-Credentials': 'true',
+            'Vary': 'Origin'
+        }
+    return {}
+
+
+def _current_user(request):
+    """从Authorization头解析JWT身份，无效时返回None"""
+    auth = request.headers.get('authorization', '')
+    if not auth.startswith('Bearer '):
+        return None
+    try:
+        with flask_app.app_context():
+            claims = decode_token(auth[7:])
+        return claims[flask_app.config.get('JWT_IDENTITY_CLAIM', 'sub')]
+    except Exception:
+        return None
+
+
+def _load_user_context(username):
+    """在Flask应用上下文中读取用户上下文（数据库访问为同步调用，需在线程池中执行）"""
+    with flask_app.app_context():
+        return load_user_context(username)
+
+
+def _wants_event_stream(request):
+    if request.query_params.get('stream', '').lower() in ('1', 'true'):
+        return True
+    return 'text/event-stream' in request.headers.get('accept', '')
+
+
+async def _read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def _unauthorized(request):
+    return JSONResponse({'msg': 'Missing or invalid Authorization Header'}, status_code=401,
+                        headers=_cors_headers(request))
+
+
+async def _stream_chat_response(request, current_user, message, service_type):
+    """以SSE方式转发AI回复增量，结束后保存完整对话"""
+    context = await run_in_threadpool(get_conversation_context, current_user, service_type)
+
+    async def generate():
+        parts = []
+        async for delta in stream_external_ai_service_async(message, service_type, context):
+            parts.append(delta)
+            yield _sse_event({'delta': delta})
+
+        ai_reply = ''.join(parts).strip()
+        conversation_id = await run_in_threadpool(save_conversation, current_user, service_type, message, ai_reply)
+        yield _sse_event({'reply': ai_reply, 'conversation_id': conversation_id}, event='done')
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', **_cors_headers(request)}
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=headers)
+
+
+async def _llm_chat(request, service_type):
+    current_user = _current_user(request)
+    if current_user is None:
+        return _unauthorized(request)
+
+    data = await _read_json(request) or {}
+    message = data.get('message', '')
+
+    if _wants_event_stream(request):
+        return await _stream_chat_response(request, current_user, message, service_type)
+
+    # 对话历史的读取和保存可能访问数据库/SQLite，放到线程池中执行，不阻塞事件循环
+    context = await run_in_threadpool(get_conversation_context, current_user, service_type)
+    ai_reply = await call_external_ai_service_async(message, service_type, context)
+    conversation_id = await run_in_threadpool(save_conversation, current_user, service_type, message, ai_reply)
+
+    return JSONResponse({
+        'reply': ai_reply,
+        'conversation_id': conversation_id
+    }, headers=_cors_headers(request))
+
+
+async def ai_fitness_chat(request):
+    """AI健身教练对话接口（异步）"""
+    return await _llm_chat(request, "fitness_trainer")
+
+
+async def ai_nutritionist_chat(request):
+    """AI营养师对话接口（异步）"""
+    return await _llm_chat(request, "nutritionist")
+
+
+async def ai_chat(request):
+    """AI健身教练关键词对话接口（异步，与 fitness_bp 的 /ai/chat 行为一致）"""
+    current_user = _current_user(request)
+    if current_user is None:
+        return _unauthorized(request)
+
+    data = await _read_json(request)
+    if not data or 'message' not in data:
+        return JSONResponse({'error': 'Message is required'}, status_code=400,
+                            headers=_cors_headers(request))
+
+    user_context = await run_in_threadpool(_load_user_context, current_user)
+    ai_response = fitness_service.generate_ai_response(data['message'], user_context)
+
+    return JSONResponse({
+        'reply': ai_response,
+        'timestamp': datetime.now().isoformat()
+    }, headers=_cors_headers(request))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await close_async_client()
+
+
+application = Starlette(
+    routes=[
+        Route('/api/ai/fitness/chat', ai_fitness_chat, methods=['POST']),
+        Route('/api/nutritionist/chat', ai_nutritionist_chat, methods=['POST']),
+        Route('/api/ai/chat', ai_chat, methods=['POST']),
+        # 其余请求（包括上述路径的CORS预检）交给Flask
+        Mount('/', app=WsgiToAsgi(flask_app))
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,302 @@
+"""
+运动记录、健康数据的批量导入
+从请求体流式读取 NDJSON 或 CSV，逐行校验，按批计算卡路里并以多行INSERT写入，
+任何时刻内存中只保留一个批次；每行的校验错误单独报告（条数有上限）。
+"""
+
+import codecs
+import csv
+import json
+import math
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from health_metrics import record_samples, samples_from_health_data
+from models import db, utcnow, FitnessWorkout, HealthData
+from repositories import FitnessAggregateRepository
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_CSV = 'csv'
+
+_NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json-lines')
+_CSV_MIMETYPES = ('text/csv', 'application/csv')
+
+
+class RowError(ValueError):
+    """单行数据校验失败"""
+
+
+def detect_format(mimetype, requested=None) -> Optional[str]:
+    """根据 ?format= 或 Content-Type 确定上传格式"""
+    if requested in (FORMAT_NDJSON, FORMAT_CSV):
+        return requested
+    if mimetype in _NDJSON_MIMETYPES:
+        return FORMAT_NDJSON
+    if mimetype in _CSV_MIMETYPES:
+        return FORMAT_CSV
+    return None
+
+
+def iter_lines(stream, chunk_size=64 * 1024) -> Iterator[str]:
+    """按块读取字节流并逐行产出文本（保留换行符，兼容带BOM的UTF-8）"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        pending += decoder.decode(chunk)
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def iter_records(stream, fmt) -> Iterator[Tuple[int, object]]:
+    """产出 (行号, 记录)；无法解析的行产出 (行号, RowError)"""
+    lines = iter_lines(stream)
+    if fmt == FORMAT_CSV:
+        reader = csv.DictReader(lines)
+        for row in reader:
+            # 多出的列会被放在键None下
+            if None in row:
+                yield reader.line_num, RowError('too many columns')
+            else:
+                yield reader.line_num, row
+        return
+
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, RowError(f'invalid JSON: {e}')
+            continue
+        if not isinstance(record, dict):
+            yield line_no, RowError('each line must be a JSON object')
+        else:
+            yield line_no, record
+
+
+def _required(record, field):
+    value = record.get(field)
+    if value is None or value == '':
+        raise RowError(f'{field} is required')
+    return value
+
+
+def _number(record, field, cast=float, required=False, minimum=0):
+    value = _required(record, field) if required else record.get(field)
+    if value is None or value == '':
+        return None
+    try:
+        value = cast(value)
+        # NaN/Infinity（JSON与float()都接受）无法写入整数列，也会污染汇总
+        finite = math.isfinite(value)
+    except (TypeError, ValueError, OverflowError):
+        raise RowError(f'{field} must be a number')
+    if not finite:
+        raise RowError(f'{field} must be a finite number')
+    if value < minimum:
+        raise RowError(f'{field} must be >= {minimum}')
+    return value
+
+
+def _datetime(record, field, required=False):
+    value = _required(record, field) if required else record.get(field)
+    if value is None or value == '':
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise RowError(f'{field} must be an ISO 8601 date/time')
+
+
+class BulkImporter:
+    """批量导入的公共流程：解析 -> 校验 -> 攒批 -> 写入"""
+
+    table = None
+
+    def __init__(self, user_id, batch_size=1000, max_errors=100):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+        self.errors_dropped = 0
+
+    def validate(self, record) -> Dict:
+        """把一条原始记录转换为待插入的行，失败时抛出 RowError"""
+        raise NotImplementedError
+
+    def prepare(self, rows: List[Dict]):
+        """写入前对整批数据的处理（如批量计算卡路里），须可对同一行重复执行"""
+
+    def after_insert(self, rows: List[Dict]):
+        """与本批数据在同一事务内执行的后续更新（如运动汇总）"""
+
+    def run(self, stream, fmt) -> Dict:
+        batch, lines = [], []
+        for line_no, record in iter_records(stream, fmt):
+            if isinstance(record, RowError):
+                self._error(line_no, record)
+                continue
+            try:
+                batch.append(self.validate(record))
+                lines.append(line_no)
+            except RowError as e:
+                self._error(line_no, e)
+                continue
+            if len(batch) >= self.batch_size:
+                self._flush(batch, lines)
+                batch, lines = [], []
+        self._flush(batch, lines)
+        return self.report()
+
+    def _flush(self, rows, lines):
+        rows, lines = self._prepare(rows, lines)
+        if not rows:
+            return
+        try:
+            db.session.execute(self.table.insert(), rows)
+            self.after_insert(rows)
+            db.session.commit()
+            self.imported += len(rows)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            self.failed += len(rows)
+            self._record_error({'lines': [lines[0], lines[-1]],
+                                'error': f'batch insert failed: {e.__class__.__name__}'})
+
+    def _prepare(self, rows, lines):
+        """整批预处理失败时改为逐行处理，出错的行单独报告，不影响同批的其他行"""
+        if not rows:
+            return rows, lines
+        try:
+            self.prepare(rows)
+            return rows, lines
+        except (ValueError, TypeError, ArithmeticError):
+            pass
+        prepared, prepared_lines = [], []
+        for row, line_no in zip(rows, lines):
+            try:
+                self.prepare([row])
+            except (ValueError, TypeError, ArithmeticError) as e:
+                self._error(line_no, e)
+                continue
+            prepared.append(row)
+            prepared_lines.append(line_no)
+        return prepared, prepared_lines
+
+    def _error(self, line_no, error):
+        self.failed += 1
+        self._record_error({'line': line_no, 'error': str(error)})
+
+    def _record_error(self, entry):
+        if len(self.errors) < self.max_errors:
+            self.errors.append(entry)
+        else:
+            self.errors_dropped += 1
+
+    def report(self) -> Dict:
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.errors_dropped > 0
+        }
+
+
+class WorkoutImporter(BulkImporter):
+    """运动记录导入，字段与 POST /api/workouts 相同；CSV中 exercises 以 ; 分隔"""
+
+    table = FitnessWorkout.__table__
+
+    def __init__(self, user_id, fitness_service, user_weight=70, **kwargs):
+        super().__init__(user_id, **kwargs)
+        self.fitness_service = fitness_service
+        self.user_weight = user_weight
+        self.created_at = utcnow()
+
+    def validate(self, record):
+        exercises = record.get('exercises') or []
+        if isinstance(exercises, str):
+            exercises = [e.strip() for e in exercises.split(';') if e.strip()]
+        elif not isinstance(exercises, list):
+            raise RowError('exercises must be a list')
+
+        return {
+            'user_id': self.user_id,
+            'workout_type': str(_required(record, 'type')),
+            'duration': _number(record, 'duration', int, required=True),
+            'calories_burned': _number(record, 'calories_burned'),
+            'exercises': exercises,
+            'notes': record.get('notes') or '',
+            'workout_date': _datetime(record, 'workout_date') or self.created_at,
+            'created_at': self.created_at
+        }
+
+    def prepare(self, rows):
+        # 未提供卡路里的行一次性批量计算（与单条添加一致：优先使用第一个运动项目）
+        missing = [row for row in rows if not row['calories_burned']]
+        if missing:
+            calories = self.fitness_service.calculate_calories_burned_batch([
+                (row['exercises'][0] if row['exercises'] else row['workout_type'], row['duration'], self.user_weight)
+                for row in missing
+            ])
+            for row, value in zip(missing, calories):
+                row['calories_burned'] = value
+        for row in rows:
+            if not isinstance(row['exercises'], str):
+                row['exercises'] = json.dumps(row['exercises'], ensure_ascii=False)
+            row['calories_burned'] = int(round(row['calories_burned']))
+
+    def after_insert(self, rows):
+        FitnessAggregateRepository.apply(
+            self.user_id, workouts=len(rows),
+            calories=sum(row['calories_burned'] for row in rows),
+            duration=sum(row['duration'] for row in rows)
+        )
+
+
+class HealthDataImporter(BulkImporter):
+    """健康数据导入，字段：data_type、value（数值、JSON或文本）、recorded_at
+
+    data_type 为已知健康指标且 value 为数值的行同时写入时序存储（见 health_metrics）。
+    """
+
+    table = HealthData.__table__
+
+    def __init__(self, user_id, **kwargs):
+        super().__init__(user_id, **kwargs)
+        self.created_at = utcnow()
+
+    def validate(self, record):
+        value = _required(record, 'value')
+        if isinstance(value, str):
+            # CSV中的数值/JSON按原样保存，其余文本存为JSON字符串
+            try:
+                json.loads(value)
+            except ValueError:
+                value = json.dumps(value, ensure_ascii=False)
+        else:
+            value = json.dumps(value, ensure_ascii=False)
+
+        return {
+            'user_id': self.user_id,
+            'data_type': str(_required(record, 'data_type')),
+            'value': value,
+            'recorded_at': _datetime(record, 'recorded_at', required=True),
+            'created_at': self.created_at
+        }
+
+    def after_insert(self, rows):
+        record_samples(self.user_id, samples_from_health_data(rows), commit=False)
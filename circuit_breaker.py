@@ -0,0 +1,140 @@
+"""
+熔断器
+基于滚动时间窗口内的失败率和慢调用率在 closed / open / half_open 三种状态间切换
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class CircuitBreaker:
+    """线程安全的熔断器"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_rate_threshold=0.5, slow_call_seconds=10.0,
+                 slow_call_rate_threshold=0.8, window_seconds=60, minimum_calls=10,
+                 open_seconds=30, half_open_max_calls=1):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.window_seconds = window_seconds
+        self.minimum_calls = minimum_calls
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._calls = deque()  # (时间戳, 是否失败, 是否慢调用)
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            return self._state
+
+    def _refresh_state(self, now):
+        """open状态超过冷却时间后进入half_open"""
+        if self._state == self.OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._half_open_in_flight = 0
+
+    def _prune(self, now):
+        cutoff = now - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            self._calls.popleft()
+
+    def _trip(self, now):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._half_open_in_flight = 0
+        self._calls.clear()
+
+    def allow_request(self):
+        """是否允许本次调用访问上游；返回True时调用方必须随后记录结果或调用release()"""
+        with self._lock:
+            now = time.monotonic()
+            self._refresh_state(now)
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def release(self):
+        """调用未产生有效结果（例如客户端中途断开）时释放half_open探测名额"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_in_flight > 0:
+                self._half_open_in_flight -= 1
+
+    def record_success(self, latency):
+        """记录一次成功调用及其耗时（秒）"""
+        self._record(False, latency)
+
+    def record_failure(self, latency=None):
+        """记录一次失败调用"""
+        self._record(True, latency)
+
+    def _record(self, failed, latency):
+        slow = latency is not None and latency >= self.slow_call_seconds
+        with self._lock:
+            now = time.monotonic()
+            self._refresh_state(now)
+
+            if self._state == self.HALF_OPEN:
+                if failed or slow:
+                    self._trip(now)
+                else:
+                    self._half_open_in_flight = max(self._half_open_in_flight - 1, 0)
+                    if self._half_open_in_flight == 0:
+                        self._state = self.CLOSED
+                        self._calls.clear()
+                return
+
+            if self._state == self.OPEN:
+                return
+
+            self._calls.append((now, failed, slow))
+            self._prune(now)
+            total = len(self._calls)
+            if total < self.minimum_calls:
+                return
+            failures = sum(1 for _, f, _ in self._calls if f)
+            slow_calls = sum(1 for _, _, s in self._calls if s)
+            if (failures / total >= self.failure_rate_threshold or
+                    slow_calls / total >= self.slow_call_rate_threshold):
+                self._trip(now)
+
+    def snapshot(self):
+        """熔断器当前状态及窗口统计"""
+        with self._lock:
+            now = time.monotonic()
+            self._refresh_state(now)
+            self._prune(now)
+            total = len(self._calls)
+            failures = sum(1 for _, f, _ in self._calls if f)
+            slow_calls = sum(1 for _, _, s in self._calls if s)
+            retry_in = 0.0
+            if self._state == self.OPEN:
+                retry_in = max(self.open_seconds - (now - self._opened_at), 0.0)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'window_seconds': self.window_seconds,
+                'window_calls': total,
+                'window_failures': failures,
+                'window_slow_calls': slow_calls,
+                'failure_rate': round(failures / total, 4) if total else 0.0,
+                'slow_call_rate': round(slow_calls / total, 4) if total else 0.0,
+                'rejected_calls': self._rejected,
+                'retry_in_seconds': round(retry_in, 1)
+            }
@@ -0,0 +1,164 @@
+"""
+响应压缩
+按 Accept-Encoding 协商 br / gzip：JSON等动态响应在 after_request 中压缩（低于阈值、流式响应除外），
+前端静态文件（html/js/css）在启动时一次性读入并预先生成压缩版本，请求时直接返回对应版本。
+brotli 为可选依赖，未安装时只提供 gzip。
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional
+
+from flask import Response, request
+
+from config import Config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODING_BROTLI = 'br'
+ENCODING_GZIP = 'gzip'
+
+# 服务端偏好顺序
+SUPPORTED_ENCODINGS = (ENCODING_BROTLI, ENCODING_GZIP) if brotli else (ENCODING_GZIP,)
+
+# 值得压缩的内容类型
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'application/x-ndjson',
+    'text/html', 'text/css', 'text/javascript', 'text/plain', 'text/csv', 'image/svg+xml'
+}
+
+# 启动时预压缩的静态文件类型
+STATIC_EXTENSIONS = ('.html', '.js', '.css')
+
+
+def parse_accept_encoding(header) -> Dict[str, float]:
+    """解析 Accept-Encoding：编码 -> q值"""
+    accepted = {}
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def negotiate(header, available=SUPPORTED_ENCODINGS) -> Optional[str]:
+    """选出客户端接受且q值最高的编码，同分时按服务端偏好，不压缩时返回None"""
+    accepted = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data: bytes, encoding, level=None) -> bytes:
+    """按编码压缩；level 为None时使用配置的动态压缩级别"""
+    if encoding == ENCODING_BROTLI:
+        quality = Config.COMPRESSION_BROTLI_QUALITY if level is None else level
+        return brotli.compress(data, quality=quality)
+    return gzip.compress(data, compresslevel=Config.COMPRESSION_LEVEL if level is None else level)
+
+
+def _vary(response):
+    response.vary.add('Accept-Encoding')
+
+
+def compress_response(response):
+    """after_request：压缩可压缩的非流式响应"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    _vary(response)
+    data = response.get_data()
+    if len(data) < Config.COMPRESSION_MIN_SIZE:
+        return response
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # 压缩后是另一种表示，强ETag需区分编码（conditional_get 会识别该后缀）
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+    return response
+
+
+class StaticAsset:
+    """一个静态文件及其预压缩版本"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = hashlib.sha1(self.data).hexdigest()[:16]
+        self.variants = {}
+        for encoding in SUPPORTED_ENCODINGS:
+            # 只做一次，使用最高压缩级别
+            level = 11 if encoding == ENCODING_BROTLI else 9
+            compressed = compress(self.data, encoding, level)
+            if len(compressed) < len(self.data):
+                self.variants[encoding] = compressed
+
+    def response(self):
+        encoding = negotiate(request.headers.get('Accept-Encoding'), tuple(self.variants))
+        etag = f'{self.etag}-{encoding}' if encoding else self.etag
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(self.variants[encoding] if encoding else self.data, mimetype=self.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        _vary(response)
+        return response
+
+
+def load_static_assets(directory) -> Dict[str, StaticAsset]:
+    """读取目录下（不含子目录）的前端静态文件"""
+    assets = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith(STATIC_EXTENSIONS) and os.path.isfile(path):
+            assets[name] = StaticAsset(path)
+    return assets
+
+
+def init_compression(app, static_dir=None):
+    """注册响应压缩，并以预压缩版本提供 static_dir 下的静态文件（/ 对应 index.html）"""
+    app.after_request(compress_response)
+    if not static_dir:
+        return {}
+
+    assets = load_static_assets(static_dir)
+
+    def static_asset(filename):
+        return assets[filename].response()
+
+    for name in assets:
+        app.add_url_rule(f'/{name}', 'static_asset', static_asset, defaults={'filename': name})
+    if 'index.html' in assets:
+        # 与上面的规则共用端点时，Werkzeug 会把 / 重定向到 /index.html，因此使用单独的端点
+        app.add_url_rule('/', 'static_index', lambda: assets['index.html'].response())
+    return assets
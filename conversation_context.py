@@ -0,0 +1,170 @@
+"""
+LLM对话上下文构建
+在固定token预算内放入最近的若干轮对话，更早的对话增量折叠进每个用户、每种服务的滚动摘要
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+# 中日韩字符按1个token估算，其余文本按约4个字符1个token估算
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+# 句末标点（用于截取AI回复的第一句）
+_SENTENCE_END_RE = re.compile(r'[。！？!?；;]|\.(?=\s)')
+
+# 每条消息的角色等固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_PREFIX = '以下是与该用户此前对话的摘要：\n'
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本token数（不依赖具体模型的分词器）"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+class _SummaryState:
+    """单个用户、单种服务的摘要状态"""
+
+    def __init__(self):
+        self.lines = []          # 摘要条目（按时间顺序）
+        self.tokens = 0
+        self.summarized_upto = 0  # 已折叠进摘要的最大消息id
+        self.omitted = 0         # 因超出摘要预算被丢弃的条目数
+
+
+class ConversationContext:
+    """按token预算组装对话上下文
+
+    摘要状态按 (用户, 服务) 以LRU方式保留最多 max_states 个；被淘汰的摘要在该对话下一次保存时
+    从最近的历史重新开始折叠。摘要每条对应一条消息：用户消息保留开头，AI回复只保留第一句，
+    连续重复的条目合并，超出 summary_max_tokens 时丢弃最早的条目并注明省略的条数。
+    """
+
+    def __init__(self, token_budget=1200, recent_messages=10, summary_max_tokens=300,
+                 snippet_chars=60, max_states=10000):
+        self.token_budget = token_budget
+        self.recent_messages = recent_messages
+        self.summary_max_tokens = summary_max_tokens
+        self.snippet_chars = snippet_chars
+        self.max_states = max(max_states, 1)
+        self._states: Dict[tuple, _SummaryState] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.token_budget > 0
+
+    def get_summary(self, user, service_type) -> str:
+        with self._lock:
+            key = (user, service_type)
+            state = self._states.get(key)
+            if state is None:
+                return ''
+            self._states.move_to_end(key)
+            lines = state.lines
+            if state.omitted:
+                lines = [f'（更早的{state.omitted}条消息已省略）'] + lines
+            return '\n'.join(lines)
+
+    def build_messages(self, user, service_type, history: List[Dict]) -> List[Dict]:
+        """返回插入在系统提示词与当前消息之间的上下文消息（不含当前消息）
+
+        history 为按时间排序的历史消息，只会读取末尾 recent_messages 条。
+        返回的各条消息（含固定开销）估算token数之和不超过 token_budget；摘要放不下时不带摘要。
+        """
+        if not self.enabled:
+            return []
+
+        remaining = self.token_budget
+        summary_message = None
+        summary = self.get_summary(user, service_type)
+        if summary:
+            content = SUMMARY_PREFIX + summary
+            cost = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+            if cost <= remaining:
+                remaining -= cost
+                summary_message = {'role': 'system', 'content': content}
+
+        # 从最新一条往前装入，直到预算用完
+        packed = []
+        for item in reversed(history[-self.recent_messages:]):
+            content = item.get('message', '')
+            cost = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+            if cost > remaining:
+                break
+            remaining -= cost
+            role = 'user' if item.get('sender') == 'user' else 'assistant'
+            packed.append({'role': role, 'content': content})
+        packed.reverse()
+
+        if summary_message:
+            packed.insert(0, summary_message)
+        return packed
+
+    def record_turn(self, user, service_type, history: List[Dict]):
+        """一轮对话保存后调用：把滑出最近窗口的消息折叠进摘要
+
+        只向前扫描到上次折叠的位置，每轮的开销与新增消息数成正比。
+        """
+        if not self.enabled or len(history) <= self.recent_messages:
+            return
+
+        with self._lock:
+            key = (user, service_type)
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = _SummaryState()
+                while len(self._states) > self.max_states:
+                    self._states.popitem(last=False)
+            self._states.move_to_end(key)
+            outside = history[:-self.recent_messages]
+            new_items = []
+            for item in reversed(outside):
+                if item.get('id', 0) <= state.summarized_upto:
+                    break
+                new_items.append(item)
+            if not new_items:
+                return
+
+            for item in reversed(new_items):
+                line = self._summarize_message(item)
+                # 连续重复的消息（如重复提问）只记一次
+                if not line or (state.lines and state.lines[-1] == line):
+                    continue
+                state.lines.append(line)
+                state.tokens += estimate_tokens(line)
+            state.summarized_upto = new_items[0].get('id', state.summarized_upto)
+
+            # 超出摘要预算时丢弃最早的条目
+            while state.lines and state.tokens > self.summary_max_tokens:
+                state.tokens -= estimate_tokens(state.lines.pop(0))
+                state.omitted += 1
+
+    def _summarize_message(self, item: Dict) -> str:
+        text = ' '.join((item.get('message') or '').split())
+        if not text:
+            return ''
+        is_user = item.get('sender') == 'user'
+        if not is_user:
+            # AI回复通常先给结论，只保留第一句
+            match = _SENTENCE_END_RE.search(text)
+            if match:
+                text = text[:match.end()].strip()
+        if len(text) > self.snippet_chars:
+            text = text[:self.snippet_chars] + '…'
+        speaker = '用户' if is_user else '助手'
+        return f'- {speaker}: {text}'
+
+    def clear(self, user=None):
+        """清除摘要状态（不指定用户时全部清除）"""
+        with self._lock:
+            if user is None:
+                self._states.clear()
+            else:
+                for key in [k for k in self._states if k[0] == user]:
+                    del self._states[key]
@@ -0,0 +1,333 @@
+"""
+AI对话持久化
+ConversationWriter 在后台线程中把对话消息批量写入 ai_conversations 表（write-behind），
+请求路径只负责入队；DatabaseSpillStorage 作为 ConversationStore 的持久化存储，从该表读取较早的消息，
+并合并写入器中尚未写入的消息，读取结果不会因写入延迟出现缺口。
+"""
+
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from operator import itemgetter
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DataError, IntegrityError
+
+from models import db, AIConversation, AIConversationSequence, User
+
+
+class UserIdResolver:
+    """用户名到 users.id 的映射（带进程内缓存）"""
+
+    def __init__(self, app):
+        self.app = app
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def resolve_many(self, usernames) -> Dict[str, int]:
+        """批量解析用户名，不存在的用户不出现在结果中"""
+        with self._lock:
+            result = {name: self._cache[name] for name in usernames if name in self._cache}
+        missing = [name for name in set(usernames) if name not in result]
+        if missing:
+            with self.app.app_context(), db.engine.connect() as connection:
+                rows = connection.execute(
+                    select(User.id, User.username).where(User.username.in_(missing))
+                ).all()
+            with self._lock:
+                for user_id, username in rows:
+                    self._cache[username] = user_id
+                    result[username] = user_id
+        return result
+
+    def resolve(self, username):
+        return self.resolve_many([username]).get(username)
+
+
+class ConversationWriter:
+    """对话消息的后台批量写入器
+
+    队列中的消息达到 batch_size 条或距上次写入超过 flush_interval 秒时，
+    以一次多行INSERT写入。整批写入失败时逐条重试：违反约束等数据错误的消息转入死信，
+    其余错误（如数据库不可用）时保留剩余消息，在下一轮重试。
+    从入队到写入成功（或丢弃、转入死信）之前，消息可通过 unflushed() 读取。
+    """
+
+    _STOP = object()
+
+    def __init__(self, app, resolver, batch_size=200, flush_interval=1.0, max_queue=50000, max_dead_letters=1000):
+        self.app = app
+        self.resolver = resolver
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = []  # 写入失败待重试的消息 (用户名, 服务类型, 消息)
+        self._unflushed = {}  # (用户名, 服务类型) -> {消息id: 消息}，已入队但尚未写入的消息
+        # 无法写入的消息（保留最近的若干条供排查）
+        self.dead_letters = deque(maxlen=max_dead_letters)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.failed_flushes = 0
+
+    def start(self):
+        """启动后台写入线程"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='conversation-writer', daemon=True)
+                self._thread.start()
+
+    def enqueue(self, username, ai_type, entry):
+        """把一条消息放入写入队列；队列已满时丢弃并计数，从不阻塞请求"""
+        item = (username, ai_type, entry)
+        # 先登记再入队，写入线程写完后总能找到并移除
+        with self._lock:
+            self._unflushed.setdefault((username, ai_type), {})[entry['id']] = entry
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self._forget([item])
+
+    def unflushed(self, username, ai_type) -> List[Dict]:
+        """已入队但尚未写入的消息（按id升序）"""
+        with self._lock:
+            entries = list(self._unflushed.get((username, ai_type), {}).values())
+        return sorted(entries, key=itemgetter('id'))
+
+    def stop(self, timeout=10.0):
+        """停止写入线程，退出前写完队列中剩余的消息"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._queue.put(self._STOP)
+        thread.join(timeout)
+
+    def _forget(self, items):
+        """（持有 _lock 时调用）移除已写入或已放弃的消息"""
+        for username, ai_type, entry in items:
+            entries = self._unflushed.get((username, ai_type))
+            if entries is None:
+                continue
+            entries.pop(entry['id'], None)
+            if not entries:
+                del self._unflushed[(username, ai_type)]
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                timeout = max(deadline - time.monotonic(), 0)
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is self._STOP:
+                    self._flush(batch)
+                    return
+                if item is not None:
+                    batch.append(item)
+
+                if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                    self._flush(batch)
+                    batch = []
+                    deadline = time.monotonic() + self.flush_interval
+            except Exception as e:
+                # 写入线程不能因意外错误退出，否则之后的消息都不会再写入
+                print(f"对话记录写入线程异常: {e}")
+                traceback.print_exc()
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch):
+        with self._lock:
+            items = self._pending + batch
+            self._pending = []
+        if not items:
+            return
+        try:
+            self._write(items)
+        except Exception as e:
+            with self._lock:
+                self.failed_flushes += 1
+            print(f"对话记录批量写入失败（{len(items)}条），改为逐条写入: {e}")
+            self._write_each(items)
+
+    def _write(self, items):
+        rows = self._build_rows(items)
+        if rows:
+            with self.app.app_context(), db.engine.begin() as connection:
+                connection.execute(AIConversation.__table__.insert(), rows)
+        with self._lock:
+            self.written += len(rows)
+            # 用户不存在的消息无法写入，在写入成功后计为丢弃（失败重试时不重复计数）
+            self.dropped += len(items) - len(rows)
+            self._forget(items)
+
+    def _write_each(self, items):
+        """逐条写入，找出导致整批失败的消息"""
+        for index, item in enumerate(items):
+            try:
+                self._write([item])
+            except (IntegrityError, DataError) as e:
+                # 重试也不会成功（如用户已删除、序号重复），转入死信，不再阻塞后续写入
+                with self._lock:
+                    self.dead_lettered += 1
+                    self.dead_letters.append({'user': item[0], 'ai_type': item[1], 'entry': item[2], 'error': str(e)})
+                    self._forget([item])
+                print(f"对话记录无法写入，已转入死信: {e}")
+            except Exception as e:
+                # 数据库暂不可用：保留剩余消息等待下一轮，超出上限时丢弃最早的部分
+                remaining = items[index:]
+                overflow = max(len(remaining) - self._queue.maxsize, 0)
+                with self._lock:
+                    self.dropped += overflow
+                    self._forget(remaining[:overflow])
+                    self._pending = remaining[overflow:]
+                print(f"对话记录写入失败（{len(remaining) - overflow}条待重试）: {e}")
+                return
+
+    def _build_rows(self, items) -> List[Dict]:
+        user_ids = self.resolver.resolve_many([username for username, _, _ in items])
+        rows = []
+        for username, ai_type, entry in items:
+            user_id = user_ids.get(username)
+            if user_id is None:
+                continue
+            rows.append({
+                'user_id': user_id,
+                'ai_type': ai_type,
+                'message': entry['message'],
+                'sender': entry['sender'],
+                'seq': entry['id'],
+                'timestamp': datetime.fromisoformat(entry['timestamp']),
+                'message_type': 'text'
+            })
+        return rows
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'pending_retry': len(self._pending),
+                'written': self.written,
+                'dropped': self.dropped,
+                'dead_lettered': self.dead_lettered,
+                'failed_flushes': self.failed_flushes
+            }
+
+
+def _insert(connection, table):
+    """按连接的数据库方言取得支持 ON CONFLICT 的INSERT"""
+    if connection.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    if connection.dialect.name == 'sqlite':
+        return sqlite.insert(table)
+    raise RuntimeError(f'Unsupported database dialect for conversation storage: {connection.dialect.name}')
+
+
+class DatabaseSpillStorage:
+    """以 ai_conversations 表作为 ConversationStore 的持久化存储
+
+    每条消息在追加时已交给 ConversationWriter 写入，因此溢出时无需重复写入；
+    尚未写入的消息从写入器读取并与表中的记录合并（按id去重）。
+    消息序号由 ai_conversation_sequences 计数器按段原子预留，多个进程之间不会重复。
+    """
+
+    def __init__(self, app, resolver, writer=None):
+        self.app = app
+        self.resolver = resolver
+        self.writer = writer
+
+    def append(self, user, service_type, messages):
+        pass
+
+    def _unflushed(self, user, service_type) -> List[Dict]:
+        # 须在查询表之前读取：之后才写入的消息会出现在查询结果中，不会两边都错过
+        return self.writer.unflushed(user, service_type) if self.writer is not None else []
+
+    def fetch(self, user, service_type, before_id=None, after_id=None, limit=None) -> List[Dict]:
+        """按序号升序读取消息，语义与 SQLiteSpillStorage.fetch 相同"""
+        user_id = self.resolver.resolve(user)
+        if user_id is None:
+            return []
+
+        pending = [m for m in self._unflushed(user, service_type)
+                   if (before_id is None or m['id'] < before_id) and (after_id is None or m['id'] > after_id)]
+        query = select(
+            AIConversation.seq, AIConversation.message, AIConversation.sender, AIConversation.timestamp
+        ).where(AIConversation.user_id == user_id, AIConversation.ai_type == service_type)
+        if before_id is not None:
+            query = query.where(AIConversation.seq < before_id)
+        if after_id is not None:
+            query = query.where(AIConversation.seq > after_id)
+        descending = after_id is None
+        query = query.order_by(AIConversation.seq.desc() if descending else AIConversation.seq.asc())
+        if limit is not None:
+            query = query.limit(limit)
+
+        with self.app.app_context(), db.engine.connect() as connection:
+            rows = connection.execute(query).all()
+
+        messages = [{
+            'id': seq,
+            'message': message,
+            'sender': sender,
+            'timestamp': timestamp.isoformat() if timestamp else None
+        } for seq, message, sender, timestamp in rows]
+        if descending:
+            messages.reverse()
+        if pending:
+            merged = {m['id']: dict(m) for m in pending}
+            merged.update((m['id'], m) for m in messages)
+            messages = sorted(merged.values(), key=itemgetter('id'))
+            if limit is not None:
+                messages = messages[-limit:] if descending else messages[:limit]
+        return messages
+
+    def message_count(self, user, service_type) -> int:
+        """消息条数，包括尚未写入的消息（用户不存在时为0）"""
+        user_id = self.resolver.resolve(user)
+        if user_id is None:
+            return 0
+
+        pending_ids = [m['id'] for m in self._unflushed(user, service_type)]
+        query = select(
+            func.count(),
+            # 刚写入、尚未从写入器移除的消息只计一次
+            func.count(case((AIConversation.seq.in_(pending_ids), 1))) if pending_ids else literal(0)
+        ).where(AIConversation.user_id == user_id, AIConversation.ai_type == service_type)
+        with self.app.app_context(), db.engine.connect() as connection:
+            stored, written = connection.execute(query).one()
+        return stored + len(pending_ids) - written
+
+    def reserve_ids(self, user, service_type, count) -> Optional[int]:
+        """一次往返预留连续的count个消息序号，返回第一个；用户不存在时返回None"""
+        user_id = self.resolver.resolve(user)
+        if user_id is None:
+            return None
+
+        table = AIConversationSequence.__table__
+        # 计数器不存在时从已有消息的最大 seq 之后开始
+        initial = select(func.coalesce(func.max(AIConversation.seq), 0) + count).where(
+            AIConversation.user_id == user_id, AIConversation.ai_type == service_type
+        ).scalar_subquery()
+        with self.app.app_context(), db.engine.begin() as connection:
+            statement = _insert(connection, table).values(user_id=user_id, ai_type=service_type, last_seq=initial)
+            statement = statement.on_conflict_do_update(
+                index_elements=['user_id', 'ai_type'],
+                set_={'last_seq': table.c.last_seq + count}
+            ).returning(table.c.last_seq)
+            return connection.execute(statement).scalar() - count + 1
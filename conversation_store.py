@@ -0,0 +1,326 @@
+"""
+AI对话存储
+每个用户、每种服务在内存中只保留固定条数的最近消息，更早的消息溢出到持久化存储；
+活跃对话数同样有上限，长时间不活跃的对话整体溢出，保证进程内存不随流量增长。
+消息id由持久化存储按段原子预留、在进程内逐个分配，多进程、对话被淘汰后重新加载时都不会重复；
+每段只需一次存储写入，追加消息的请求路径通常不访问存储。
+"""
+
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, List
+
+
+def _message_size(message: Dict) -> int:
+    """估算单条消息占用的内存字节数"""
+    size = sys.getsizeof(message)
+    for key, value in message.items():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+
+class SQLiteSpillStorage:
+    """基于SQLite的溢出存储"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS conversation_messages ('
+                ' user TEXT NOT NULL, service_type TEXT NOT NULL, id INTEGER NOT NULL,'
+                ' message TEXT NOT NULL, sender TEXT NOT NULL, timestamp TEXT,'
+                ' PRIMARY KEY (user, service_type, id))'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS conversation_sequences ('
+                ' user TEXT NOT NULL, service_type TEXT NOT NULL, last_id INTEGER NOT NULL,'
+                ' PRIMARY KEY (user, service_type))'
+            )
+            self._conn.commit()
+
+    def append(self, user, service_type, messages: List[Dict]):
+        """写入溢出的消息"""
+        if not messages:
+            return
+        rows = [(user, service_type, m['id'], m['message'], m['sender'], m.get('timestamp'))
+                for m in messages]
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO conversation_messages '
+                '(user, service_type, id, message, sender, timestamp) VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            self._conn.commit()
+
+    def reserve_ids(self, user, service_type, count) -> int:
+        """原子地预留连续的count个消息id，返回第一个（同一SQLite文件被多个进程共享时同样唯一）"""
+        with self._lock:
+            row = self._conn.execute(
+                'INSERT INTO conversation_sequences (user, service_type, last_id) VALUES (?, ?, '
+                ' (SELECT COALESCE(MAX(id), 0) + ? FROM conversation_messages WHERE user = ? AND service_type = ?)) '
+                'ON CONFLICT (user, service_type) DO UPDATE SET last_id = last_id + ? '
+                'RETURNING last_id',
+                (user, service_type, count, user, service_type, count)
+            ).fetchone()
+            self._conn.commit()
+        return row[0] - count + 1
+
+    def message_count(self, user, service_type) -> int:
+        """已存储的消息条数"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT COUNT(*) FROM conversation_messages WHERE user = ? AND service_type = ?',
+                (user, service_type)
+            ).fetchone()
+        return row[0]
+
+    def fetch(self, user, service_type, before_id=None, after_id=None, limit=None) -> List[Dict]:
+        """按id升序读取消息；before_id/after_id 为开区间边界，指定limit时取离边界最近的一段"""
+        conditions = ['user = ?', 'service_type = ?']
+        params = [user, service_type]
+        if before_id is not None:
+            conditions.append('id < ?')
+            params.append(before_id)
+        if after_id is not None:
+            conditions.append('id > ?')
+            params.append(after_id)
+        # 给出after时从after往后取，否则取紧邻before（未给出时为最新）的一段
+        descending = after_id is None
+        sql = (f'SELECT id, message, sender, timestamp FROM conversation_messages '
+               f'WHERE {" AND ".join(conditions)} ORDER BY id {"DESC" if descending else "ASC"}')
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        messages = [dict(row) for row in rows]
+        if descending:
+            messages.reverse()
+        return messages
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _Window:
+    """单个用户、单种服务的内存窗口"""
+
+    __slots__ = ('messages', 'last_id', 'next_id', 'block_end', 'bytes', 'loaded', 'evicted', 'lock')
+
+    def __init__(self, window_size):
+        self.messages = deque(maxlen=window_size)
+        self.last_id = 0
+        # 本进程预留的id段中下一个可用的id及段的末尾
+        self.next_id = 1
+        self.block_end = 0
+        self.bytes = 0
+        self.loaded = False  # 是否已从持久化存储加载过较早的消息
+        self.evicted = False
+        # 对话级锁：同一对话的追加、加载、溢出串行执行，存储I/O只在此锁内进行
+        self.lock = threading.Lock()
+
+
+class ConversationStore:
+    """有界的对话存储"""
+
+    def __init__(self, storage, window_size=50, max_conversations=10000, writer=None, id_block_size=100):
+        self.storage = storage
+        self.writer = writer  # 可选：每条新消息都交给写入器持久化（见 conversation_persistence）
+        self.window_size = window_size
+        self.max_conversations = max(max_conversations, 1)
+        self.id_block_size = max(id_block_size, 1)
+        self._windows: "OrderedDict[tuple, _Window]" = OrderedDict()
+        self._bytes = 0
+        self._spilled = 0
+        # 全局锁只保护窗口表和统计数据，持有期间不做任何I/O
+        self._lock = threading.Lock()
+
+    def _acquire_window(self, user, service_type) -> _Window:
+        """取得（必要时创建）对话窗口并返回，返回时已持有该窗口的锁；按LRU淘汰不活跃的对话"""
+        key = (user, service_type)
+        while True:
+            evicted = []
+            with self._lock:
+                window = self._windows.get(key)
+                if window is None:
+                    window = _Window(self.window_size)
+                    self._windows[key] = window
+                    while len(self._windows) > self.max_conversations:
+                        evicted.append(self._windows.popitem(last=False))
+                else:
+                    self._windows.move_to_end(key)
+            for old_key, old_window in evicted:
+                self._evict(old_key, old_window)
+
+            window.lock.acquire()
+            if not window.evicted:
+                return window
+            # 获取锁期间窗口已被淘汰，重新创建
+            window.lock.release()
+
+    def _evict(self, key, window):
+        with window.lock:
+            window.evicted = True
+            self.storage.append(key[0], key[1], list(window.messages))
+            self._account(-window.bytes, spilled=len(window.messages))
+            window.messages.clear()
+            window.bytes = 0
+
+    def _account(self, delta, spilled=0):
+        with self._lock:
+            self._bytes += delta
+            self._spilled += spilled
+
+    def _load(self, window, user, service_type):
+        """（持有窗口锁时调用）从持久化存储补齐窗口中最新消息之前的一段"""
+        first_id = window.messages[0]['id'] if window.messages else None
+        older = self.storage.fetch(user, service_type, before_id=first_id, limit=self.window_size)
+        messages = (older + list(window.messages))[-self.window_size:]
+        window.messages = deque(messages, maxlen=self.window_size)
+        size = sum(_message_size(m) for m in messages)
+        self._account(size - window.bytes)
+        window.bytes = size
+        if messages:
+            window.last_id = max(window.last_id, messages[-1]['id'])
+        window.loaded = True
+
+    def _next_id(self, window, user, service_type) -> int:
+        """（持有窗口锁时调用）从本进程预留的id段中取下一个id，用完时再向存储预留一段
+
+        每个进程的id在同一对话内递增；多个进程同时写同一对话时，id 唯一但不保证与写入时间先后一致。
+        """
+        if window.next_id > window.block_end:
+            first = self.storage.reserve_ids(user, service_type, self.id_block_size)
+            if first is None:
+                # 存储无法分配id时（数据库中不存在该用户，消息也不会被持久化）在窗口内顺序编号
+                return window.last_id + 1
+            window.next_id, window.block_end = first, first + self.id_block_size - 1
+        entry_id = window.next_id
+        window.next_id += 1
+        return entry_id
+
+    def append(self, user, service_type, message, sender, timestamp=None) -> Dict:
+        """追加一条消息并分配id，返回消息字典"""
+        window = self._acquire_window(user, service_type)
+        try:
+            entry_id = self._next_id(window, user, service_type)
+            window.last_id = max(window.last_id, entry_id)
+            entry = {
+                "id": entry_id,
+                "message": message,
+                "sender": sender,
+                "timestamp": timestamp or datetime.now().isoformat()
+            }
+
+            # 窗口已满时，最早的一条溢出到持久化存储
+            delta, spilled = 0, 0
+            if len(window.messages) == window.messages.maxlen:
+                oldest = window.messages.popleft()
+                self.storage.append(user, service_type, [oldest])
+                delta -= _message_size(oldest)
+                spilled = 1
+            window.messages.append(entry)
+            delta += _message_size(entry)
+            window.bytes += delta
+        finally:
+            window.lock.release()
+        self._account(delta, spilled)
+
+        if self.writer is not None:
+            self.writer.enqueue(user, service_type, entry)
+        return entry
+
+    def version(self, user, service_type):
+        """对话的数据版本，用于ETag：(已存储的消息条数, 内存窗口中最新的id)
+
+        对话只追加不修改，任何新消息都会使其中一项增大：其他进程写入的消息在写入存储后计入条数，
+        本进程的消息在放入窗口时更新最新id。窗口活跃时在窗口锁内读取，不会读到追加到一半的状态。
+        """
+        with self._lock:
+            window = self._windows.get((user, service_type))
+        if window is None:
+            return self.storage.message_count(user, service_type), 0
+        with window.lock:
+            return self.storage.message_count(user, service_type), window.last_id
+
+    def recent(self, user, service_type, limit=None) -> List[Dict]:
+        """内存窗口中的最近消息（按id升序）"""
+        with self._lock:
+            active = (user, service_type) in self._windows
+        # 不活跃且没有任何历史的对话不创建窗口
+        if not active and not self.storage.fetch(user, service_type, limit=1):
+            return []
+
+        window = self._acquire_window(user, service_type)
+        try:
+            if not window.loaded:
+                self._load(window, user, service_type)
+            messages = list(window.messages)
+        finally:
+            window.lock.release()
+        return messages[-limit:] if limit else messages
+
+    def page(self, user, service_type, before=None, after=None, limit=50):
+        """按id游标分页读取，结果始终按id升序排列
+
+        - 指定after：返回id大于after的最早limit条（向新消息方向翻页）
+        - 否则：返回id小于before（未指定时为最新）的最近limit条（向旧消息方向翻页）
+        返回 (消息列表, 是否还有更多)。
+        """
+        window_messages = self.recent(user, service_type)
+        first_id = window_messages[0]['id'] if window_messages else None
+
+        if after is not None:
+            messages = []
+            if first_id is None or after < first_id - 1:
+                messages = self.storage.fetch(user, service_type, after_id=after,
+                                              before_id=first_id, limit=limit + 1)
+            messages += [m for m in window_messages if m['id'] > after]
+            messages = messages[:limit + 1]
+            return messages[:limit], len(messages) > limit
+
+        messages = [m for m in window_messages if before is None or m['id'] < before]
+        if len(messages) <= limit:
+            upper = first_id if first_id is not None else before
+            if before is not None and upper is not None:
+                upper = min(upper, before)
+            older = self.storage.fetch(user, service_type, before_id=upper,
+                                       limit=limit + 1 - len(messages))
+            messages = older + messages
+        messages = messages[-(limit + 1):]
+        return messages[-limit:], len(messages) > limit
+
+    def history(self, user, service_type) -> List[Dict]:
+        """完整历史：持久化存储中的较早消息 + 内存窗口"""
+        window_messages = self.recent(user, service_type)
+        first_id = window_messages[0]['id'] if window_messages else None
+        older = self.storage.fetch(user, service_type, before_id=first_id) if first_id else []
+        return older + window_messages
+
+    def memory_usage(self) -> Dict:
+        """内存占用统计"""
+        with self._lock:
+            return {
+                'conversations': len(self._windows),
+                'messages_in_memory': sum(len(w.messages) for w in self._windows.values()),
+                'bytes_in_memory': self._bytes,
+                'messages_spilled': self._spilled,
+                'window_size': self.window_size,
+                'max_conversations': self.max_conversations
+            }
+
+    def flush(self):
+        """把所有内存窗口写入持久化存储（保留内存副本），用于进程退出前"""
+        with self._lock:
+            windows = list(self._windows.items())
+        for (user, service_type), window in windows:
+            with window.lock:
+                self.storage.append(user, service_type, list(window.messages))
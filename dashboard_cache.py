@@ -0,0 +1,106 @@
+"""
+仪表盘接口的按用户读穿缓存
+/api/profile、/api/progress、/api/analysis 的计算结果按 (用户, 接口) 缓存，
+该用户的运动记录、目标或档案发生写入时整体失效。
+
+缓存位于进程内：多进程/多实例部署时，一个进程内的写入只能使本进程的缓存失效，
+其他进程依靠 TTL 兜底，最多返回 TTL 秒内的旧数据。
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+class DashboardCache:
+    """线程安全的按用户缓存：用户级LRU + 单条目TTL + 失效代数"""
+
+    def __init__(self, max_users=10000, ttl=300):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = OrderedDict()  # 用户 -> {接口名: (过期时间, 数据)}
+        # 计算期间发生失效时不写回结果，避免缓存写入前的旧数据：
+        # 只为正在计算的用户记录失效代数，计算全部结束后即删除，因此大小不超过并发计算的用户数
+        self._computing = {}  # 用户 -> 进行中的计算数
+        self._generations = {}  # 用户 -> 失效代数（单调递增，clear() 也不会重置）
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+        self.invalidations = 0
+
+    def get_or_compute(self, user, name, compute):
+        """命中时直接返回缓存，否则调用 compute() 计算并写入"""
+        now = time.monotonic()
+        with self._lock:
+            entries = self._users.get(user)
+            entry = entries.get(name) if entries else None
+            if entry is not None and entry[0] > now:
+                self._users.move_to_end(user)
+                self.hits[name] = self.hits.get(name, 0) + 1
+                return entry[1]
+            self.misses[name] = self.misses.get(name, 0) + 1
+            generation = self._generations.get(user, 0)
+            self._computing[user] = self._computing.get(user, 0) + 1
+
+        computed = False
+        try:
+            value = compute()
+            computed = True
+        finally:
+            with self._lock:
+                fresh = computed and self._generations.get(user, 0) == generation
+                remaining = self._computing[user] - 1
+                if remaining:
+                    self._computing[user] = remaining
+                else:
+                    del self._computing[user]
+                    self._generations.pop(user, None)
+                if fresh and self.max_users > 0:
+                    self._users.setdefault(user, {})[name] = (time.monotonic() + self.ttl, value)
+                    self._users.move_to_end(user)
+                    while len(self._users) > self.max_users:
+                        self._users.popitem(last=False)
+        return value
+
+    def _bump(self, user):
+        # 只有正在计算的用户需要记录代数
+        if user in self._computing:
+            self._generations[user] = next(self._counter)
+
+    def invalidate(self, user):
+        """用户数据发生写入后调用，清除该用户的全部缓存"""
+        with self._lock:
+            self._users.pop(user, None)
+            self._bump(user)
+            self.invalidations += 1
+
+    def clear(self):
+        """清空缓存，返回被清除的用户数；进行中的计算结果同样不会写回"""
+        with self._lock:
+            count = len(self._users)
+            self._users.clear()
+            for user in self._computing:
+                self._bump(user)
+            return count
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            hits = sum(self.hits.values())
+            total = hits + sum(self.misses.values())
+            return {
+                'users': len(self._users),
+                'max_users': self.max_users,
+                'ttl': self.ttl,
+                'hits': dict(self.hits),
+                'misses': dict(self.misses),
+                'invalidations': self.invalidations,
+                'hit_rate': round(hits / total, 4) if total else 0.0
+            }
+
+
+dashboard_cache = DashboardCache(max_users=Config.DASHBOARD_CACHE_MAX_USERS, ttl=Config.DASHBOARD_CACHE_TTL)
@@ -0,0 +1,110 @@
+"""
+用户数据导出
+按资源依次以服务端游标（stream_results + yield_per）读取，边读边输出 NDJSON 或 CSV，
+可选增量gzip压缩；内存占用只与单个游标批次和输出缓冲区大小有关，与历史数据量无关。
+"""
+
+import csv
+import io
+import json
+import zlib
+from typing import Dict, Iterable, Iterator, List
+
+from sqlalchemy import select
+
+from models import db, AIConversation, FitnessGoal, FitnessWorkout, HealthData, ModelSerializer
+from repositories import GOAL_SERIALIZER, WORKOUT_SERIALIZER
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_CSV = 'csv'
+
+# 每次从游标取出的行数
+YIELD_PER = 500
+# 输出缓冲区达到该大小（字符数）时产出一块
+CHUNK_SIZE = 64 * 1024
+
+HEALTH_DATA_SERIALIZER = ModelSerializer(
+    HealthData, fields=['id', 'data_type', 'value', 'recorded_at'], defaults={'value': None}
+)
+
+CONVERSATION_SERIALIZER = ModelSerializer(
+    AIConversation, fields=['seq', 'ai_type', 'sender', 'message', 'timestamp'], aliases={'seq': 'id'}
+)
+
+
+# 资源名 -> (模型, 排序列, 序列化器, CSV列)
+EXPORT_RESOURCES = {
+    'workouts': (FitnessWorkout, FitnessWorkout.id, WORKOUT_SERIALIZER,
+                 ['id', 'type', 'duration', 'calories_burned', 'exercises', 'notes', 'workout_date']),
+    'goals': (FitnessGoal, FitnessGoal.id, GOAL_SERIALIZER,
+              ['id', 'type', 'target', 'current', 'unit', 'deadline', 'status', 'created_at']),
+    'health_data': (HealthData, HealthData.id, HEALTH_DATA_SERIALIZER,
+                    ['id', 'data_type', 'value', 'recorded_at']),
+    'conversations': (AIConversation, AIConversation.id, CONVERSATION_SERIALIZER,
+                      ['id', 'ai_type', 'sender', 'message', 'timestamp'])
+}
+
+
+def iter_resource(user_id, resource) -> Iterator[Dict]:
+    """以服务端游标逐批读取一个资源的全部记录"""
+    model, order_column, to_dict, _ = EXPORT_RESOURCES[resource]
+    query = (select(model).where(model.user_id == user_id).order_by(order_column)
+             .execution_options(stream_results=True, yield_per=YIELD_PER))
+    for row in db.session.execute(query).scalars():
+        yield to_dict(row)
+
+
+def ndjson_chunks(user_id, resources: List[str]) -> Iterator[str]:
+    """NDJSON：每行一条记录，record_type 标明所属资源"""
+    buffer = []
+    size = 0
+    for resource in resources:
+        for record in iter_resource(user_id, resource):
+            line = json.dumps({'record_type': resource, **record}, ensure_ascii=False) + '\n'
+            buffer.append(line)
+            size += len(line)
+            if size >= CHUNK_SIZE:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        # 与导入格式一致：列表以 ; 分隔
+        return ';'.join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def csv_chunks(user_id, resource) -> Iterator[str]:
+    """CSV：单个资源，首行为列名"""
+    fields = EXPORT_RESOURCES[resource][3]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for record in iter_resource(user_id, resource):
+        writer.writerow([_csv_value(record.get(field)) for field in fields])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_chunks(chunks: Iterable[str], compress=False) -> Iterator[bytes]:
+    """编码为UTF-8，compress=True 时增量输出gzip流"""
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode('utf-8')
+        return
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31：gzip格式
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
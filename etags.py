@@ -0,0 +1,53 @@
+"""
+基于数据版本的ETag与条件GET
+每个接口提供一个读取数据版本的函数（如最近更新时间、记录数、最新消息序号），只需一次索引查询；
+ETag 由资源、版本和查询参数计算得出，在构建响应之前即可得出，If-None-Match 命中时直接返回304。
+
+版本来自数据库中的数据本身，多进程/多实例之间一致，进程重启后仍然有效，写入路径无需额外通知。
+"""
+
+import hashlib
+from functools import wraps
+
+from flask import make_response, request
+from flask_jwt_extended import get_jwt_identity
+
+from compression import SUPPORTED_ENCODINGS
+
+
+def make_etag(resource, version, variant=''):
+    """生成强ETag值（不含引号）"""
+    return hashlib.sha1(f'{resource}\0{version!r}\0{variant}'.encode('utf-8')).hexdigest()[:24]
+
+
+def _query_variant():
+    # 查询参数不同则响应体不同，按参数名排序后计入ETag
+    return '&'.join(f'{key}={value}' for key, value in sorted(request.args.items(multi=True)))
+
+
+def conditional_get(resource, version):
+    """条件GET装饰器（放在 jwt_required 之后）
+
+    version 为接收当前用户名和视图参数、返回该用户所见数据当前版本的函数，
+    数据发生任何变化时返回值都须随之改变。If-None-Match 命中时不执行视图，直接返回304。
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            user = get_jwt_identity()
+            etag = make_etag(resource, version(user, **kwargs), f'{user}\0{_query_variant()}')
+            # 压缩后的响应带有编码后缀（见 compression.compress_response）
+            for candidate in (etag, *(f'{etag}-{encoding}' for encoding in SUPPORTED_ENCODINGS)):
+                if request.if_none_match.contains(candidate):
+                    response = make_response('', 304)
+                    response.set_etag(candidate)
+                    return response
+
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                # 需要每次向服务器验证，但允许客户端保留副本
+                response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -1,7 +1,9 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
 import json
+import math
 import sys
 import os
 
@@ -9,43 +11,72 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from services.fitness_service import FitnessService
+from repositories import (
+    FitnessAggregateRepository, UserRepository, WorkoutRepository, GoalRepository, decode_cursor
+)
+from bulk_import import HealthDataImporter, WorkoutImporter, detect_format
+from data_export import EXPORT_RESOURCES, FORMAT_CSV, FORMAT_NDJSON, csv_chunks, encode_chunks, ndjson_chunks
+from compression import ENCODING_GZIP, negotiate
+from config import Config
+from models import json_bytes, utcnow
+from dashboard_cache import dashboard_cache
+from etags import conditional_get
+from health_metrics import (
+    MAX_POINTS, METRIC_UNITS, RESOLUTIONS, choose_resolution, parse_sample, parse_timestamp, query_series,
+    record_samples
+)
 
 fitness_bp = Blueprint('fitness', __name__)
 fitness_service = FitnessService()
 
-# 模拟用户数据（实际项目中应从数据库获取）
-user_profiles = {
-    "user1": {
-        "profile": {
-            "age": 30,
-            "gender": "male", 
-            "height": 175,
-            "weight": 70,
-            "fitness_level": "intermediate",
-            "goals": ["weight_loss", "muscle_gain"]
-        },
-        "workouts": [
-            {
-                "id": 1,
-                "type": "strength",
-                "duration": 60,
-                "calories_burned": 300,
-                "exercises": ["深蹲", "卧推"],
-                "workout_date": "2024-01-15T10:00:00"
-            }
-        ],
-        "goals": [
-            {
-                "id": 1,
-                "type": "weight_loss",
-                "target": 5,
-                "current": 2.5,
-                "unit": "kg",
-                "deadline": "2024-03-01"
-            }
-        ]
+# 运动库在代码中定义，内容即版本：运动库变化（发布新版本）时推荐接口的ETag随之变化
+EXERCISE_CATALOG_VERSION = hashlib.sha1(
+    json.dumps(fitness_service.exercise_database, ensure_ascii=False, sort_keys=True).encode('utf-8')
+).hexdigest()
+
+def json_response(payload, status=200):
+    """以 json_bytes 编码的JSON响应，列表类接口使用"""
+    return Response(json_bytes(payload), status=status, mimetype='application/json')
+
+# 对话时提供给关键词回复的最近运动记录条数
+CONTEXT_RECENT_WORKOUTS = 10
+
+# 运动记录的数值字段及其类型（规则与批量导入一致：有限、非负）
+WORKOUT_NUMBER_FIELDS = (('duration', int), ('calories_burned', float))
+
+def workout_data_error(data):
+    """校验运动记录的数值和日期字段，并把数值转换为对应类型；返回错误信息，无错误时返回None"""
+    for field, cast in WORKOUT_NUMBER_FIELDS:
+        value = data.get(field)
+        if value is None or value == '':
+            continue
+        try:
+            value = cast(value)
+            finite = math.isfinite(value)
+        except (TypeError, ValueError, OverflowError):
+            return f'{field} must be a number'
+        if not finite:
+            return f'{field} must be a finite number'
+        if value < 0:
+            return f'{field} must be >= 0'
+        data[field] = value
+    if data.get('workout_date') is not None:
+        try:
+            datetime.fromisoformat(str(data['workout_date']))
+        except ValueError:
+            return 'Invalid workout_date'
+    return None
+
+def load_user_context(username):
+    """加载用户上下文：档案、最近的运动记录和健身目标"""
+    user = UserRepository.get(username)
+    if user is None:
+        return {}
+    return {
+        'profile': UserRepository.profile(user),
+        'workouts': WorkoutRepository.recent(user.id, CONTEXT_RECENT_WORKOUTS),
+        'goals': GoalRepository.list(user.id)
     }
-}
 
 @fitness_bp.route('/ai/chat', methods=['POST'])
 @jwt_required()
@@ -60,7 +91,7 @@ def ai_fitness_chat():
     user_message = data['message']
     
     # 获取用户上下文
-    user_context = user_profiles.get(current_user, {})
+    user_context = load_user_context(current_user)
     
     # 生成AI回复
     ai_response = fitness_service.generate_ai_response(user_message, user_context)
@@ -80,25 +111,53 @@ def ai_fitness_chat():
 @fitness_bp.route('/workouts', methods=['GET'])
 @jwt_required()
 def get_workouts():
-    """获取用户运动记录"""
+    """获取用户运动记录
+
+    按 (workout_date, id) 倒序键集分页：?limit=&cursor=（上一页返回的 next_cursor）
+    &from=&to=（ISO日期/时间，from 含、to 不含；只给日期时 to 包含当天）&type=
+    仍带 offset 参数的旧客户端走原偏移分页。
+    """
     current_user = get_jwt_identity()
+    user_id = UserRepository.get_id(current_user)
     
     # 获取查询参数
-    limit = request.args.get('limit', 10, type=int)
-    offset = request.args.get('offset', 0, type=int)
-    
-    user_data = user_profiles.get(current_user, {})
-    workouts = user_data.get('workouts', [])
-    
-    # 分页处理
-    paginated_workouts = workouts[offset:offset + limit]
-    
-    return jsonify({
-        'workouts': paginated_workouts,
-        'total': len(workouts),
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    
+    if 'offset' in request.args:
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        paginated_workouts, total = WorkoutRepository.list(user_id, limit, offset)
+        return json_response({
+            'workouts': paginated_workouts,
+            'total': total,
+            'limit': limit,
+            'offset': offset
+        })
+    
+    try:
+        cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    try:
+        date_from = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        date_to = None
+        if request.args.get('to'):
+            date_to = datetime.fromisoformat(request.args['to'])
+            if len(request.args['to']) == 10:
+                date_to += timedelta(days=1)
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO 8601 date/time'}), 400
+    
+    workouts, next_cursor = WorkoutRepository.page(
+        user_id, limit, cursor=cursor, date_from=date_from, date_to=date_to,
+        workout_type=request.args.get('type') or None
+    )
+    
+    return json_response({
+        'workouts': workouts,
         'limit': limit,
-        'offset': offset
-    }), 200
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
 
 @fitness_bp.route('/workouts', methods=['POST'])
 @jwt_required()
@@ -113,12 +172,18 @@ def add_workout():
     # 验证必要字段
     required_fields = ['type', 'duration']
     for field in required_fields:
-        if field not in data:
+        if data.get(field) is None:
             return jsonify({'error': f'{field} is required'}), 400
+    error = workout_data_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    user = UserRepository.get(current_user)
+    if user is None:
+        return jsonify({'error': 'User not found'}), 404
     
     # 创建新的运动记录
     new_workout = {
-        'id': len(user_profiles.get(current_user, {}).get('workouts', [])) + 1,
         'type': data['type'],
         'duration': data['duration'],
         'calories_burned': data.get('calories_burned', 0),
@@ -129,7 +194,7 @@ def add_workout():
     
     # 计算卡路里消耗（如果未提供）
     if not new_workout['calories_burned']:
-        user_weight = user_profiles.get(current_user, {}).get('profile', {}).get('weight', 70)
+        user_weight = user.weight or 70
         # 简化计算：使用第一个运动类型
         if new_workout['exercises']:
             exercise = new_workout['exercises'][0]
@@ -140,27 +205,227 @@ def add_workout():
             exercise, new_workout['duration'], user_weight
         )
     
-    # 保存到用户数据（实际项目中应保存到数据库）
-    if current_user not in user_profiles:
-        user_profiles[current_user] = {'workouts': [], 'goals': []}
-    
-    user_profiles[current_user]['workouts'].append(new_workout)
+    new_workout = WorkoutRepository.add(user.id, new_workout)
+    dashboard_cache.invalidate(current_user)
     
     return jsonify({
         'message': 'Workout added successfully',
         'workout': new_workout
     }), 201
 
+@fitness_bp.route('/workouts/<int:workout_id>', methods=['PUT'])
+@jwt_required()
+def update_workout(workout_id):
+    """更新运动记录"""
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'Workout data is required'}), 400
+    
+    error = workout_data_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    current_user = get_jwt_identity()
+    user_id = UserRepository.get_id(current_user)
+    try:
+        workout = WorkoutRepository.update(user_id, workout_id, data)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid workout data'}), 400
+    if workout is None:
+        return jsonify({'error': 'Workout not found'}), 404
+    dashboard_cache.invalidate(current_user)
+    
+    return jsonify({
+        'message': 'Workout updated successfully',
+        'workout': workout
+    }), 200
+
+@fitness_bp.route('/workouts/<int:workout_id>', methods=['DELETE'])
+@jwt_required()
+def delete_workout(workout_id):
+    """删除运动记录"""
+    current_user = get_jwt_identity()
+    user_id = UserRepository.get_id(current_user)
+    if not WorkoutRepository.delete(user_id, workout_id):
+        return jsonify({'error': 'Workout not found'}), 404
+    dashboard_cache.invalidate(current_user)
+    
+    return jsonify({'message': 'Workout deleted successfully'}), 200
+
+@fitness_bp.route('/workouts/import', methods=['POST'])
+@jwt_required()
+def import_workouts():
+    """批量导入运动记录（请求体为NDJSON或CSV，流式处理）"""
+    fmt = detect_format(request.mimetype, request.args.get('format'))
+    if fmt is None:
+        return jsonify({'error': 'Content-Type must be application/x-ndjson or text/csv'}), 415
+    
+    current_user = get_jwt_identity()
+    user = UserRepository.get(current_user)
+    if user is None:
+        return jsonify({'error': 'User not found'}), 404
+    
+    importer = WorkoutImporter(user.id, fitness_service, user_weight=user.weight or 70,
+                               batch_size=Config.IMPORT_BATCH_SIZE, max_errors=Config.IMPORT_MAX_ERRORS)
+    try:
+        report = importer.run(request.stream, fmt)
+    finally:
+        # 部分批次可能已提交，无论成功与否都使缓存失效
+        dashboard_cache.invalidate(current_user)
+    
+    return jsonify(report), 200
+
+@fitness_bp.route('/health-data/import', methods=['POST'])
+@jwt_required()
+def import_health_data():
+    """批量导入健康数据（请求体为NDJSON或CSV，流式处理）"""
+    fmt = detect_format(request.mimetype, request.args.get('format'))
+    if fmt is None:
+        return jsonify({'error': 'Content-Type must be application/x-ndjson or text/csv'}), 415
+    
+    user_id = UserRepository.get_id(get_jwt_identity())
+    if user_id is None:
+        return jsonify({'error': 'User not found'}), 404
+    
+    importer = HealthDataImporter(user_id, batch_size=Config.IMPORT_BATCH_SIZE,
+                                  max_errors=Config.IMPORT_MAX_ERRORS)
+    report = importer.run(request.stream, fmt)
+    
+    return jsonify(report), 200
+
+# 单次请求最多写入的采样数，更多数据请使用批量导入
+MAX_SAMPLES_PER_REQUEST = 5000
+
+@fitness_bp.route('/health/metrics', methods=['POST'])
+@jwt_required()
+def add_health_metric_samples():
+    """写入健康指标采样：{"samples": [{"metric", "value", "recorded_at"}, ...]} 或单条采样"""
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'Sample data is required'}), 400
+    
+    records = data.get('samples', [data]) if isinstance(data, dict) else data
+    if not isinstance(records, list) or not records:
+        return jsonify({'error': 'samples must be a non-empty list'}), 400
+    if len(records) > MAX_SAMPLES_PER_REQUEST:
+        return jsonify({'error': f'At most {MAX_SAMPLES_PER_REQUEST} samples per request'}), 413
+    
+    samples = []
+    for index, record in enumerate(records):
+        try:
+            samples.append(parse_sample(record))
+        except ValueError as e:
+            return jsonify({'error': str(e), 'index': index}), 400
+    
+    user_id = UserRepository.get_id(get_jwt_identity())
+    if user_id is None:
+        return jsonify({'error': 'User not found'}), 404
+    
+    inserted = record_samples(user_id, samples)
+    
+    return jsonify({
+        'message': 'Samples recorded successfully',
+        'inserted': inserted,
+        'duplicates': len(samples) - inserted
+    }), 201
+
+@fitness_bp.route('/health/metrics/<metric>', methods=['GET'])
+@jwt_required()
+def get_health_metric_series(metric):
+    """读取健康指标的预聚合序列：?from=&to=（ISO时间，默认最近7天）&resolution=minute|hour|day"""
+    if metric not in METRIC_UNITS:
+        return jsonify({'error': f'Unknown metric: {metric}'}), 404
+    
+    # 带时区的from/to统一换算为UTC（采样按UTC存储），与不带时区的值可以直接比较
+    try:
+        end = parse_timestamp(request.args['to']) if request.args.get('to') else utcnow()
+        start = parse_timestamp(request.args['from']) if request.args.get('from') else end - timedelta(days=7)
+    except ValueError:
+        return jsonify({'error': 'from/to must be ISO 8601 date/time'}), 400
+    if start >= end:
+        return jsonify({'error': 'from must be earlier than to'}), 400
+    
+    resolution = request.args.get('resolution') or choose_resolution(start, end)
+    if resolution not in RESOLUTIONS:
+        return jsonify({'error': f'resolution must be one of: {", ".join(RESOLUTIONS)}'}), 400
+    if (end - start) / RESOLUTIONS[resolution] > MAX_POINTS:
+        return jsonify({'error': f'Range too large for {resolution} resolution (max {MAX_POINTS} points)'}), 400
+    
+    user_id = UserRepository.get_id(get_jwt_identity())
+    if user_id is None:
+        return jsonify({'error': 'User not found'}), 404
+    
+    points = query_series(user_id, metric, start, end, resolution)
+    
+    return jsonify({
+        'metric': metric,
+        'unit': METRIC_UNITS[metric],
+        'resolution': resolution,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'points': points
+    }), 200
+
+@fitness_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_data():
+    """流式导出用户的全部历史数据
+
+    ?format=ndjson（默认，可包含多个资源）或 csv（仅限单个资源）
+    ?include=workouts,goals,health_data,conversations（默认全部）
+    ?gzip=1 输出gzip压缩文件
+    """
+    fmt = request.args.get('format', FORMAT_NDJSON)
+    if fmt not in (FORMAT_NDJSON, FORMAT_CSV):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    
+    include = request.args.get('include')
+    resources = [r.strip() for r in include.split(',') if r.strip()] if include else list(EXPORT_RESOURCES)
+    unknown = [r for r in resources if r not in EXPORT_RESOURCES]
+    if unknown or not resources:
+        return jsonify({'error': f'Unknown resources: {", ".join(unknown)}',
+                        'available': list(EXPORT_RESOURCES)}), 400
+    if fmt == FORMAT_CSV and len(resources) != 1:
+        return jsonify({'error': 'CSV export requires exactly one resource in include'}), 400
+    
+    user_id = UserRepository.get_id(get_jwt_identity())
+    if user_id is None:
+        return jsonify({'error': 'User not found'}), 404
+    
+    compress = request.args.get('gzip', '').lower() in ('1', 'true')
+    chunks = csv_chunks(user_id, resources[0]) if fmt == FORMAT_CSV else ndjson_chunks(user_id, resources)
+    filename = f"export.{'csv' if fmt == FORMAT_CSV else 'ndjson'}{'.gz' if compress else ''}"
+    headers = {
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store',
+        'Vary': 'Accept-Encoding'
+    }
+    if compress:
+        mimetype = 'application/gzip'
+    else:
+        mimetype = 'text/csv' if fmt == FORMAT_CSV else 'application/x-ndjson'
+        # 未要求 .gz 文件时按 Accept-Encoding 以传输编码压缩（流式响应只支持gzip）
+        if negotiate(request.headers.get('Accept-Encoding'), (ENCODING_GZIP,)):
+            compress = True
+            headers['Content-Encoding'] = ENCODING_GZIP
+    
+    # stream_with_context 让生成器在整个响应期间持有请求上下文（及数据库会话）
+    return Response(
+        stream_with_context(encode_chunks(chunks, compress)),
+        mimetype=mimetype,
+        headers=headers
+    )
+
 @fitness_bp.route('/goals', methods=['GET'])
 @jwt_required()
+@conditional_get('goals', lambda user: GoalRepository.version(UserRepository.get_id(user)))
 def get_goals():
     """获取用户健身目标"""
     current_user = get_jwt_identity()
     
-    user_data = user_profiles.get(current_user, {})
-    goals = user_data.get('goals', [])
+    goals = GoalRepository.list(UserRepository.get_id(current_user))
     
-    return jsonify({'goals': goals}), 200
+    return json_response({'goals': goals})
 
 @fitness_bp.route('/goals', methods=['POST'])
 @jwt_required()
@@ -178,23 +443,16 @@ def add_goal():
         if field not in data:
             return jsonify({'error': f'{field} is required'}), 400
     
-    # 创建新的目标
-    new_goal = {
-        'id': len(user_profiles.get(current_user, {}).get('goals', [])) + 1,
-        'type': data['type'],
-        'target': data['target'],
-        'current': data.get('current', 0),
-        'unit': data.get('unit', ''),
-        'deadline': data.get('deadline'),
-        'status': 'active',
-        'created_at': datetime.now().isoformat()
-    }
-    
-    # 保存到用户数据（实际项目中应保存到数据库）
-    if current_user not in user_profiles:
-        user_profiles[current_user] = {'workouts': [], 'goals': []}
+    user_id = UserRepository.get_id(current_user)
+    if user_id is None:
+        return jsonify({'error': 'User not found'}), 404
     
-    user_profiles[current_user]['goals'].append(new_goal)
+    # 创建新的目标
+    try:
+        new_goal = GoalRepository.add(user_id, data)
+    except ValueError:
+        return jsonify({'error': 'Invalid deadline'}), 400
+    dashboard_cache.invalidate(current_user)
     
     return jsonify({
         'message': 'Goal added successfully',
@@ -203,11 +461,12 @@ def add_goal():
 
 @fitness_bp.route('/training-plan', methods=['GET'])
 @jwt_required()
+@conditional_get('profile', UserRepository.version)
 def get_training_plan():
     """获取个性化训练计划"""
     current_user = get_jwt_identity()
     
-    user_profile = user_profiles.get(current_user, {}).get('profile', {})
+    user_profile = UserRepository.profile(UserRepository.get(current_user))
     
     # 生成个性化训练计划
     training_plan = fitness_service.generate_personalized_plan(user_profile)
@@ -220,16 +479,20 @@ def get_fitness_analysis():
     """获取健身数据分析"""
     current_user = get_jwt_identity()
     
-    user_data = user_profiles.get(current_user, {})
-    workouts = user_data.get('workouts', [])
-    
-    # 分析运动数据
-    analysis = fitness_service.analyze_workout_data(workouts)
+    analysis = dashboard_cache.get_or_compute(current_user, 'analysis', lambda: build_fitness_analysis(current_user))
     
     return jsonify(analysis), 200
 
+def build_fitness_analysis(username):
+    """计算健身数据分析"""
+    aggregate = FitnessAggregateRepository.get(UserRepository.get_id(username))
+    
+    # 分析运动数据
+    return fitness_service.analyze_workout_data(aggregate)
+
 @fitness_bp.route('/exercises/recommendations', methods=['GET'])
 @jwt_required()
+@conditional_get('exercise_catalog', lambda user: EXERCISE_CATALOG_VERSION)
 def get_exercise_recommendations():
     """获取运动推荐"""
     muscle_group = request.args.get('muscle_group', '')
@@ -252,28 +515,30 @@ def get_fitness_profile():
     """获取用户健身概况"""
     current_user = get_jwt_identity()
     
-    user_data = user_profiles.get(current_user, {})
-    profile = user_data.get('profile', {})
-    workouts = user_data.get('workouts', [])
-    goals = user_data.get('goals', [])
+    fitness_profile = dashboard_cache.get_or_compute(current_user, 'profile', lambda: build_fitness_profile(current_user))
     
-    # 计算健身概况
-    total_workouts = len(workouts)
-    total_calories = sum(w.get('calories_burned', 0) for w in workouts)
-    active_goals = [g for g in goals if g.get('status') == 'active']
+    return jsonify(fitness_profile), 200
+
+def build_fitness_profile(username):
+    """计算用户健身概况"""
+    user = UserRepository.get(username)
+    user_id = user.id if user is not None else None
+    profile = UserRepository.profile(user)
+    aggregate = FitnessAggregateRepository.get(user_id)
+    active_goals = GoalRepository.list(user_id, status='active')
     
     fitness_profile = {
         'basic_info': profile,
         'stats': {
-            'total_workouts': total_workouts,
-            'total_calories': total_calories,
+            'total_workouts': aggregate['total_workouts'],
+            'total_calories': aggregate['total_calories'],
             'active_goals': len(active_goals)
         },
-        'recent_workouts': workouts[-3:] if workouts else [],
+        'recent_workouts': WorkoutRepository.recent(user_id, 3),
         'active_goals': active_goals
     }
     
-    return jsonify(fitness_profile), 200
+    return fitness_profile
 
 @fitness_bp.route('/progress', methods=['GET'])
 @jwt_required()
@@ -281,17 +546,22 @@ def get_progress_tracking():
     """获取健身进度跟踪"""
     current_user = get_jwt_identity()
     
-    user_data = user_profiles.get(current_user, {})
-    workouts = user_data.get('workouts', [])
-    goals = user_data.get('goals', [])
+    progress_data = dashboard_cache.get_or_compute(current_user, 'progress', lambda: build_progress(current_user))
+    
+    return jsonify({'progress': progress_data}), 200
+
+def build_progress(username):
+    """计算健身进度统计"""
+    user_id = UserRepository.get_id(username)
+    aggregate = FitnessAggregateRepository.get(user_id)
+    goals = GoalRepository.list(user_id)
     
-    # 计算进度统计
-    total_workouts = len(workouts)
-    total_calories = sum(w.get('calories_burned', 0) for w in workouts)
+    # 进度统计来自运动汇总
+    total_workouts = aggregate['total_workouts']
+    total_calories = aggregate['total_calories']
     
-    # 计算每周运动频率
-    recent_workouts = sorted(workouts, key=lambda x: x.get('workout_date', ''), reverse=True)[:7]
-    weekly_frequency = len(recent_workouts)
+    # 计算每周运动频率（最近7次运动）
+    weekly_frequency = min(total_workouts, 7)
     
     # 计算目标完成度
     goal_progress = []
@@ -317,7 +587,7 @@ def get_progress_tracking():
             'active_goals': len(goals)
         },
         'goal_progress': goal_progress,
-        'recent_activity': recent_workouts[:3]
+        'recent_activity': WorkoutRepository.latest(user_id, 3)
     }
     
-    return jsonify({'progress': progress_data}), 200
\ No newline at end of file
+    return progress_data
\ No newline at end of file
@@ -2,12 +2,16 @@ import json
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
+from keyword_matcher import KeywordMatcher
+
 class FitnessService:
     """AI健身教练服务类"""
     
     def __init__(self):
         self.exercise_database = self._load_exercise_database()
         self.training_templates = self._load_training_templates()
+        self.met_values = self._load_met_values()
+        self.response_matcher = KeywordMatcher(self._load_response_builders())
     
     def _load_exercise_database(self) -> Dict:
         """加载运动数据库"""
@@ -139,22 +143,21 @@ class FitnessService:
         
         return personalized_plan
     
-    def analyze_workout_data(self, workout_data: List[Dict]) -> Dict:
-        """分析运动数据"""
-        if not workout_data:
+    def analyze_workout_data(self, aggregate: Dict) -> Dict:
+        """根据运动汇总（见 FitnessAggregateRepository.get）分析运动数据"""
+        total_workouts = aggregate.get('total_workouts', 0)
+        if not total_workouts:
             return {
                 "summary": "暂无运动数据",
                 "recommendations": ["开始记录您的第一次运动吧！"]
             }
         
-        # 计算统计数据
-        total_workouts = len(workout_data)
-        total_calories = sum(workout.get('calories_burned', 0) for workout in workout_data)
-        avg_duration = sum(workout.get('duration', 0) for workout in workout_data) / total_workouts
+        # 统计数据
+        total_calories = aggregate.get('total_calories', 0)
+        avg_duration = aggregate.get('total_duration', 0) / total_workouts
         
-        # 分析趋势
-        recent_workouts = sorted(workout_data, key=lambda x: x.get('workout_date', ''), reverse=True)[:7]
-        weekly_frequency = len(recent_workouts)
+        # 近期频率（最近7次运动）
+        weekly_frequency = min(total_workouts, 7)
         
         analysis = {
             "summary": f"您已完成{total_workouts}次运动，共消耗{total_calories}卡路里",
@@ -188,39 +191,48 @@ class FitnessService:
         
         return recommendations[:5]  # 返回前5个推荐
     
-    def calculate_calories_burned(self, exercise: str, duration: int, user_weight: float) -> float:
-        """计算卡路里消耗"""
-        # 基础代谢率估算（简化版）
-        met_values = {
+    def _load_met_values(self) -> Dict:
+        """加载各运动的代谢当量(MET)"""
+        return {
             "跑步": 8.0,
             "深蹲": 5.0,
             "卧推": 3.5,
             "瑜伽": 2.5,
             "拉伸": 2.0
         }
-        
-        met = met_values.get(exercise, 3.0)
+    
+    def calculate_calories_burned(self, exercise: str, duration: int, user_weight: float) -> float:
+        """计算卡路里消耗"""
+        # 基础代谢率估算（简化版）
+        met = self.met_values.get(exercise, 3.0)
         calories = met * user_weight * duration / 60
         
         return round(calories, 1)
     
+    def calculate_calories_burned_batch(self, items: List[tuple]) -> List[float]:
+        """批量计算卡路里消耗，items 为 (运动, 时长, 体重) 列表，结果与逐条调用 calculate_calories_burned 相同"""
+        met_values = self.met_values
+        return [round(met_values.get(exercise, 3.0) * user_weight * duration / 60, 1)
+                for exercise, duration, user_weight in items]
+    
+    def _load_response_builders(self) -> List:
+        """加载关键词回复表（按顺序，越靠前优先级越高）；动态回复在命中后才生成"""
+        return [
+            ("体能概况", self._get_fitness_overview),
+            ("训练计划", self._get_training_plan_response),
+            ("运动记录", self._get_workout_history_response),
+            ("健身目标", self._get_goals_response),
+            ("开始健身", "太好了！让我们开始您的健身之旅。首先，我需要了解您的健身目标和当前水平。"),
+            ("如何增肌", "增肌需要结合力量训练和适当的营养。建议每周进行3-4次力量训练，并确保摄入足够的蛋白质。"),
+            ("如何减脂", "减脂需要创造热量赤字。建议结合有氧运动和力量训练，控制饮食热量摄入。")
+        ]
+    
     def generate_ai_response(self, user_message: str, user_context: Dict) -> str:
         """生成AI回复"""
         # 关键词匹配回复
-        responses = {
-            "体能概况": self._get_fitness_overview(user_context),
-            "训练计划": self._get_training_plan_response(user_context),
-            "运动记录": self._get_workout_history_response(user_context),
-            "健身目标": self._get_goals_response(user_context),
-            "开始健身": "太好了！让我们开始您的健身之旅。首先，我需要了解您的健身目标和当前水平。",
-            "如何增肌": "增肌需要结合力量训练和适当的营养。建议每周进行3-4次力量训练，并确保摄入足够的蛋白质。",
-            "如何减脂": "减脂需要创造热量赤字。建议结合有氧运动和力量训练，控制饮食热量摄入。"
-        }
-        
-        # 匹配关键词
-        for keyword, response in responses.items():
-            if keyword in user_message:
-                return response
+        response = self.response_matcher.match(user_message)
+        if response is not None:
+            return response(user_context) if callable(response) else response
         
         # 默认回复
         return "我理解您想了解健身相关信息。您可以问我关于体能概况、训练计划、运动记录或健身目标的问题。"
@@ -0,0 +1,265 @@
+"""
+健康指标时序存储
+原始采样以数值列写入 health_metric_samples，同时增量更新分钟/小时/天三级预聚合
+（min/max/sum/count）；图表和报表直接读取预聚合，不再逐行解析原始数据。
+"""
+
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, utcnow, HealthMetricRollup, HealthMetricSample
+
+# 支持的指标及单位
+METRIC_UNITS = {
+    'heart_rate': 'bpm',
+    'weight': 'kg',
+    'sleep': 'hours',
+    'steps': 'count'
+}
+
+# 聚合粒度 -> 桶长度
+RESOLUTIONS = OrderedDict([
+    ('minute', timedelta(minutes=1)),
+    ('hour', timedelta(hours=1)),
+    ('day', timedelta(days=1)),
+])
+
+# 单次查询最多返回的桶数
+MAX_POINTS = 2000
+
+
+def bucket_start(moment: datetime, resolution) -> datetime:
+    """时间点所在桶的起始时间"""
+    if resolution == 'minute':
+        return moment.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def to_utc_naive(moment: datetime) -> datetime:
+    """带时区的时间换算为UTC并去掉时区；不带时区的时间视为UTC（与数据库中的存储一致）"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def parse_timestamp(value) -> datetime:
+    """解析ISO 8601时间并统一为不带时区的UTC时间，失败时抛出 ValueError"""
+    return to_utc_naive(datetime.fromisoformat(value))
+
+
+def choose_resolution(start: datetime, end: datetime) -> str:
+    """选择使时间范围内桶数不超过 MAX_POINTS 的最细粒度"""
+    for resolution, width in RESOLUTIONS.items():
+        if (end - start) / width <= MAX_POINTS:
+            return resolution
+    return 'day'
+
+
+def _insert(table):
+    """按当前数据库方言取得支持 ON CONFLICT 的INSERT"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    raise RuntimeError(f'Unsupported database dialect for health metrics: {dialect}')
+
+
+def aggregate(samples: Iterable[Tuple[str, float, datetime]]) -> Dict[tuple, List[float]]:
+    """把一批采样在内存中先聚合到各级桶：(指标, 粒度, 桶起点) -> [min, max, sum, count]"""
+    buckets = {}
+    for metric, value, recorded_at in samples:
+        for resolution in RESOLUTIONS:
+            key = (metric, resolution, bucket_start(recorded_at, resolution))
+            state = buckets.get(key)
+            if state is None:
+                buckets[key] = [value, value, value, 1]
+            else:
+                state[0] = min(state[0], value)
+                state[1] = max(state[1], value)
+                state[2] += value
+                state[3] += 1
+    return buckets
+
+
+def record_samples(user_id, samples: List[Tuple[str, float, datetime]], commit=True) -> int:
+    """写入一批采样并更新预聚合，返回实际新增的采样数（重复上报的采样被忽略）
+
+    commit=False 时不提交，由调用方与其他写入在同一事务中提交。
+    """
+    if not samples:
+        return 0
+
+    now = utcnow()
+    sample_table = HealthMetricSample.__table__
+    # 同一批内重复的 (指标, 时间) 只保留最后一条
+    unique = {(metric, recorded_at): value for metric, value, recorded_at in samples}
+    statement = _insert(sample_table).on_conflict_do_nothing().returning(
+        sample_table.c.metric, sample_table.c.value, sample_table.c.recorded_at
+    )
+    inserted = db.session.execute(statement, [{
+        'user_id': user_id,
+        'metric': metric,
+        'recorded_at': recorded_at,
+        'value': value,
+        'created_at': now
+    } for (metric, recorded_at), value in unique.items()]).all()
+
+    # 只有新写入的采样计入预聚合，重复上报不会重复计数
+    buckets = aggregate((metric, value, recorded_at) for metric, value, recorded_at in inserted)
+    if buckets:
+        rollup_table = HealthMetricRollup.__table__
+        statement = _insert(rollup_table)
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id', 'metric', 'resolution', 'bucket_start'],
+            set_={
+                'min_value': case((excluded.min_value < rollup_table.c.min_value, excluded.min_value),
+                                  else_=rollup_table.c.min_value),
+                'max_value': case((excluded.max_value > rollup_table.c.max_value, excluded.max_value),
+                                  else_=rollup_table.c.max_value),
+                'sum_value': rollup_table.c.sum_value + excluded.sum_value,
+                'count': rollup_table.c['count'] + excluded['count']
+            }
+        )
+        db.session.execute(statement, [{
+            'user_id': user_id,
+            'metric': metric,
+            'resolution': resolution,
+            'bucket_start': start,
+            'min_value': state[0],
+            'max_value': state[1],
+            'sum_value': state[2],
+            'count': state[3]
+        } for (metric, resolution, start), state in buckets.items()])
+
+    if commit:
+        db.session.commit()
+    return len(inserted)
+
+
+def query_series(user_id, metric, start: datetime, end: datetime, resolution) -> List[Dict]:
+    """读取 [start, end) 范围内的预聚合序列"""
+    rows = db.session.execute(
+        select(HealthMetricRollup.bucket_start, HealthMetricRollup.min_value, HealthMetricRollup.max_value,
+               HealthMetricRollup.sum_value, HealthMetricRollup.count)
+        .where(HealthMetricRollup.user_id == user_id,
+               HealthMetricRollup.metric == metric,
+               HealthMetricRollup.resolution == resolution,
+               HealthMetricRollup.bucket_start >= bucket_start(start, resolution),
+               HealthMetricRollup.bucket_start < end)
+        .order_by(HealthMetricRollup.bucket_start)
+    ).all()
+    return [{
+        'bucket_start': start_at.isoformat(),
+        'min': min_value,
+        'max': max_value,
+        'avg': round(sum_value / count, 4) if count else None,
+        'count': count
+    } for start_at, min_value, max_value, sum_value, count in rows]
+
+
+def parse_sample(record) -> Tuple[str, float, datetime]:
+    """校验一条采样 {metric, value, recorded_at}，失败时抛出 ValueError"""
+    metric = record.get('metric')
+    if metric not in METRIC_UNITS:
+        raise ValueError(f'metric must be one of: {", ".join(METRIC_UNITS)}')
+    try:
+        value = float(record['value'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('value must be a number')
+    if not math.isfinite(value):
+        raise ValueError('value must be a finite number')
+    recorded_at = record.get('recorded_at')
+    try:
+        recorded_at = parse_timestamp(recorded_at) if recorded_at else utcnow()
+    except (TypeError, ValueError):
+        raise ValueError('recorded_at must be an ISO 8601 date/time')
+    return metric, value, recorded_at
+
+
+def samples_from_health_data(rows: Iterable[Dict]) -> List[Tuple[str, float, datetime]]:
+    """从 health_data 行中取出可写入时序存储的采样
+
+    只取 data_type 为已知指标、value 为有限数值的行，其余（如JSON对象、文本）仍只保存在 health_data 中。
+    """
+    samples = []
+    for row in rows:
+        if row['data_type'] not in METRIC_UNITS or row['recorded_at'] is None:
+            continue
+        try:
+            value = json.loads(row['value'])
+        except (TypeError, ValueError):
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        value = float(value)
+        if math.isfinite(value):
+            samples.append((row['data_type'], value, to_utc_naive(row['recorded_at'])))
+    return samples
+
+
+def _month_start(moment: datetime, offset=0) -> datetime:
+    month = moment.year * 12 + moment.month - 1 + offset
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def ensure_sample_partitions(connection, months_back=12, months_ahead=12, today: Optional[datetime] = None):
+    """（PostgreSQL）为采样表创建按月分区，范围外的数据落入默认分区
+
+    需定期执行（如每月一次）提前创建后续月份的分区；默认分区中已有某月数据时无法再创建该月分区。
+    """
+    today = today or utcnow()
+    for offset in range(-months_back, months_ahead + 1):
+        start = _month_start(today, offset)
+        end = _month_start(today, offset + 1)
+        connection.execute(text(
+            f'CREATE TABLE IF NOT EXISTS health_metric_samples_{start:%Y%m} '
+            f'PARTITION OF health_metric_samples '
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        ))
+
+
+def maintain_sample_partitions(engine, months_ahead=3):
+    """（PostgreSQL）确保当月及之后 months_ahead 个月的采样分区存在
+
+    每个月份在单独的事务中创建，某个月份失败（如默认分区中已有该月数据）不影响其他月份。
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+    today = utcnow()
+    for offset in range(months_ahead + 1):
+        month = _month_start(today, offset)
+        try:
+            with engine.begin() as connection:
+                ensure_sample_partitions(connection, months_back=0, months_ahead=0, today=month)
+        except Exception as e:
+            print(f"创建健康指标分区失败（{month:%Y-%m}）: {e}")
+
+
+def start_partition_maintenance(app, months_ahead=3, interval=86400):
+    """启动时创建一次分区，之后每隔 interval 秒检查一次，使分区范围随时间滚动"""
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    if db.engine.dialect.name != 'postgresql':
+                        return
+                    maintain_sample_partitions(db.engine, months_ahead)
+            except Exception as e:
+                print(f"健康指标分区维护失败: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='health-partition-maintenance', daemon=True)
+    thread.start()
+    return thread
@@ -4,13 +4,105 @@
 用于创建数据库表和插入初始数据
 """
 
-import os
+import json
 import sys
+from datetime import datetime, timedelta
 from sqlalchemy import create_engine, text
 from config import get_config
+from migrations import run_migrations
+from repositories import hash_password
+
+# 示例用户：(用户名, 邮箱, 密码, 档案)
+DEMO_USERS = [
+    ('user1', 'user1@example.com', 'password123',
+     {'age': 30, 'gender': 'male', 'height': 175, 'weight': 70, 'fitness_level': 'intermediate',
+      'goals': ['weight_loss', 'muscle_gain']}),
+    ('user2', 'user2@example.com', 'password456',
+     {'age': 25, 'gender': 'female', 'height': 165, 'weight': 55, 'fitness_level': 'beginner',
+      'goals': ['weight_loss', 'flexibility']})
+]
+
+def seed_demo_data(connection):
+    """插入示例数据（用户已存在时跳过该用户的全部示例数据）"""
+    now = datetime.now()
+    for username, email, password, profile in DEMO_USERS:
+        exists = connection.execute(
+            text('SELECT 1 FROM users WHERE username = :username'), {'username': username}
+        ).first()
+        if exists:
+            continue
+        
+        connection.execute(text(
+            'INSERT INTO users (username, email, password_hash, age, gender, height, weight, '
+            'fitness_level, fitness_goals, created_at, updated_at) '
+            'VALUES (:username, :email, :password_hash, :age, :gender, :height, :weight, '
+            ':fitness_level, :fitness_goals, :now, :now)'
+        ), {
+            'username': username,
+            'email': email,
+            'password_hash': hash_password(password),
+            'age': profile['age'],
+            'gender': profile['gender'],
+            'height': profile['height'],
+            'weight': profile['weight'],
+            'fitness_level': profile['fitness_level'],
+            'fitness_goals': json.dumps(profile['goals']),
+            'now': now
+        })
+        user_id = connection.execute(
+            text('SELECT id FROM users WHERE username = :username'), {'username': username}
+        ).scalar()
+        
+        # 示例运动记录和健身目标
+        connection.execute(text(
+            'INSERT INTO fitness_workouts (user_id, workout_type, duration, calories_burned, exercises, '
+            'notes, workout_date, created_at) '
+            'VALUES (:user_id, :workout_type, :duration, :calories_burned, :exercises, :notes, :workout_date, :now)'
+        ), {
+            'user_id': user_id,
+            'workout_type': 'strength' if username == 'user1' else 'yoga',
+            'duration': 60 if username == 'user1' else 45,
+            'calories_burned': 300 if username == 'user1' else 200,
+            'exercises': json.dumps(['深蹲', '卧推'] if username == 'user1' else ['瑜伽'], ensure_ascii=False),
+            'notes': '力量训练' if username == 'user1' else '瑜伽放松',
+            'workout_date': now - timedelta(days=1),
+            'now': now
+        })
+        connection.execute(text(
+            'INSERT INTO fitness_goals (user_id, goal_type, target_value, current_value, unit, deadline, '
+            'status, created_at, updated_at) '
+            'VALUES (:user_id, :goal_type, :target_value, :current_value, :unit, :deadline, \'active\', :now, :now)'
+        ), {
+            'user_id': user_id,
+            'goal_type': profile['goals'][0],
+            'target_value': 5.0,
+            'current_value': 0.0,
+            'unit': 'kg',
+            'deadline': now + timedelta(days=30),
+            'now': now
+        })
+        
+        # 示例对话（seq即接口返回的消息id）
+        conversations = [
+            ('fitness_trainer', 1, 'user', '我想开始健身，有什么建议吗？'),
+            ('fitness_trainer', 2, 'ai', '根据您的身体状况，我建议从基础力量训练开始，每周3次，每次45-60分钟。'),
+            ('nutritionist', 1, 'ai',
+             '您好！我是您的AI营养师，可以根据您的健康状况和饮食偏好为您提供个性化的营养建议。请问有什么我可以帮助您的吗？')
+        ]
+        connection.execute(text(
+            'INSERT INTO ai_conversations (user_id, ai_type, message, sender, seq, timestamp, message_type) '
+            'VALUES (:user_id, :ai_type, :message, :sender, :seq, :timestamp, \'text\')'
+        ), [{
+            'user_id': user_id,
+            'ai_type': ai_type,
+            'message': message,
+            'sender': sender,
+            'seq': seq,
+            'timestamp': now
+        } for ai_type, seq, sender, message in conversations])
 
 def init_database():
-    """初始化数据库"""
+    """初始化数据库：执行迁移并插入示例数据"""
     
     # 获取配置
     config = get_config()
@@ -18,172 +110,17 @@ def init_database():
     # 创建数据库引擎
     engine = create_engine(config.DATABASE_URL)
     
-    # 创建表的SQL语句
-    create_tables_sql = """
-    -- 用户表
-    CREATE TABLE IF NOT EXISTS users (
-        id SERIAL PRIMARY KEY,
-        username VARCHAR(50) UNIQUE NOT NULL,
-        email VARCHAR(100) UNIQUE NOT NULL,
-        password_hash VARCHAR(255) NOT NULL,
-        profile JSONB,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-
-    -- 健康数据表
-    CREATE TABLE IF NOT EXISTS health_data (
-        id SERIAL PRIMARY KEY,
-        user_id INTEGER REFERENCES users(id),
-        weight DECIMAL(5,2),
-        height DECIMAL(5,2),
-        bmi DECIMAL(4,2),
-        heart_rate INTEGER,
-        blood_pressure VARCHAR(20),
-        recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        notes TEXT
-    );
-
-    -- 健身训练表
-    CREATE TABLE IF NOT EXISTS fitness_workouts (
-        id SERIAL PRIMARY KEY,
-        user_id INTEGER REFERENCES users(id),
-        workout_type VARCHAR(50) NOT NULL,
-        duration_minutes INTEGER NOT NULL,
-        calories_burned INTEGER,
-        intensity VARCHAR(20),
-        date DATE NOT NULL,
-        notes TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-
-    -- 健身目标表
-    CREATE TABLE IF NOT EXISTS fitness_goals (
-        id SERIAL PRIMARY KEY,
-        user_id INTEGER REFERENCES users(id),
-        goal_type VARCHAR(50) NOT NULL,
-        target_value DECIMAL(8,2),
-        current_value DECIMAL(8,2),
-        deadline DATE,
-        status VARCHAR(20) DEFAULT 'active',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-
-    -- AI对话记录表
-    CREATE TABLE IF NOT EXISTS ai_conversations (
-        id SERIAL PRIMARY KEY,
-        user_id INTEGER REFERENCES users(id),
-        user_message TEXT NOT NULL,
-        ai_response TEXT NOT NULL,
-        message_type VARCHAR(50),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-
-    -- 运动推荐表
-    CREATE TABLE IF NOT EXISTS exercise_recommendations (
-        id SERIAL PRIMARY KEY,
-        user_id INTEGER REFERENCES users(id),
-        exercise_name VARCHAR(100) NOT NULL,
-        category VARCHAR(50),
-        difficulty VARCHAR(20),
-        recommended_sets INTEGER,
-        recommended_reps INTEGER,
-        recommended_duration INTEGER,
-        reason TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-
-    -- 训练计划表
-    CREATE TABLE IF NOT EXISTS training_plans (
-        id SERIAL PRIMARY KEY,
-        user_id INTEGER REFERENCES users(id),
-        plan_name VARCHAR(100) NOT NULL,
-        plan_type VARCHAR(50),
-        duration_weeks INTEGER,
-        description TEXT,
-        exercises JSONB,
-        status VARCHAR(20) DEFAULT 'active',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    """
-    
-    # 插入初始数据的SQL语句
-    insert_initial_data_sql = """
-    -- 插入示例用户（如果不存在）
-    INSERT INTO users (username, email, password_hash, profile) 
-    VALUES 
-    ('demo_user', 'demo@example.com', 'hashed_password_here', '{"age": 30, "gender": "male", "height": 175, "weight": 70, "fitness_level": "intermediate"}'),
-    ('test_user', 'test@example.com', 'hashed_password_here', '{"age": 25, "gender": "female", "height": 165, "weight": 55, "fitness_level": "beginner"}')
-    ON CONFLICT (username) DO NOTHING;
-
-    -- 插入示例健身数据
-    INSERT INTO fitness_workouts (user_id, workout_type, duration_minutes, calories_burned, intensity, date, notes)
-    SELECT 
-        u.id, 
-        'running', 
-        30, 
-        300, 
-        'moderate', 
-        CURRENT_DATE - INTERVAL '1 day', 
-        '晨跑训练'
-    FROM users u WHERE u.username = 'demo_user'
-    ON CONFLICT DO NOTHING;
-
-    INSERT INTO fitness_workouts (user_id, workout_type, duration_minutes, calories_burned, intensity, date, notes)
-    SELECT 
-        u.id, 
-        'yoga', 
-        45, 
-        200, 
-        'light', 
-        CURRENT_DATE, 
-        '瑜伽放松'
-    FROM users u WHERE u.username = 'test_user'
-    ON CONFLICT DO NOTHING;
-
-    -- 插入示例健身目标
-    INSERT INTO fitness_goals (user_id, goal_type, target_value, current_value, deadline, status)
-    SELECT 
-        u.id, 
-        'weight_loss', 
-        5.0, 
-        0.0, 
-        CURRENT_DATE + INTERVAL '30 days', 
-        'active'
-    FROM users u WHERE u.username = 'demo_user'
-    ON CONFLICT DO NOTHING;
-
-    INSERT INTO fitness_goals (user_id, goal_type, target_value, current_value, deadline, status)
-    SELECT 
-        u.id, 
-        'muscle_gain', 
-        2.0, 
-        0.0, 
-        CURRENT_DATE + INTERVAL '60 days', 
-        'active'
-    FROM users u WHERE u.username = 'test_user'
-    ON CONFLICT DO NOTHING;
-    """
-    
     try:
-        # 连接数据库并执行SQL
-        with engine.connect() as connection:
-            # 创建表
-            print("正在创建数据库表...")
-            for statement in create_tables_sql.split(';'):
-                if statement.strip():
-                    connection.execute(text(statement.strip()))
-            
-            # 插入初始数据
-            print("正在插入初始数据...")
-            for statement in insert_initial_data_sql.split(';'):
-                if statement.strip():
-                    connection.execute(text(statement.strip()))
-            
-            connection.commit()
-            print("数据库初始化完成！")
+        # 表结构由 migrations.py 中的版本化迁移维护
+        print("正在执行数据库迁移...")
+        run_migrations(engine)
+        
+        # 插入初始数据
+        print("正在插入初始数据...")
+        with engine.begin() as connection:
+            seed_demo_data(connection)
+        
+        print("数据库初始化完成！")
             
     except Exception as e:
         print(f"数据库初始化失败: {e}")
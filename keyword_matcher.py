@@ -0,0 +1,89 @@
+"""
+多模式关键词匹配
+基于Aho-Corasick自动机，一次扫描消息即可找出所有命中的关键词，并按优先级返回结果
+"""
+
+from collections import deque
+from typing import Any, Iterable, List, Optional, Tuple
+
+
+class KeywordMatcher:
+    """编译一次、可重复使用的关键词匹配器
+
+    entries 为 (关键词, 值) 或 (关键词, 值, 优先级) 序列；优先级数值越小越优先，
+    未指定时按出现顺序递增，与按字典顺序逐个 `keyword in message` 的结果一致。
+    """
+
+    def __init__(self, entries: Iterable[Tuple]):
+        self._goto = [{}]        # 节点 -> {字符: 子节点}
+        self._fail = [0]
+        self._best = [None]      # 节点 -> 该节点(含失败链)上优先级最高的 (优先级, 值)
+        self._outputs = [[]]     # 节点 -> 以该节点结尾的 (优先级, 关键词, 值)
+
+        for index, entry in enumerate(entries):
+            keyword, value = entry[0], entry[1]
+            priority = entry[2] if len(entry) > 2 else index
+            if keyword:
+                self._add(keyword, value, priority)
+        self._build()
+
+    def _add(self, keyword, value, priority):
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(None)
+                self._outputs.append([])
+            node = next_node
+        self._outputs[node].append((priority, keyword, value))
+        candidate = (priority, value)
+        if self._best[node] is None or priority < self._best[node][0]:
+            self._best[node] = candidate
+
+    def _build(self):
+        """广度优先计算失败指针，并沿失败链合并最优输出"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                inherited = self._best[self._fail[child]]
+                if inherited is not None and (self._best[child] is None or inherited[0] < self._best[child][0]):
+                    self._best[child] = inherited
+                queue.append(child)
+
+    def _step(self, node, char):
+        while node and char not in self._goto[node]:
+            node = self._fail[node]
+        return self._goto[node].get(char, 0)
+
+    def match(self, text: str) -> Optional[Any]:
+        """返回消息中命中的优先级最高的关键词对应的值，未命中返回None"""
+        node = 0
+        best = None
+        for char in text or '':
+            node = self._step(node, char)
+            candidate = self._best[node]
+            if candidate is not None and (best is None or candidate[0] < best[0]):
+                best = candidate
+        return best[1] if best is not None else None
+
+    def find_all(self, text: str) -> List[Tuple[int, str]]:
+        """返回所有命中的 (结束位置, 关键词)，按出现顺序排列"""
+        hits = []
+        node = 0
+        for position, char in enumerate(text or ''):
+            node = self._step(node, char)
+            state = node
+            while state:
+                for _, keyword, _ in self._outputs[state]:
+                    hits.append((position, keyword))
+                state = self._fail[state]
+        return hits
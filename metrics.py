@@ -0,0 +1,173 @@
+"""
+进程内指标
+实现Prometheus文本格式（0.0.4）所需的计数器、直方图和回调型Gauge，并定义AI服务相关指标
+"""
+
+import math
+import threading
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """单调递增计数器"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Histogram:
+    """累积分桶直方图"""
+
+    type_name = 'histogram'
+
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}  # key -> [各桶计数..., 总和, 总数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def collect(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for index, bound in enumerate(self.buckets):
+                cumulative += state[index]
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_value(state[-2])}'
+            yield f'{self.name}_count{labels} {state[-1]}'
+
+
+class CallbackMetric:
+    """抓取时通过回调读取数值，用于暴露其他组件已有的统计（缓存、熔断器等）
+
+    callback 返回数值，或 [(标签值元组, 数值), ...]。
+    """
+
+    def __init__(self, name, documentation, callback, labelnames=(), type_name='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        self.type_name = type_name
+
+    def collect(self):
+        result = self.callback()
+        if not isinstance(result, (list, tuple)):
+            result = [((), result)]
+        for key, value in result:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Registry:
+    """指标注册表"""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """输出Prometheus文本格式"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# AI服务指标
+AI_UPSTREAM_LATENCY = REGISTRY.register(Histogram(
+    'ai_upstream_latency_seconds', 'Latency of upstream LLM calls', ['service_type']))
+AI_UPSTREAM_TTFT = REGISTRY.register(Histogram(
+    'ai_upstream_time_to_first_token_seconds', 'Time to first streamed token from the upstream LLM',
+    ['service_type']))
+AI_UPSTREAM_REQUESTS = REGISTRY.register(Counter(
+    'ai_upstream_requests_total', 'Upstream LLM calls by outcome', ['service_type', 'outcome']))
+AI_PROMPT_TOKENS = REGISTRY.register(Counter(
+    'ai_prompt_tokens_total', 'Prompt tokens reported by upstream usage', ['service_type']))
+AI_COMPLETION_TOKENS = REGISTRY.register(Counter(
+    'ai_completion_tokens_total', 'Completion tokens reported by upstream usage', ['service_type']))
+AI_FALLBACKS = REGISTRY.register(Counter(
+    'ai_fallback_total', 'Replies served by get_simulated_reply, by reason', ['service_type', 'reason']))
+
+# 回退原因
+FALLBACK_NO_KEY = 'no_key'
+FALLBACK_HTTP_ERROR = 'http_error'
+FALLBACK_EXCEPTION = 'exception'
+FALLBACK_BREAKER_OPEN = 'breaker_open'
+
+
+def record_usage(service_type, usage):
+    """记录上游响应中的token用量"""
+    if not usage:
+        return
+    AI_PROMPT_TOKENS.inc(usage.get('prompt_tokens', 0), service_type=service_type)
+    AI_COMPLETION_TOKENS.inc(usage.get('completion_tokens', 0), service_type=service_type)
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+数据库版本化迁移
+已执行的迁移记录在 schema_migrations 表中，每个迁移在独立事务中执行且只执行一次。
+早期 init_db.py 以原始SQL建表，列名与 models.py 不一致（duration_minutes/date 等），
+前几个迁移负责把这类旧库调整为模型定义的结构，新库则直接建表。
+每个迁移只使用显式的DDL，不读取 models.py 的元数据，保证已发布的迁移不随模型变化。
+
+使用方式:
+    python migrations.py            # 执行所有未执行的迁移
+    python migrations.py status     # 查看迁移状态
+"""
+
+import json
+import sys
+
+from sqlalchemy import create_engine, inspect, text
+
+from config import get_config
+from health_metrics import ensure_sample_partitions
+from models import utcnow
+
+# 仅在PostgreSQL上执行的语句（SQLite不校验列类型，也不支持 ALTER COLUMN）
+POSTGRESQL = 'postgresql'
+
+
+def _columns(connection, table):
+    inspector = inspect(connection)
+    if not inspector.has_table(table):
+        return None
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def _add_column(connection, table, column, ddl):
+    columns = _columns(connection, table)
+    if columns is not None and column not in columns:
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+
+def _rename_column(connection, table, old, new):
+    columns = _columns(connection, table)
+    if columns is not None and old in columns and new not in columns:
+        connection.execute(text(f'ALTER TABLE {table} RENAME COLUMN {old} TO {new}'))
+
+
+def _primary_key(connection):
+    """自增整数主键的列定义"""
+    return 'SERIAL PRIMARY KEY' if connection.dialect.name == POSTGRESQL else 'INTEGER PRIMARY KEY'
+
+
+def _create_tables(connection, tables):
+    """按 (表名, 列定义) 依次执行 CREATE TABLE IF NOT EXISTS，列定义中的 {pk} 为自增主键"""
+    for table, columns in tables:
+        ddl = columns.format(pk=_primary_key(connection))
+        connection.execute(text(f'CREATE TABLE IF NOT EXISTS {table} ({ddl})'))
+
+
+def _alter_type(connection, table, column, ddl):
+    if connection.dialect.name == POSTGRESQL:
+        connection.execute(text(f'ALTER TABLE {table} ALTER COLUMN {column} TYPE {ddl}'))
+
+
+def _rename_legacy_table(connection, table, marker_column):
+    """旧版表结构无法原地调整时，整体改名为 <表名>_legacy，数据在后续迁移中转换"""
+    columns = _columns(connection, table)
+    if columns is not None and marker_column in columns:
+        connection.execute(text(f'ALTER TABLE {table} RENAME TO {table}_legacy'))
+        if connection.dialect.name == POSTGRESQL:
+            # 主键索引和SERIAL序列不随表改名，需让出名字给新表
+            connection.execute(text(f'ALTER INDEX IF EXISTS {table}_pkey RENAME TO {table}_legacy_pkey'))
+            connection.execute(text(f'ALTER SEQUENCE IF EXISTS {table}_id_seq RENAME TO {table}_legacy_id_seq'))
+
+
+def reconcile_legacy_schema(connection):
+    """把 init_db.py 旧版原始SQL建出的表调整为模型结构"""
+    # users：档案从 profile JSON 拆分为独立列
+    for column, ddl in (('age', 'INTEGER'), ('gender', 'VARCHAR(10)'), ('height', 'FLOAT'),
+                        ('weight', 'FLOAT'), ('fitness_level', 'VARCHAR(20)'), ('fitness_goals', 'TEXT')):
+        _add_column(connection, 'users', column, ddl)
+
+    # fitness_workouts：duration_minutes -> duration，date -> workout_date
+    workout_columns = _columns(connection, 'fitness_workouts')
+    if workout_columns is not None:
+        _rename_column(connection, 'fitness_workouts', 'duration_minutes', 'duration')
+        if 'date' in workout_columns:
+            _rename_column(connection, 'fitness_workouts', 'date', 'workout_date')
+            _alter_type(connection, 'fitness_workouts', 'workout_date', 'TIMESTAMP')
+        _add_column(connection, 'fitness_workouts', 'exercises', 'TEXT')
+
+    # fitness_goals：补充 unit 列，deadline 改为时间戳
+    goal_columns = _columns(connection, 'fitness_goals')
+    if goal_columns is not None:
+        _add_column(connection, 'fitness_goals', 'unit', 'VARCHAR(20)')
+        _alter_type(connection, 'fitness_goals', 'deadline', 'TIMESTAMP')
+        _alter_type(connection, 'fitness_goals', 'target_value', 'FLOAT')
+        _alter_type(connection, 'fitness_goals', 'current_value', 'FLOAT')
+
+    # training_plans：补充模型中的列
+    _add_column(connection, 'training_plans', 'plan_data', 'TEXT')
+    _add_column(connection, 'training_plans', 'is_active', 'BOOLEAN DEFAULT TRUE')
+
+    # 结构差异过大的表整体改名，数据在 migrate_legacy_data 中转换
+    _rename_legacy_table(connection, 'ai_conversations', 'ai_response')
+    _rename_legacy_table(connection, 'health_data', 'heart_rate')
+
+
+# 基线版本的表结构；之后新增的表由各自的迁移创建
+BASELINE_TABLES = (
+    ('users',
+     'id {pk}, username VARCHAR(80) NOT NULL UNIQUE, email VARCHAR(120) NOT NULL UNIQUE, '
+     'password_hash VARCHAR(255) NOT NULL, created_at TIMESTAMP, updated_at TIMESTAMP, '
+     'age INTEGER, gender VARCHAR(10), height FLOAT, weight FLOAT, fitness_level VARCHAR(20), fitness_goals TEXT'),
+    ('health_data',
+     'id {pk}, user_id INTEGER NOT NULL REFERENCES users(id), data_type VARCHAR(50) NOT NULL, '
+     'value TEXT, recorded_at TIMESTAMP NOT NULL, created_at TIMESTAMP'),
+    ('fitness_workouts',
+     'id {pk}, user_id INTEGER NOT NULL REFERENCES users(id), workout_type VARCHAR(50) NOT NULL, '
+     'duration INTEGER, calories_burned INTEGER, exercises TEXT, notes TEXT, '
+     'workout_date TIMESTAMP NOT NULL, created_at TIMESTAMP'),
+    ('fitness_goals',
+     'id {pk}, user_id INTEGER NOT NULL REFERENCES users(id), goal_type VARCHAR(50) NOT NULL, '
+     'target_value FLOAT, current_value FLOAT, unit VARCHAR(20), deadline TIMESTAMP, status VARCHAR(20), '
+     'created_at TIMESTAMP, updated_at TIMESTAMP'),
+    ('ai_conversations',
+     'id {pk}, user_id INTEGER NOT NULL REFERENCES users(id), ai_type VARCHAR(50) NOT NULL, '
+     'message TEXT NOT NULL, sender VARCHAR(20) NOT NULL, seq INTEGER, timestamp TIMESTAMP, '
+     'message_type VARCHAR(20), metadata TEXT'),
+    ('training_plans',
+     'id {pk}, user_id INTEGER NOT NULL REFERENCES users(id), plan_name VARCHAR(100) NOT NULL, '
+     'plan_data TEXT, is_active BOOLEAN, created_at TIMESTAMP, updated_at TIMESTAMP'),
+    ('exercises',
+     'id {pk}, name VARCHAR(100) NOT NULL, category VARCHAR(50), muscle_group VARCHAR(100), '
+     'difficulty VARCHAR(20), description TEXT, instructions TEXT, image_url VARCHAR(255), '
+     'video_url VARCHAR(255), created_at TIMESTAMP'),
+)
+
+
+def create_model_tables(connection):
+    """创建尚不存在的基线表"""
+    _create_tables(connection, BASELINE_TABLES)
+
+
+def migrate_legacy_data(connection):
+    """把旧版表中的数据转换到模型结构"""
+    # users.profile -> 独立列
+    user_columns = _columns(connection, 'users') or set()
+    if 'profile' in user_columns:
+        rows = connection.execute(text('SELECT id, profile FROM users WHERE profile IS NOT NULL')).all()
+        for user_id, profile in rows:
+            if isinstance(profile, str):
+                profile = json.loads(profile or '{}')
+            profile = profile or {}
+            connection.execute(text(
+                'UPDATE users SET age = :age, gender = :gender, height = :height, weight = :weight, '
+                'fitness_level = :fitness_level, fitness_goals = :fitness_goals WHERE id = :id'
+            ), {
+                'id': user_id,
+                'age': profile.get('age'),
+                'gender': profile.get('gender'),
+                'height': profile.get('height'),
+                'weight': profile.get('weight'),
+                'fitness_level': profile.get('fitness_level'),
+                'fitness_goals': json.dumps(profile.get('goals', []), ensure_ascii=False)
+            })
+
+    # 旧版每行一问一答，拆为用户消息和AI回复两行，seq按时间顺序编号
+    if _columns(connection, 'ai_conversations_legacy') is not None:
+        for sender, column, offset in (('user', 'user_message', 1), ('ai', 'ai_response', 0)):
+            connection.execute(text(
+                f'INSERT INTO ai_conversations (user_id, ai_type, message, sender, seq, timestamp, message_type) '
+                f'SELECT user_id, \'fitness_trainer\', {column}, \'{sender}\', '
+                f'ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at, id) * 2 - {offset}, '
+                f'created_at, \'text\' FROM ai_conversations_legacy WHERE user_id IS NOT NULL'
+            ))
+
+    # 旧版体征数据每行多列，转为 data_type='vitals' 的JSON值
+    if _columns(connection, 'health_data_legacy') is not None:
+        rows = connection.execute(text(
+            'SELECT user_id, weight, height, bmi, heart_rate, blood_pressure, notes, recorded_at '
+            'FROM health_data_legacy WHERE user_id IS NOT NULL'
+        )).mappings().all()
+        values = []
+        for row in rows:
+            value = {key: row[key] for key in ('weight', 'height', 'bmi', 'heart_rate', 'blood_pressure', 'notes')
+                     if row[key] is not None}
+            values.append({
+                'user_id': row['user_id'],
+                'data_type': 'vitals',
+                'value': json.dumps(value, ensure_ascii=False, default=float),
+                'recorded_at': row['recorded_at'] or utcnow(),
+                'created_at': utcnow()
+            })
+        if values:
+            connection.execute(text(
+                'INSERT INTO health_data (user_id, data_type, value, recorded_at, created_at) '
+                'VALUES (:user_id, :data_type, :value, :recorded_at, :created_at)'
+            ), values)
+
+
+def create_hot_path_indexes(connection):
+    """按用户维度查询的复合索引，使按用户读取变为索引范围扫描"""
+    statements = [
+        # 运动记录按 (workout_date, id) 倒序键集分页，类型筛选走第二个索引
+        'CREATE INDEX IF NOT EXISTS ix_fitness_workouts_user_date_id '
+        'ON fitness_workouts (user_id, workout_date DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS ix_fitness_workouts_user_type_date '
+        'ON fitness_workouts (user_id, workout_type, workout_date DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS ix_fitness_goals_user_status ON fitness_goals (user_id, status)',
+        'CREATE INDEX IF NOT EXISTS ix_ai_conversations_user_type_time ON ai_conversations (user_id, ai_type, timestamp)',
+        # 对话历史分页按 seq 读取（见 DatabaseSpillStorage），seq 在同一对话内唯一
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_ai_conversations_user_type_seq ON ai_conversations (user_id, ai_type, seq)',
+        'CREATE INDEX IF NOT EXISTS ix_health_data_user_type_time ON health_data (user_id, data_type, recorded_at)'
+    ]
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+def create_health_metric_tables(connection):
+    """健康指标时序表；PostgreSQL上采样表按 recorded_at 按月做范围分区"""
+    if connection.dialect.name == POSTGRESQL:
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS health_metric_samples ('
+            ' user_id INTEGER NOT NULL REFERENCES users(id),'
+            ' metric VARCHAR(30) NOT NULL,'
+            ' recorded_at TIMESTAMP NOT NULL,'
+            ' value DOUBLE PRECISION NOT NULL,'
+            ' created_at TIMESTAMP,'
+            ' PRIMARY KEY (user_id, metric, recorded_at)'
+            ') PARTITION BY RANGE (recorded_at)'
+        ))
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS health_metric_samples_default PARTITION OF health_metric_samples DEFAULT'
+        ))
+        ensure_sample_partitions(connection)
+    else:
+        _create_tables(connection, [(
+            'health_metric_samples',
+            'user_id INTEGER NOT NULL REFERENCES users(id), metric VARCHAR(30) NOT NULL, '
+            'recorded_at TIMESTAMP NOT NULL, value FLOAT NOT NULL, created_at TIMESTAMP, '
+            'PRIMARY KEY (user_id, metric, recorded_at)'
+        )])
+    _create_tables(connection, [(
+        'health_metric_rollups',
+        'user_id INTEGER NOT NULL REFERENCES users(id), metric VARCHAR(30) NOT NULL, '
+        'resolution VARCHAR(10) NOT NULL, bucket_start TIMESTAMP NOT NULL, min_value FLOAT NOT NULL, '
+        'max_value FLOAT NOT NULL, sum_value FLOAT NOT NULL, count INTEGER NOT NULL, '
+        'PRIMARY KEY (user_id, metric, resolution, bucket_start)'
+    )])
+
+
+def create_fitness_aggregates(connection):
+    """按用户的运动汇总表，并按现有运动记录回填"""
+    _create_tables(connection, [(
+        'fitness_aggregates',
+        'user_id INTEGER NOT NULL REFERENCES users(id), total_workouts INTEGER NOT NULL, '
+        'total_calories INTEGER NOT NULL, total_duration INTEGER NOT NULL, updated_at TIMESTAMP, '
+        'PRIMARY KEY (user_id)'
+    )])
+    connection.execute(text(
+        'INSERT INTO fitness_aggregates (user_id, total_workouts, total_calories, total_duration, updated_at) '
+        'SELECT w.user_id, COUNT(*), COALESCE(SUM(w.calories_burned), 0), COALESCE(SUM(w.duration), 0), :now '
+        'FROM fitness_workouts w WHERE w.user_id IS NOT NULL '
+        'AND NOT EXISTS (SELECT 1 FROM fitness_aggregates a WHERE a.user_id = w.user_id) '
+        'GROUP BY w.user_id'
+    ), {'now': utcnow()})
+
+
+def create_conversation_sequences(connection):
+    """对话消息序号计数器；首次分配时按 ai_conversations 中已有的最大 seq 初始化，无需回填"""
+    _create_tables(connection, [(
+        'ai_conversation_sequences',
+        'user_id INTEGER NOT NULL REFERENCES users(id), ai_type VARCHAR(50) NOT NULL, '
+        'last_seq INTEGER NOT NULL, PRIMARY KEY (user_id, ai_type)'
+    )])
+
+
+# (版本号, 说明, 迁移函数)；只能在末尾追加，已发布的迁移不得修改
+MIGRATIONS = [
+    (1, 'reconcile legacy init_db schema with models', reconcile_legacy_schema),
+    (2, 'create model tables', create_model_tables),
+    (3, 'migrate legacy rows', migrate_legacy_data),
+    (4, 'hot-path composite indexes', create_hot_path_indexes),
+    (5, 'health metric time series and rollups', create_health_metric_tables),
+    (6, 'per-user fitness aggregates', create_fitness_aggregates),
+    (7, 'conversation sequence counters', create_conversation_sequences),
+]
+
+
+def _ensure_migrations_table(engine):
+    with engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            ' version INTEGER PRIMARY KEY,'
+            ' description VARCHAR(255) NOT NULL,'
+            ' applied_at TIMESTAMP NOT NULL)'
+        ))
+
+
+def applied_versions(engine):
+    _ensure_migrations_table(engine)
+    with engine.connect() as connection:
+        return {row[0] for row in connection.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def run_migrations(engine, verbose=True):
+    """执行所有未执行的迁移，返回本次执行的版本号列表"""
+    done = applied_versions(engine)
+    executed = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        if verbose:
+            print(f"执行迁移 {version}: {description}")
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(text(
+                'INSERT INTO schema_migrations (version, description, applied_at) '
+                'VALUES (:version, :description, :applied_at)'
+            ), {'version': version, 'description': description, 'applied_at': utcnow()})
+        executed.append(version)
+    return executed
+
+
+def print_status(engine):
+    done = applied_versions(engine)
+    for version, description, _ in MIGRATIONS:
+        print(f"[{'x' if version in done else ' '}] {version}: {description}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    engine = create_engine(get_config().DATABASE_URL)
+    if argv and argv[0] == 'status':
+        print_status(engine)
+        return
+    executed = run_migrations(engine)
+    print(f"迁移完成，本次执行 {len(executed)} 个" if executed else "数据库已是最新版本")
+
+
+if __name__ == '__main__':
+    main()
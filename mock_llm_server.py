@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+本地模拟LLM服务
+实现与DeepSeek/OpenAI兼容的 /chat/completions 接口（含流式），用于离线压测整条对话链路。
+延迟分布、错误率、限流率和生成速度均可配置。
+
+使用方式:
+    python mock_llm_server.py --port 8008 --latency-dist lognormal --latency-ms 800 --error-rate 0.02
+    然后设置 OPENAI_BASE_URL=http://127.0.0.1:8008/v1、OPENAI_API_KEY=任意非空值 并启动后端
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 生成回复时循环使用的文本片段（每个片段视为一个token）
+SAMPLE_TOKENS = [
+    '根据', '您的', '情况', '，', '建议', '每周', '进行', '3', '次', '力量', '训练', '，',
+    '配合', '适量', '有氧', '运动', '，', '并', '保证', '充足', '的', '蛋白质', '摄入', '。'
+]
+
+
+class LatencyModel:
+    """首token延迟（毫秒）的分布模型"""
+
+    def __init__(self, dist, mean_ms, spread_ms):
+        self.dist = dist
+        self.mean_ms = mean_ms
+        self.spread_ms = spread_ms
+
+    def sample(self):
+        """返回一次采样的延迟秒数"""
+        mean, spread = self.mean_ms, self.spread_ms
+        if self.dist == 'fixed':
+            value = mean
+        elif self.dist == 'uniform':
+            value = random.uniform(mean - spread, mean + spread)
+        elif self.dist == 'normal':
+            value = random.gauss(mean, spread)
+        elif self.dist == 'exponential':
+            value = random.expovariate(1.0 / mean) if mean > 0 else 0
+        else:  # lognormal：均值为mean、标准差为spread的对数正态分布，适合模拟长尾
+            variance = math.log(1 + (spread / mean) ** 2) if mean > 0 else 0
+            mu = math.log(mean) - variance / 2 if mean > 0 else 0
+            value = random.lognormvariate(mu, math.sqrt(variance)) if mean > 0 else 0
+        return max(value, 0) / 1000.0
+
+
+class MockStats:
+    """请求统计"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.streams = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'streams': self.streams,
+                'errors': self.errors,
+                'rate_limited': self.rate_limited
+            }
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """/chat/completions 请求处理"""
+
+    protocol_version = 'HTTP/1.1'  # 支持keep-alive，与真实上游一致
+    server_version = 'MockLLM/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.options.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ('/health', '/stats'):
+            self._send_json(200, {'status': 'ok', **self.server.stats.snapshot()})
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        # 先读完请求体，否则同一keep-alive连接上的下一个请求会从残留的请求体开始解析
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length)
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        try:
+            body = json.loads(raw or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON body'}})
+            return
+
+        options = self.server.options
+        stats = self.server.stats
+        stream = bool(body.get('stream'))
+        with stats.lock:
+            stats.requests += 1
+            stats.streams += int(stream)
+
+        # 首token延迟
+        time.sleep(self.server.latency.sample())
+
+        roll = random.random()
+        if roll < options.rate_limit_rate:
+            with stats.lock:
+                stats.rate_limited += 1
+            self._send_json(429, {'error': {'message': 'Rate limit exceeded', 'type': 'rate_limit'}},
+                            extra_headers={'Retry-After': str(options.retry_after)})
+            return
+        if roll < options.rate_limit_rate + options.error_rate:
+            with stats.lock:
+                stats.errors += 1
+            self._send_json(500, {'error': {'message': 'Mock upstream error', 'type': 'server_error'}})
+            return
+
+        completion_tokens = min(options.completion_tokens, int(body.get('max_tokens') or options.completion_tokens))
+        prompt_tokens = sum(len(m.get('content', '')) for m in body.get('messages', []))
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+        tokens = [SAMPLE_TOKENS[i % len(SAMPLE_TOKENS)] for i in range(completion_tokens)]
+        completion_id = f'chatcmpl-{uuid.uuid4().hex[:24]}'
+        model = body.get('model', 'mock-model')
+
+        if stream:
+            include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+            self._send_stream(completion_id, model, tokens, usage if include_usage else None)
+        else:
+            # 非流式：等待整段生成完成后一次性返回
+            if options.tokens_per_second > 0:
+                time.sleep(completion_tokens / options.tokens_per_second)
+            self._send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                    'finish_reason': 'stop'
+                }],
+                'usage': usage
+            })
+
+    def _send_json(self, status, payload, extra_headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def _send_stream(self, completion_id, model, tokens, usage):
+        """以SSE + chunked传输逐token输出"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        interval = 1.0 / self.server.options.tokens_per_second if self.server.options.tokens_per_second > 0 else 0
+        created = int(time.time())
+
+        def event(delta, finish_reason=None, chunk_usage=None):
+            payload = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [] if chunk_usage else [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }
+            if chunk_usage:
+                payload['usage'] = chunk_usage
+            return f'data: {json.dumps(payload, ensure_ascii=False)}\n\n'
+
+        try:
+            self._write_chunk(event({'role': 'assistant', 'content': ''}))
+            for index, token in enumerate(tokens):
+                if index and interval:
+                    time.sleep(interval)
+                self._write_chunk(event({'content': token}))
+            self._write_chunk(event({}, finish_reason='stop'))
+            if usage:
+                self._write_chunk(event({}, chunk_usage=usage))
+            self._write_chunk('data: [DONE]\n\n')
+            self.wfile.write(b'0\r\n\r\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开
+            self.close_connection = True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='本地模拟LLM服务（/chat/completions）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8008)
+    parser.add_argument('--latency-dist', default='lognormal',
+                        choices=['fixed', 'uniform', 'normal', 'exponential', 'lognormal'],
+                        help='首token延迟分布')
+    parser.add_argument('--latency-ms', type=float, default=600, help='首token延迟均值（毫秒）')
+    parser.add_argument('--latency-spread-ms', type=float, default=300,
+                        help='延迟离散程度：uniform为半宽，normal/lognormal为标准差（毫秒）')
+    parser.add_argument('--tokens-per-second', type=float, default=50, help='生成速度，0表示立即返回')
+    parser.add_argument('--completion-tokens', type=int, default=120, help='每次回复的token数上限')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回500的概率')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='返回429的概率')
+    parser.add_argument('--retry-after', type=int, default=1, help='429响应的Retry-After秒数')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子，便于复现')
+    parser.add_argument('--verbose', action='store_true', help='打印每个请求的访问日志')
+    return parser.parse_args(argv)
+
+
+def create_server(options):
+    """创建模拟服务（不启动）"""
+    server = ThreadingHTTPServer((options.host, options.port), MockLLMHandler)
+    server.daemon_threads = True
+    server.options = options
+    server.stats = MockStats()
+    server.latency = LatencyModel(options.latency_dist, options.latency_ms, options.latency_spread_ms)
+    return server
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    if options.seed is not None:
+        random.seed(options.seed)
+
+    server = create_server(options)
+    print(f"模拟LLM服务已启动: http://{options.host}:{options.port}/v1/chat/completions")
+    print(f"延迟分布: {options.latency_dist} ({options.latency_ms}ms ± {options.latency_spread_ms}ms), "
+          f"生成速度: {options.tokens_per_second} tokens/s, "
+          f"错误率: {options.error_rate}, 限流率: {options.rate_limit_rate}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"统计: {server.stats.snapshot()}")
+
+
+if __name__ == '__main__':
+    main()
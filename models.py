@@ -1,9 +1,22 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timezone
+from operator import attrgetter
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 db = SQLAlchemy()
 
+def utcnow():
+    """当前UTC时间（不带时区，与各DateTime列的存储约定一致），替代已弃用的 datetime.utcnow()"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class JSONText(db.Text):
+    """以文本存储的JSON列（DDL与 Text 相同），序列化器按此类型解码"""
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -11,8 +24,8 @@ class User(db.Model):
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
     
     # 用户档案信息
     age = db.Column(db.Integer)
@@ -20,12 +33,13 @@ class User(db.Model):
     height = db.Column(db.Float)  # 厘米
     weight = db.Column(db.Float)  # 公斤
     fitness_level = db.Column(db.String(20))  # beginner, intermediate, advanced
-    fitness_goals = db.Column(db.Text)  # JSON格式存储目标
+    fitness_goals = db.Column(JSONText)  # JSON格式存储目标
     
     # 关系
     health_data = db.relationship('HealthData', backref='user', lazy=True)
     fitness_workouts = db.relationship('FitnessWorkout', backref='user', lazy=True)
-    fitness_goals = db.relationship('FitnessGoal', backref='user', lazy=True)
+    # 与 fitness_goals 列同名会覆盖该列，关系命名为 goals
+    goals = db.relationship('FitnessGoal', backref='user', lazy=True)
     ai_conversations = db.relationship('AIConversation', backref='user', lazy=True)
 
 class HealthData(db.Model):
@@ -34,9 +48,38 @@ class HealthData(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     data_type = db.Column(db.String(50), nullable=False)  # sleep, exercise, nutrition, etc.
-    value = db.Column(db.Text)  # JSON格式存储数据值
+    value = db.Column(JSONText)  # JSON格式存储数据值
     recorded_at = db.Column(db.DateTime, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    
+    # 索引与 migrations.py 中的定义保持一致
+    __table_args__ = (
+        db.Index('ix_health_data_user_type_time', 'user_id', 'data_type', 'recorded_at'),
+    )
+
+class HealthMetricSample(db.Model):
+    """健康指标原始采样（时序数据，PostgreSQL上按 recorded_at 按月分区，见 migrations.py）"""
+    __tablename__ = 'health_metric_samples'
+    
+    # 主键包含分区键；同一指标同一时刻的重复上报只保留一条
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    metric = db.Column(db.String(30), primary_key=True)  # heart_rate, weight, sleep, steps
+    recorded_at = db.Column(db.DateTime, primary_key=True)
+    value = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=utcnow)
+
+class HealthMetricRollup(db.Model):
+    """健康指标按分钟/小时/天的预聚合（随采样写入增量更新）"""
+    __tablename__ = 'health_metric_rollups'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    metric = db.Column(db.String(30), primary_key=True)
+    resolution = db.Column(db.String(10), primary_key=True)  # minute, hour, day
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    sum_value = db.Column(db.Float, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
 
 class FitnessWorkout(db.Model):
     __tablename__ = 'fitness_workouts'
@@ -46,10 +89,26 @@ class FitnessWorkout(db.Model):
     workout_type = db.Column(db.String(50), nullable=False)  # strength, cardio, flexibility
     duration = db.Column(db.Integer)  # 分钟
     calories_burned = db.Column(db.Integer)
-    exercises = db.Column(db.Text)  # JSON格式存储练习列表
+    exercises = db.Column(JSONText)  # JSON格式存储练习列表
     notes = db.Column(db.Text)
     workout_date = db.Column(db.DateTime, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    
+    __table_args__ = (
+        # 键集分页按 (workout_date, id) 倒序读取，类型筛选走第二个索引
+        db.Index('ix_fitness_workouts_user_date_id', 'user_id', workout_date.desc(), id.desc()),
+        db.Index('ix_fitness_workouts_user_type_date', 'user_id', 'workout_type', workout_date.desc(), id.desc()),
+    )
+
+class FitnessAggregate(db.Model):
+    """用户运动记录的汇总（随运动记录的增删改增量更新，见 repositories.FitnessAggregateRepository）"""
+    __tablename__ = 'fitness_aggregates'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    total_workouts = db.Column(db.Integer, nullable=False, default=0)
+    total_calories = db.Column(db.Integer, nullable=False, default=0)
+    total_duration = db.Column(db.Integer, nullable=False, default=0)  # 分钟
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
 
 class FitnessGoal(db.Model):
     __tablename__ = 'fitness_goals'
@@ -62,8 +121,12 @@ class FitnessGoal(db.Model):
     unit = db.Column(db.String(20))  # kg, %, etc.
     deadline = db.Column(db.DateTime)
     status = db.Column(db.String(20), default='active')  # active, completed, cancelled
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_fitness_goals_user_status', 'user_id', 'status'),
+    )
 
 class AIConversation(db.Model):
     __tablename__ = 'ai_conversations'
@@ -73,11 +136,27 @@ class AIConversation(db.Model):
     ai_type = db.Column(db.String(50), nullable=False)  # fitness_trainer, nutritionist, etc.
     message = db.Column(db.Text, nullable=False)
     sender = db.Column(db.String(20), nullable=False)  # user, ai
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    seq = db.Column(db.Integer)  # 同一用户、同一AI类型内的消息序号（即接口返回的消息id）
+    timestamp = db.Column(db.DateTime, default=utcnow)
     
     # 消息元数据
     message_type = db.Column(db.String(20), default='text')  # text, image, workout_data
-    metadata = db.Column(db.Text)  # JSON格式存储额外信息
+    # metadata 是SQLAlchemy声明式模型的保留属性名，列名保持不变
+    message_metadata = db.Column('metadata', JSONText)  # JSON格式存储额外信息
+    
+    __table_args__ = (
+        db.Index('ix_ai_conversations_user_type_time', 'user_id', 'ai_type', 'timestamp'),
+        # seq 由 ai_conversation_sequences 分配，唯一约束防止重复序号破坏游标分页
+        db.Index('ix_ai_conversations_user_type_seq', 'user_id', 'ai_type', 'seq', unique=True),
+    )
+
+class AIConversationSequence(db.Model):
+    """每个用户、每种AI服务的消息序号计数器（见 conversation_persistence.DatabaseSpillStorage.reserve_ids）"""
+    __tablename__ = 'ai_conversation_sequences'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    ai_type = db.Column(db.String(50), primary_key=True)
+    last_seq = db.Column(db.Integer, nullable=False)
 
 class TrainingPlan(db.Model):
     __tablename__ = 'training_plans'
@@ -85,10 +164,10 @@ class TrainingPlan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     plan_name = db.Column(db.String(100), nullable=False)
-    plan_data = db.Column(db.Text)  # JSON格式存储训练计划
+    plan_data = db.Column(JSONText)  # JSON格式存储训练计划
     is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
 
 class Exercise(db.Model):
     __tablename__ = 'exercises'
@@ -102,29 +181,91 @@ class Exercise(db.Model):
     instructions = db.Column(db.Text)
     image_url = db.Column(db.String(255))
     video_url = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=utcnow)
 
 # 辅助函数
+def _isoformat(value):
+    return value.isoformat()
+
+def _json_decoder(default, has_default):
+    """JSON列解码；空文本视为缺失（指定了默认值时返回默认值），无法解析时返回默认值，默认值为None时保留原文本"""
+    def decode(value):
+        if not value and has_default:
+            return default() if callable(default) else default
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value if default is None else (default() if callable(default) else default)
+    return decode
+
+def json_bytes(obj):
+    """序列化为UTF-8 JSON字节串（安装 orjson 时使用 orjson）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+class ModelSerializer:
+    """按模型类预编译的序列化器
+
+    fields: 输出的属性名及顺序（默认全部列，按定义顺序）
+    aliases: 属性名 -> 输出键（默认为列名）
+    defaults: 属性名 -> 值为None（JSON列为空或无法解析）时的默认值，可调用对象作为工厂（如 list）
+    JSONText 列解码为对象，DateTime 列输出ISO字符串。
+    """
+
+    def __init__(self, model_class, fields=None, aliases=None, defaults=None):
+        self.model_class = model_class
+        self._options = (fields, aliases or {}, defaults or {})
+        self._fields = None
+        self._getter = None
+
+    def _compile(self):
+        fields, aliases, defaults = self._options
+        columns = {attr.key: attr.columns[0] for attr in self.model_class.__mapper__.column_attrs}
+        keys = list(fields or columns)
+        compiled = []
+        for key in keys:
+            column = columns[key]
+            default = defaults.get(key)
+            if isinstance(column.type, JSONText):
+                convert = _json_decoder(default, key in defaults)
+            elif isinstance(column.type, db.DateTime):
+                convert = _isoformat
+            else:
+                convert = None
+            compiled.append((aliases.get(key, column.name), convert, default, callable(default)))
+        getter = attrgetter(*keys)
+        # 单个字段时 attrgetter 不返回元组
+        self._getter = getter if len(keys) > 1 else lambda obj: (getter(obj),)
+        self._fields = tuple(compiled)
+
+    def __call__(self, obj):
+        if self._fields is None:
+            self._compile()
+        result = {}
+        for (name, convert, default, factory), value in zip(self._fields, self._getter(obj)):
+            if value is None:
+                value = default() if factory else default
+            elif convert is not None:
+                value = convert(value)
+            result[name] = value
+        return result
+
+    def many(self, rows):
+        return [self(row) for row in rows]
+
+_serializers = {}
+
+def serializer_for(model_class):
+    """模型类的默认序列化器（全部列，输出列名），每个类只编译一次"""
+    serializer = _serializers.get(model_class)
+    if serializer is None:
+        # 只在首次遇到该类时创建；并发时重复创建也无妨，结果相同
+        serializer = _serializers[model_class] = ModelSerializer(model_class)
+    return serializer
+
 def serialize_model(model):
     """将SQLAlchemy模型转换为字典"""
     if model is None:
         return None
-    
-    result = {}
-    for column in model.__table__.columns:
-        value = getattr(model, column.name)
-        
-        # 处理JSON字段
-        if column.name in ['fitness_goals', 'exercises', 'value', 'plan_data', 'metadata'] and value:
-            try:
-                value = json.loads(value)
-            except:
-                pass
-        
-        # 处理日期时间
-        if isinstance(value, datetime):
-            value = value.isoformat()
-        
-        result[column.name] = value
-    
-    return result
\ No newline at end of file
+    return serializer_for(type(model))(model)
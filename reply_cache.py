@@ -0,0 +1,92 @@
+"""
+AI回复缓存
+按 (服务类型, 系统提示词版本, 归一化消息, 上下文摘要) 缓存上游AI回复，LRU容量上限 + 单条目TTL
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# 归一化时去掉的首尾标点
+_TRIM_CHARS = ' \t\r\n。，！？、,.!?~～'
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_message(message):
+    """归一化用户消息：全半角统一、小写、合并空白、去掉首尾标点"""
+    text = unicodedata.normalize('NFKC', message or '').lower()
+    text = _WHITESPACE_RE.sub(' ', text)
+    return text.strip(_TRIM_CHARS)
+
+
+def context_digest(context):
+    """历史上下文的摘要；无上下文时为None"""
+    if not context:
+        return None
+    payload = json.dumps(context, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class ReplyCache:
+    """线程安全的LRU + TTL回复缓存"""
+
+    def __init__(self, max_size=1024, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (过期时间, 回复)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(service_type, prompt_version, message, context=None):
+        """生成缓存键；带历史上下文时计入上下文摘要，只有上下文相同的请求才共享回复"""
+        return (service_type, prompt_version, normalize_message(message), context_digest(context))
+
+    def get(self, key):
+        """查询缓存，未命中或已过期返回None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, reply):
+        """写入缓存，超过容量时淘汰最久未使用的条目"""
+        if self.max_size <= 0 or not reply:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存，返回被清除的条目数"""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
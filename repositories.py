@@ -0,0 +1,445 @@
+"""
+数据访问层
+在 models.py 的模型之上封装用户、运动记录（及其汇总）、健身目标的读写，
+接口返回与原内存数据结构一致的字典，路由层不直接操作模型。
+会话使用 Flask-SQLAlchemy 的 db.session（按请求作用域，请求结束时自动移除）。
+"""
+
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from config import Config
+from models import db, utcnow, ModelSerializer, User, FitnessAggregate, FitnessWorkout, FitnessGoal
+
+# User 表中直接对应的档案字段（goals 存放在 fitness_goals 列中）
+PROFILE_FIELDS = ('age', 'gender', 'height', 'weight', 'fitness_level')
+
+
+def engine_options(database_url=None) -> Dict:
+    """根据配置生成 SQLALCHEMY_ENGINE_OPTIONS"""
+    options = {
+        'pool_pre_ping': Config.DB_POOL_PRE_PING,
+        'pool_recycle': Config.DB_POOL_RECYCLE
+    }
+    # SQLite（开发环境）不使用连接池大小相关参数
+    if not (database_url or Config.DATABASE_URL).startswith('sqlite'):
+        options.update({
+            'pool_size': Config.DB_POOL_SIZE,
+            'max_overflow': Config.DB_MAX_OVERFLOW,
+            'pool_timeout': Config.DB_POOL_TIMEOUT
+        })
+    return options
+
+
+def hash_password(password: str) -> str:
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def _commit():
+    """提交当前会话，失败时回滚后抛出"""
+    try:
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+
+
+def _load_json(value, default):
+    if not value:
+        return default
+    try:
+        return json.loads(value)
+    except ValueError:
+        return default
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _calories(value) -> int:
+    """calories_burned 列为整数"""
+    return int(round(float(value or 0)))
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def encode_cursor(workout_date: datetime, workout_id: int) -> str:
+    """把分页位置编码为不透明的游标字符串"""
+    raw = json.dumps([workout_date.isoformat(), workout_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        workout_date, workout_id = json.loads(raw)
+        return datetime.fromisoformat(workout_date), int(workout_id)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+
+class UserRepository:
+    """用户数据"""
+
+    @staticmethod
+    def get(username) -> Optional[User]:
+        return db.session.execute(select(User).where(User.username == username)).scalar_one_or_none()
+
+    @staticmethod
+    def get_id(username) -> Optional[int]:
+        return db.session.execute(select(User.id).where(User.username == username)).scalar_one_or_none()
+
+    @staticmethod
+    def version(username):
+        """档案的数据版本（最近更新时间），用于ETag；用户不存在时返回None"""
+        return db.session.execute(select(User.updated_at).where(User.username == username)).scalar_one_or_none()
+
+    @staticmethod
+    def email_in_use(email, exclude_username=None) -> bool:
+        query = select(User.id).where(User.email == email)
+        if exclude_username is not None:
+            query = query.where(User.username != exclude_username)
+        return db.session.execute(query.limit(1)).first() is not None
+
+    @staticmethod
+    def create(username, email, password, profile=None) -> User:
+        user = User(username=username, email=email, password_hash=hash_password(password))
+        UserRepository._apply_profile(user, profile or {})
+        db.session.add(user)
+        _commit()
+        return user
+
+    @staticmethod
+    def verify_password(user: User, password) -> bool:
+        return user is not None and user.password_hash == hash_password(password)
+
+    @staticmethod
+    def set_password(user: User, password):
+        user.password_hash = hash_password(password)
+        _commit()
+
+    @staticmethod
+    def update(user: User, email=None, profile=None):
+        """更新邮箱和档案；档案按字段合并"""
+        if email is not None:
+            user.email = email
+        if profile:
+            UserRepository._apply_profile(user, profile)
+        _commit()
+
+    @staticmethod
+    def _apply_profile(user: User, profile: Dict):
+        for field in PROFILE_FIELDS:
+            if field in profile:
+                setattr(user, field, profile[field])
+        if 'goals' in profile:
+            user.fitness_goals = json.dumps(profile['goals'], ensure_ascii=False)
+
+    @staticmethod
+    def profile(user: User) -> Dict:
+        """用户档案字典（与原 users_db 中的 profile 结构一致）"""
+        if user is None:
+            return {}
+        profile = {field: getattr(user, field) for field in PROFILE_FIELDS if getattr(user, field) is not None}
+        profile['goals'] = _load_json(user.fitness_goals, [])
+        return profile
+
+    @staticmethod
+    def to_dict(user: User) -> Dict:
+        return {
+            'username': user.username,
+            'email': user.email,
+            'profile': UserRepository.profile(user),
+            'created_at': _isoformat(user.created_at),
+            'updated_at': _isoformat(user.updated_at)
+        }
+
+
+# 接口输出格式的序列化器（字段顺序与原字典一致）
+WORKOUT_SERIALIZER = ModelSerializer(
+    FitnessWorkout,
+    fields=['id', 'workout_type', 'duration', 'calories_burned', 'exercises', 'notes', 'workout_date'],
+    aliases={'workout_type': 'type'},
+    defaults={'calories_burned': 0, 'exercises': list, 'notes': ''}
+)
+
+GOAL_SERIALIZER = ModelSerializer(
+    FitnessGoal,
+    fields=['id', 'goal_type', 'target_value', 'current_value', 'unit', 'deadline', 'status', 'created_at'],
+    aliases={'goal_type': 'type', 'target_value': 'target', 'current_value': 'current'},
+    defaults={'current_value': 0, 'unit': ''}
+)
+
+
+class WorkoutRepository:
+    """运动记录"""
+
+    @staticmethod
+    def to_dict(workout: FitnessWorkout) -> Dict:
+        return WORKOUT_SERIALIZER(workout)
+
+    @staticmethod
+    def list(user_id, limit=10, offset=0) -> Tuple[List[Dict], int]:
+        """按记录顺序分页，返回 (运动记录列表, 总数)"""
+        if user_id is None:
+            return [], 0
+        total = db.session.execute(
+            select(func.count()).select_from(FitnessWorkout).where(FitnessWorkout.user_id == user_id)
+        ).scalar()
+        workouts = db.session.execute(
+            select(FitnessWorkout).where(FitnessWorkout.user_id == user_id)
+            .order_by(FitnessWorkout.id).limit(limit).offset(offset)
+        ).scalars()
+        return WORKOUT_SERIALIZER.many(workouts), total
+
+    @staticmethod
+    def page(user_id, limit=10, cursor=None, date_from=None, date_to=None,
+             workout_type=None) -> Tuple[List[Dict], Optional[str]]:
+        """按 (workout_date, id) 倒序的键集分页，返回 (运动记录列表, 下一页游标)
+
+        date_from 含、date_to 不含；每一页都是一次从游标位置开始的索引范围扫描，与页码无关。
+        """
+        if user_id is None:
+            return [], None
+        query = select(FitnessWorkout).where(FitnessWorkout.user_id == user_id)
+        if workout_type:
+            query = query.where(FitnessWorkout.workout_type == workout_type)
+        if date_from is not None:
+            query = query.where(FitnessWorkout.workout_date >= date_from)
+        if date_to is not None:
+            query = query.where(FitnessWorkout.workout_date < date_to)
+        if cursor is not None:
+            query = query.where(tuple_(FitnessWorkout.workout_date, FitnessWorkout.id) < tuple_(*cursor))
+        workouts = list(db.session.execute(
+            query.order_by(FitnessWorkout.workout_date.desc(), FitnessWorkout.id.desc()).limit(limit + 1)
+        ).scalars())
+
+        next_cursor = None
+        if len(workouts) > limit:
+            workouts = workouts[:limit]
+            next_cursor = encode_cursor(workouts[-1].workout_date, workouts[-1].id)
+        return WORKOUT_SERIALIZER.many(workouts), next_cursor
+
+    @staticmethod
+    def all(user_id) -> List[Dict]:
+        if user_id is None:
+            return []
+        workouts = db.session.execute(
+            select(FitnessWorkout).where(FitnessWorkout.user_id == user_id).order_by(FitnessWorkout.id)
+        ).scalars()
+        return WORKOUT_SERIALIZER.many(workouts)
+
+    @staticmethod
+    def recent(user_id, count) -> List[Dict]:
+        """最近添加的若干条记录（按记录顺序）"""
+        if user_id is None:
+            return []
+        workouts = list(db.session.execute(
+            select(FitnessWorkout).where(FitnessWorkout.user_id == user_id)
+            .order_by(FitnessWorkout.id.desc()).limit(count)
+        ).scalars())
+        workouts.reverse()
+        return WORKOUT_SERIALIZER.many(workouts)
+
+    @staticmethod
+    def latest(user_id, count) -> List[Dict]:
+        """按运动日期最新的若干条记录（走 (user_id, workout_date DESC) 索引）"""
+        if user_id is None:
+            return []
+        workouts = db.session.execute(
+            select(FitnessWorkout).where(FitnessWorkout.user_id == user_id)
+            .order_by(FitnessWorkout.workout_date.desc(), FitnessWorkout.id.desc()).limit(count)
+        ).scalars()
+        return WORKOUT_SERIALIZER.many(workouts)
+
+    @staticmethod
+    def add(user_id, data: Dict) -> Dict:
+        workout = FitnessWorkout(
+            user_id=user_id,
+            workout_type=data['type'],
+            duration=data['duration'],
+            calories_burned=_calories(data.get('calories_burned', 0)),
+            exercises=json.dumps(data.get('exercises', []), ensure_ascii=False),
+            notes=data.get('notes', ''),
+            workout_date=_parse_datetime(data.get('workout_date')) or datetime.now()
+        )
+        db.session.add(workout)
+        db.session.flush()
+        FitnessAggregateRepository.apply(user_id, workouts=1, calories=workout.calories_burned,
+                                         duration=workout.duration)
+        _commit()
+        return WorkoutRepository.to_dict(workout)
+
+    @staticmethod
+    def _get_owned(user_id, workout_id) -> Optional[FitnessWorkout]:
+        return db.session.execute(
+            select(FitnessWorkout).where(FitnessWorkout.id == workout_id, FitnessWorkout.user_id == user_id)
+        ).scalar_one_or_none()
+
+    @staticmethod
+    def update(user_id, workout_id, data: Dict) -> Optional[Dict]:
+        """更新用户自己的运动记录，记录不存在时返回None"""
+        workout = WorkoutRepository._get_owned(user_id, workout_id)
+        if workout is None:
+            return None
+        old_calories, old_duration = workout.calories_burned or 0, workout.duration or 0
+        if 'type' in data:
+            workout.workout_type = data['type']
+        if 'duration' in data:
+            workout.duration = data['duration']
+        if 'calories_burned' in data:
+            workout.calories_burned = _calories(data['calories_burned'])
+        if 'exercises' in data:
+            workout.exercises = json.dumps(data['exercises'], ensure_ascii=False)
+        if 'notes' in data:
+            workout.notes = data['notes']
+        if 'workout_date' in data:
+            workout.workout_date = _parse_datetime(data['workout_date']) or workout.workout_date
+        db.session.flush()
+        FitnessAggregateRepository.apply(user_id, calories=(workout.calories_burned or 0) - old_calories,
+                                         duration=(workout.duration or 0) - old_duration)
+        _commit()
+        return WorkoutRepository.to_dict(workout)
+
+    @staticmethod
+    def delete(user_id, workout_id) -> bool:
+        """删除用户自己的运动记录，记录不存在时返回False"""
+        workout = WorkoutRepository._get_owned(user_id, workout_id)
+        if workout is None:
+            return False
+        db.session.delete(workout)
+        db.session.flush()
+        FitnessAggregateRepository.apply(user_id, workouts=-1, calories=-(workout.calories_burned or 0),
+                                         duration=-(workout.duration or 0))
+        _commit()
+        return True
+
+
+class FitnessAggregateRepository:
+    """按用户汇总的运动统计
+
+    运动记录增删改时在同一事务内以 total = total + delta 原子更新，读取为单行主键查询，
+    耗时与运动记录数量无关。汇总行不存在时（如迁移前的历史数据）读取按当前记录现算，
+    该用户下一次写入运动记录时创建汇总行。
+    """
+
+    @staticmethod
+    def _compute(user_id) -> Dict:
+        total_workouts, total_calories, total_duration = db.session.execute(
+            select(func.count(), func.coalesce(func.sum(FitnessWorkout.calories_burned), 0),
+                   func.coalesce(func.sum(FitnessWorkout.duration), 0))
+            .where(FitnessWorkout.user_id == user_id)
+        ).one()
+        return {
+            'total_workouts': total_workouts,
+            'total_calories': int(total_calories),
+            'total_duration': int(total_duration)
+        }
+
+    @staticmethod
+    def _create(user_id) -> bool:
+        """按当前记录创建汇总行；并发创建时以先写入者为准，返回是否由本次创建"""
+        try:
+            with db.session.begin_nested():
+                db.session.add(FitnessAggregate(user_id=user_id, **FitnessAggregateRepository._compute(user_id)))
+            return True
+        except IntegrityError:
+            return False
+
+    @staticmethod
+    def _increment(user_id, workouts, calories, duration) -> int:
+        """在已有汇总行上累加，返回更新的行数"""
+        return db.session.execute(
+            update(FitnessAggregate).where(FitnessAggregate.user_id == user_id).values(
+                total_workouts=FitnessAggregate.total_workouts + workouts,
+                total_calories=FitnessAggregate.total_calories + int(calories or 0),
+                total_duration=FitnessAggregate.total_duration + int(duration or 0),
+                updated_at=utcnow()
+            )
+        ).rowcount
+
+    @staticmethod
+    def apply(user_id, workouts=0, calories=0, duration=0):
+        """累加变化量（调用方负责提交）；变化须已flush到当前事务中"""
+        if FitnessAggregateRepository._increment(user_id, workouts, calories, duration):
+            return
+        # 汇总行不存在时按当前记录计算，已包含本次的变化；
+        # 并发下被他人抢先创建（IntegrityError）时，该行已存在，再累加一次即可
+        if not FitnessAggregateRepository._create(user_id):
+            FitnessAggregateRepository._increment(user_id, workouts, calories, duration)
+
+    @staticmethod
+    def get(user_id) -> Dict:
+        """读取汇总，附带平均时长；汇总行不存在时按当前记录计算，不在读取时写入"""
+        if user_id is None:
+            totals = {'total_workouts': 0, 'total_calories': 0, 'total_duration': 0}
+        else:
+            aggregate = db.session.get(FitnessAggregate, user_id)
+            if aggregate is None:
+                # 汇总行在该用户下一次写入运动记录时创建
+                totals = FitnessAggregateRepository._compute(user_id)
+            else:
+                totals = {
+                    'total_workouts': aggregate.total_workouts,
+                    'total_calories': aggregate.total_calories,
+                    'total_duration': aggregate.total_duration
+                }
+        count = totals['total_workouts']
+        totals['average_duration'] = round(totals['total_duration'] / count, 1) if count else 0
+        return totals
+
+
+class GoalRepository:
+    """健身目标"""
+
+    @staticmethod
+    def to_dict(goal: FitnessGoal) -> Dict:
+        return GOAL_SERIALIZER(goal)
+
+    @staticmethod
+    def list(user_id, status=None) -> List[Dict]:
+        if user_id is None:
+            return []
+        query = select(FitnessGoal).where(FitnessGoal.user_id == user_id)
+        if status is not None:
+            query = query.where(FitnessGoal.status == status)
+        goals = db.session.execute(query.order_by(FitnessGoal.id)).scalars()
+        return GOAL_SERIALIZER.many(goals)
+
+    @staticmethod
+    def version(user_id):
+        """目标列表的数据版本（条数、最大id、最近更新时间），增删改都会使其变化，用于ETag"""
+        if user_id is None:
+            return None
+        return tuple(db.session.execute(
+            select(func.count(), func.max(FitnessGoal.id),
+                   func.max(func.coalesce(FitnessGoal.updated_at, FitnessGoal.created_at)))
+            .where(FitnessGoal.user_id == user_id)
+        ).one())
+
+    @staticmethod
+    def add(user_id, data: Dict) -> Dict:
+        goal = FitnessGoal(
+            user_id=user_id,
+            goal_type=data['type'],
+            target_value=data['target'],
+            current_value=data.get('current', 0),
+            unit=data.get('unit', ''),
+            deadline=_parse_datetime(data.get('deadline')),
+            status='active'
+        )
+        db.session.add(goal)
+        _commit()
+        return GoalRepository.to_dict(goal)
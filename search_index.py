@@ -0,0 +1,181 @@
+"""
+对话历史全文检索
+按用户维护增量更新的倒排索引：中文按字符二元组(bigram)切分，英文/数字按单词切分，BM25排序。
+查询时从文档频率最低的词项开始求交集，耗时与命中的倒排表长度相关，而不是历史总量。
+"""
+
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+_CJK_RUN_RE = re.compile(r'[㐀-䶿一-鿿]+')
+_WORD_RE = re.compile(r'[0-9a-zA-Z]+')
+
+# BM25参数
+_K1 = 1.2
+_B = 0.75
+
+
+def tokenize(text: str, unigrams=False) -> List[str]:
+    """切分词项：中文连续片段取二元组（单字片段取单字），英文数字取小写单词
+
+    建索引时 unigrams=True，额外收录每个汉字，使单字查询也能命中。
+    """
+    terms = []
+    for run in _CJK_RUN_RE.findall(text or ''):
+        if len(run) == 1 or unigrams:
+            terms.extend(run)
+        if len(run) > 1:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    terms.extend(word.lower() for word in _WORD_RE.findall(text or ''))
+    return terms
+
+
+class _UserIndex:
+    """单个用户的倒排索引"""
+
+    __slots__ = ('postings', 'docs', 'total_length')
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[tuple, int]] = {}  # 词项 -> {文档键: 词频}
+        self.docs: Dict[tuple, tuple] = {}  # (服务类型, 消息id) -> (消息字典, 文档长度)
+        self.total_length = 0
+
+    def add(self, service_type, message):
+        key = (service_type, message['id'])
+        if key in self.docs:
+            return
+        terms = tokenize(message.get('message', ''), unigrams=True)
+        self.docs[key] = (message, len(terms))
+        self.total_length += len(terms)
+        for term in terms:
+            posting = self.postings.setdefault(term, {})
+            posting[key] = posting.get(key, 0) + 1
+
+
+class ConversationSearchIndex:
+    """按用户划分的对话检索索引
+
+    用户首次检索时通过 loader 加载其全部历史建立索引，之后随新消息增量更新；
+    索引常驻的用户数有上限，超出时按LRU整体淘汰，下次检索时重建。
+    add() 须在消息写入对话存储之后调用：加载开始前的消息由 loader 读到，加载期间的消息先缓存，建好索引时补入。
+    """
+
+    def __init__(self, loader, max_users=1000):
+        self.loader = loader  # loader(user) -> [(服务类型, 消息字典), ...]
+        self.max_users = max_users
+        self._indexes: "OrderedDict[str, _UserIndex]" = OrderedDict()
+        self._loading: Dict[str, list] = {}  # 正在加载历史的用户 -> [进行中的加载数, 加载期间新增的消息]
+        self._lock = threading.RLock()
+
+    def add(self, user, service_type, message):
+        """新消息写入时调用；尚未建立索引的用户会在首次检索时一并加载"""
+        with self._lock:
+            index = self._indexes.get(user)
+            if index is not None:
+                index.add(service_type, message)
+            loading = self._loading.get(user)
+            if loading is not None:
+                # 加载结果中可能不含这条消息，先记下，建好索引时补入
+                loading[1].append((service_type, message))
+
+    def _finish_loading(self, user, loading):
+        # 持锁调用
+        loading[0] -= 1
+        if not loading[0]:
+            del self._loading[user]
+
+    def _get_index(self, user) -> _UserIndex:
+        with self._lock:
+            index = self._indexes.get(user)
+            if index is not None:
+                self._indexes.move_to_end(user)
+                return index
+            loading = self._loading.setdefault(user, [0, []])
+            loading[0] += 1
+
+        # 加载历史不持锁，避免阻塞其他用户的检索
+        index = _UserIndex()
+        try:
+            for service_type, message in self.loader(user):
+                index.add(service_type, message)
+        except BaseException:
+            with self._lock:
+                self._finish_loading(user, loading)
+            raise
+
+        with self._lock:
+            self._finish_loading(user, loading)
+            existing = self._indexes.get(user)
+            if existing is not None:
+                return existing
+            # 已在加载结果中的消息按键去重
+            for service_type, message in loading[1]:
+                index.add(service_type, message)
+            self._indexes[user] = index
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+            return index
+
+    def search(self, user, query, service_type=None, limit=20, offset=0):
+        """检索用户的对话历史，返回 (按相关度排序的命中列表, 命中总数)"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], 0
+
+        index = self._get_index(user)
+        with self._lock:
+            postings = [index.postings.get(term) for term in terms]
+            if any(p is None for p in postings):
+                return [], 0
+
+            # 从最短的倒排表开始求交集
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates.intersection_update(posting)
+                if not candidates:
+                    return [], 0
+
+            # 中文片段要求原文连续出现，过滤二元组拼凑出的误命中
+            phrases = [run for run in _CJK_RUN_RE.findall(query) if len(run) > 2]
+            doc_count = len(index.docs)
+            avg_length = index.total_length / doc_count if doc_count else 0
+            scored = []
+            for key in candidates:
+                if service_type and key[0] != service_type:
+                    continue
+                message, length = index.docs[key]
+                text = message.get('message', '')
+                if any(phrase not in text for phrase in phrases):
+                    continue
+                score = 0.0
+                for posting in postings:
+                    tf = posting[key]
+                    idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+                    norm = tf + _K1 * (1 - _B + _B * length / avg_length) if avg_length else tf + _K1
+                    score += idf * tf * (_K1 + 1) / norm
+                scored.append((score, key, message))
+
+        # 相关度相同时新消息在前，保证分页顺序稳定
+        scored.sort(key=lambda item: (-item[0], -item[1][1], item[1][0]))
+        hits = [{
+            'service_type': key[0],
+            'id': message['id'],
+            'sender': message.get('sender'),
+            'timestamp': message.get('timestamp'),
+            'message': message.get('message'),
+            'score': round(score, 4)
+        } for score, key, message in scored[offset:offset + limit]]
+        return hits, len(scored)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'indexed_users': len(self._indexes),
+                'max_users': self.max_users,
+                'documents': sum(len(i.docs) for i in self._indexes.values()),
+                'terms': sum(len(i.postings) for i in self._indexes.values())
+            }
@@ -0,0 +1,105 @@
+"""
+进程内请求合并（single-flight）
+相同key的并发调用只执行一次，其余调用方等待并共享同一结果
+"""
+
+import asyncio
+import threading
+
+
+class _Call:
+    """一次进行中的调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _AsyncCall:
+    """一次进行中的协程调用及其等待方数量"""
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """线程/协程安全的请求合并器"""
+
+    def __init__(self):
+        self._calls = {}  # key -> _Call（线程路径）
+        self._tasks = {}  # key -> _AsyncCall（协程路径）
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """执行fn()；若相同key的调用正在进行，则等待其结果而不重复执行"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    async def do_async(self, key, coro_fn):
+        """协程版本：await coro_fn()；相同key的并发调用共享同一个任务
+
+        上游调用在独立的任务中执行，每个调用方通过 shield 等待：单个调用方（包括发起者）被取消
+        不会影响其他调用方，只有全部调用方都已取消时才取消上游调用。
+        """
+        call = self._tasks.get(key)
+        if call is None:
+            call = _AsyncCall(asyncio.ensure_future(coro_fn()))
+            self._tasks[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            with self._lock:
+                self.executions += 1
+        else:
+            with self._lock:
+                self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 之后的调用方重新发起，而不是等待一个正在取消的任务
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key, call):
+        if self._tasks.get(key) is call:
+            del self._tasks[key]
+
+    def stats(self):
+        """合并统计"""
+        with self._lock:
+            return {
+                'in_flight': len(self._calls) + len(self._tasks),
+                'executions': self.executions,
+                'coalesced': self.coalesced
+            }
@@ -0,0 +1,76 @@
+"""
+单元测试公共配置
+各模块位于仓库根目录，测试时将其加入导入路径；依赖Flask/SQLAlchemy等的测试在未安装时跳过。
+test_api.py 为针对运行中服务的接口测试脚本，不在此运行。
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 部署时服务模块位于 services/ 包中、路由模块位于 routes/ 包中（见 fitness_routes.py 和 app.py 的导入），
+# 测试时这两个包指向仓库根目录
+for package in ('services', 'routes'):
+    if package not in sys.modules:
+        module = types.ModuleType(package)
+        module.__path__ = [ROOT]
+        sys.modules[package] = module
+
+
+class FakeClock:
+    """可手动推进的 time.monotonic 替身"""
+
+    def __init__(self, start=1000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def db_app(tmp_path):
+    """使用临时SQLite数据库（已建表）的Flask应用，测试期间处于应用上下文中"""
+    pytest.importorskip('flask_sqlalchemy')
+    from flask import Flask
+    from models import db
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "test.db"}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """导入 app.py（临时SQLite数据库、本地溢出存储、不提供静态文件），整个测试会话共用"""
+    for name in ('flask_sqlalchemy', 'flask_jwt_extended', 'flask_cors', 'dotenv', 'requests'):
+        pytest.importorskip(name)
+    from config import Config
+
+    tmp = tmp_path_factory.mktemp('app')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(Config, 'DATABASE_URL', f'sqlite:///{tmp / "app.db"}')
+        patch.setattr(Config, 'CONVERSATION_STORAGE', 'sqlite')
+        patch.setattr(Config, 'CONVERSATION_SPILL_PATH', str(tmp / 'spill.db'))
+        patch.setattr(Config, 'HEALTH_PARTITION_MONTHS_AHEAD', -1)
+        patch.setattr(Config, 'STATIC_DIR', '')
+        import app
+    app.app.config['JWT_SECRET_KEY'] = 'test-secret-key-for-unit-tests-only'
+    with app.app.app_context():
+        app.db.create_all()
+    return app
@@ -0,0 +1,139 @@
+import pytest
+
+requests = pytest.importorskip('requests')
+pytest.importorskip('dotenv')
+
+import ai_http_client
+from ai_http_client import close_session, get_session, post_json
+from config import Config
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """按顺序返回预设结果（响应或异常）并记录每次调用的参数"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+        self.closed = False
+
+    def post(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(ai_http_client.time, 'sleep', delays.append)
+    monkeypatch.setattr(Config, 'AI_HTTP_MAX_RETRIES', 2)
+    return delays
+
+
+@pytest.fixture
+def fake_session(monkeypatch):
+    def install(*results):
+        session = FakeSession(*results)
+        monkeypatch.setattr(ai_http_client, '_session', session)
+        return session
+    yield install
+    ai_http_client._session = None
+
+
+def test_session_is_shared_and_recreated_after_close(monkeypatch):
+    monkeypatch.setattr(ai_http_client, '_session', None)
+    session = get_session()
+    assert get_session() is session
+    adapter = session.get_adapter('https://api.deepseek.com/v1')
+    assert adapter is session.get_adapter('http://localhost:8001')
+    assert adapter._pool_maxsize == Config.AI_HTTP_POOL_MAXSIZE
+    assert adapter._pool_block is True
+    assert adapter.max_retries.total == 0
+
+    close_session()
+    assert ai_http_client._session is None
+    assert get_session() is not session
+    close_session()
+
+
+def test_every_request_goes_through_the_shared_session(fake_session, sleeps):
+    session = fake_session(FakeResponse(200), FakeResponse(200))
+    for _ in range(2):
+        assert post_json('https://llm/chat', {'Authorization': 'Bearer k'}, {'a': 1}).status_code == 200
+    assert len(session.calls) == 2
+    url, kwargs = session.calls[0]
+    assert url == 'https://llm/chat'
+    assert kwargs == {'headers': {'Authorization': 'Bearer k'}, 'json': {'a': 1},
+                      'timeout': (Config.AI_HTTP_CONNECT_TIMEOUT, Config.AI_HTTP_READ_TIMEOUT), 'stream': False}
+    assert sleeps == []
+
+
+def test_retryable_status_is_retried_and_connection_released(fake_session, sleeps):
+    busy, ok = FakeResponse(503), FakeResponse(200)
+    session = fake_session(busy, ok)
+    assert post_json('https://llm/chat', {}, {}, stream=True) is ok
+    assert busy.closed
+    assert session.calls[1][1]['stream'] is True
+    assert len(sleeps) == 1
+
+
+def test_retry_after_header_sets_the_delay(fake_session, sleeps, monkeypatch):
+    monkeypatch.setattr(Config, 'AI_HTTP_BACKOFF_MAX', 5)
+    fake_session(FakeResponse(429, {'Retry-After': '2'}), FakeResponse(429, {'Retry-After': '120'}),
+                 FakeResponse(200))
+    post_json('https://llm/chat', {}, {})
+    assert sleeps == [2.0, 5]
+
+
+def test_last_response_is_returned_when_retries_run_out(fake_session, sleeps):
+    responses = [FakeResponse(502) for _ in range(3)]
+    session = fake_session(*responses)
+    assert post_json('https://llm/chat', {}, {}) is responses[-1]
+    assert len(session.calls) == 3
+    assert not responses[-1].closed
+
+
+def test_client_errors_are_not_retried(fake_session, sleeps):
+    session = fake_session(FakeResponse(400))
+    assert post_json('https://llm/chat', {}, {}).status_code == 400
+    assert len(session.calls) == 1
+
+
+def test_connection_errors_are_retried_then_raised(fake_session, sleeps):
+    session = fake_session(requests.ConnectionError('refused'), FakeResponse(200))
+    assert post_json('https://llm/chat', {}, {}).status_code == 200
+    assert len(session.calls) == 2
+
+    fake_session(*[requests.ConnectTimeout('connect timeout') for _ in range(3)])
+    with pytest.raises(requests.ConnectTimeout):
+        post_json('https://llm/chat', {}, {})
+
+
+def test_read_timeout_is_not_retried(fake_session, sleeps):
+    session = fake_session(requests.ReadTimeout('read timeout'), FakeResponse(200))
+    with pytest.raises(requests.ReadTimeout):
+        post_json('https://llm/chat', {}, {})
+    assert len(session.calls) == 1
+    assert sleeps == []
+
+
+def test_backoff_is_capped_full_jitter(monkeypatch):
+    monkeypatch.setattr(Config, 'AI_HTTP_BACKOFF_BASE', 0.5)
+    monkeypatch.setattr(Config, 'AI_HTTP_BACKOFF_MAX', 3)
+    monkeypatch.setattr(ai_http_client.random, 'uniform', lambda low, high: high)
+    assert [ai_http_client._backoff_delay(attempt) for attempt in range(5)] == [0.5, 1.0, 2.0, 3, 3]
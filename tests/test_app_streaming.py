@@ -0,0 +1,189 @@
+import itertools
+import json
+
+import pytest
+
+from circuit_breaker import CircuitBreaker
+from metrics import AI_COMPLETION_TOKENS
+
+_users = itertools.count(1)
+
+
+class FakeJSONResponse:
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+    def json(self):
+        return {'choices': [{'message': {'content': self.content}}]}
+
+
+class FakeStreamResponse:
+    """上游流式响应：按行产出SSE，fail_after 指定产出若干行后抛出异常"""
+
+    def __init__(self, lines, status_code=200, fail_after=None):
+        self.lines = lines
+        self.status_code = status_code
+        self.fail_after = fail_after
+        self.text = 'upstream error'
+        self.encoding = None
+        self.closed = False
+
+    def iter_lines(self, decode_unicode=False):
+        for index, line in enumerate(self.lines):
+            if index == self.fail_after:
+                raise ConnectionError('connection reset')
+            yield line
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+
+def _chunk(content=None, usage=None):
+    payload = {'choices': [{'delta': {'content': content}}] if content is not None else []}
+    if usage:
+        payload['usage'] = usage
+    return f'data: {json.dumps(payload, ensure_ascii=False)}'
+
+
+def _events(body):
+    """解析SSE响应体为 [(事件名, 数据), ...]"""
+    events = []
+    for block in body.split('\n\n'):
+        if not block:
+            continue
+        event, data = None, None
+        for line in block.split('\n'):
+            field, _, value = line.partition(': ')
+            if field == 'event':
+                event = value
+            elif field == 'data':
+                data = json.loads(value)
+        events.append((event, data))
+    return events
+
+
+@pytest.fixture
+def chat(app_module, monkeypatch):
+    """以新用户调用对话接口；upstream.responses 为依次返回的上游响应，upstream.requests 记录请求体"""
+    from flask_jwt_extended import create_access_token
+
+    upstream = type('Upstream', (), {'responses': [], 'requests': []})()
+
+    def fake_post_json(url, headers, payload, stream=False):
+        upstream.requests.append((payload, stream))
+        result = upstream.responses.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(app_module, 'post_json', fake_post_json)
+    monkeypatch.setattr(app_module, 'DEEPSEEK_API_KEY', 'test-key')
+    monkeypatch.setattr(app_module, 'ai_breaker', CircuitBreaker('test', minimum_calls=1000))
+    app_module.reply_cache.clear()
+
+    user = f'stream-user-{next(_users)}'
+    with app_module.app.app_context():
+        token = create_access_token(identity=user)
+    client = app_module.app.test_client()
+
+    def post(message, path='/api/nutritionist/chat', **kwargs):
+        kwargs.setdefault('query_string', {'stream': '1'})
+        return client.post(path, json={'message': message}, headers={'Authorization': f'Bearer {token}'},
+                           **kwargs)
+
+    post.user = user
+    post.upstream = upstream
+    return post
+
+
+def _fallbacks(app_module, reason):
+    return app_module.AI_FALLBACKS._values.get(('nutritionist', reason), 0)
+
+
+def test_deltas_are_framed_as_sse_events_and_conversation_saved(app_module, chat):
+    upstream = FakeStreamResponse([
+        ': keep-alive', '', _chunk('多吃'), _chunk(''), _chunk('蛋白质。'),
+        _chunk(usage={'prompt_tokens': 12, 'completion_tokens': 3}), 'data: [DONE]'
+    ])
+    chat.upstream.responses.append(upstream)
+    response = chat('增肌吃什么')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert response.headers['X-Accel-Buffering'] == 'no'
+    body = response.get_data(as_text=True)
+    assert body.startswith('data: {"delta": "多吃"}\n\n')
+    events = _events(body)
+    assert events[:2] == [(None, {'delta': '多吃'}), (None, {'delta': '蛋白质。'})]
+    done_event, done = events[2]
+    assert (done_event, done['reply']) == ('done', '多吃蛋白质。')
+    assert upstream.closed
+
+    payload, stream = chat.upstream.requests[0]
+    assert stream is True
+    assert (payload['stream'], payload['stream_options']) == (True, {'include_usage': True})
+    saved = app_module.ai_conversations.recent(chat.user, 'nutritionist')
+    assert [(m['sender'], m['message']) for m in saved] == [('user', '增肌吃什么'), ('ai', '多吃蛋白质。')]
+    assert done['conversation_id'] == saved[-1]['id']
+    # 完整回复写入缓存，token用量计入指标
+    assert app_module.reply_cache.stats()['size'] == 1
+    assert AI_COMPLETION_TOKENS._values[('nutritionist',)] >= 3
+
+
+def test_accept_header_also_selects_streaming(chat):
+    chat.upstream.responses.append(FakeStreamResponse([_chunk('好'), 'data: [DONE]']))
+    response = chat('你好', path='/api/ai/fitness/chat', query_string={},
+                    environ_overrides={'HTTP_ACCEPT': 'text/event-stream'})
+    assert response.mimetype == 'text/event-stream'
+    assert _events(response.get_data(as_text=True))[-1][1]['reply'] == '好'
+
+
+def test_without_stream_flag_reply_is_plain_json(chat):
+    chat.upstream.responses.append(FakeJSONResponse(' 好的 '))
+    response = chat('你好', query_string={})
+    assert response.mimetype == 'application/json'
+    assert response.get_json()['reply'] == '好的'
+    assert chat.upstream.requests[0][1] is False
+
+
+@pytest.mark.parametrize('reason, upstream', [
+    ('http_error', FakeStreamResponse([], status_code=503)),
+    ('exception', ConnectionError('connection refused')),
+    ('exception', FakeStreamResponse([_chunk('部分')], fail_after=0)),
+])
+def test_failure_before_any_output_streams_the_fallback_reply(app_module, chat, reason, upstream):
+    before = _fallbacks(app_module, reason)
+    chat.upstream.responses.append(upstream)
+    events = _events(chat('减肥').get_data(as_text=True))
+
+    expected = app_module.get_simulated_reply('减肥', 'nutritionist')
+    assert events[0] == (None, {'delta': expected})
+    assert (events[1][0], events[1][1]['reply'], len(events)) == ('done', expected, 2)
+    assert _fallbacks(app_module, reason) == before + 1
+
+
+def test_missing_api_key_streams_the_fallback_reply(app_module, chat, monkeypatch):
+    monkeypatch.setattr(app_module, 'DEEPSEEK_API_KEY', None)
+    before = _fallbacks(app_module, 'no_key')
+    events = _events(chat('减肥').get_data(as_text=True))
+    assert events[0] == (None, {'delta': app_module.get_simulated_reply('减肥', 'nutritionist')})
+    assert _fallbacks(app_module, 'no_key') == before + 1
+    assert chat.upstream.requests == []
+
+
+def test_failure_mid_stream_ends_with_the_partial_reply(app_module, chat):
+    before = _fallbacks(app_module, 'exception')
+    chat.upstream.responses.append(FakeStreamResponse([_chunk('先热身，'), _chunk('再训练')], fail_after=1))
+    events = _events(chat('怎么练').get_data(as_text=True))
+    # 已经输出过内容时不再追加模拟回复，也不缓存不完整的回复
+    assert [data for _, data in events[:-1]] == [{'delta': '先热身，'}]
+    assert events[-1][1]['reply'] == '先热身，'
+    assert _fallbacks(app_module, 'exception') == before
+    assert app_module.ai_breaker.snapshot()['window_failures'] == 1
+    assert app_module.reply_cache.stats()['size'] == 0
@@ -0,0 +1,169 @@
+import asyncio
+import itertools
+import json
+
+import pytest
+
+pytest.importorskip('starlette')
+pytest.importorskip('asgiref')
+pytest.importorskip('httpx')
+
+from circuit_breaker import CircuitBreaker
+
+_users = itertools.count(1)
+
+
+class FakeAsyncResponse:
+    def __init__(self, status_code=200, content='', lines=()):
+        self.status_code = status_code
+        self.content = content
+        self.lines = lines
+        self.text = 'upstream error'
+        self.closed = False
+
+    def json(self):
+        return {'choices': [{'message': {'content': self.content}}], 'usage': {'prompt_tokens': 5}}
+
+    async def aiter_lines(self):
+        for line in self.lines:
+            yield line
+
+    async def aread(self):
+        return self.text.encode('utf-8')
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def asgi(app_module, monkeypatch):
+    """Starlette测试客户端；upstream 为依次返回的上游响应，io_calls 记录对话读写是否在事件循环中执行"""
+    import asgi_app
+    from flask_jwt_extended import create_access_token
+    from starlette.testclient import TestClient
+
+    upstream, requests, io_calls = [], [], []
+
+    async def fake_post_json(url, headers, payload, stream=False):
+        requests.append((payload, stream))
+        return upstream.pop(0)
+
+    def off_loop(name, func):
+        def wrapper(*args):
+            try:
+                asyncio.get_running_loop()
+                on_loop = True
+            except RuntimeError:
+                on_loop = False
+            io_calls.append((name, on_loop))
+            return func(*args)
+        return wrapper
+
+    monkeypatch.setattr(asgi_app, 'post_json', fake_post_json)
+    monkeypatch.setattr(app_module, 'DEEPSEEK_API_KEY', 'test-key')
+    breaker = CircuitBreaker('test', minimum_calls=1000)
+    monkeypatch.setattr(app_module, 'ai_breaker', breaker)
+    monkeypatch.setattr(asgi_app, 'ai_breaker', breaker)
+    monkeypatch.setattr(asgi_app, 'get_conversation_context',
+                        off_loop('context', app_module.get_conversation_context))
+    monkeypatch.setattr(asgi_app, 'save_conversation', off_loop('save', app_module.save_conversation))
+    monkeypatch.setattr(asgi_app, '_load_user_context', off_loop('user_context', asgi_app._load_user_context))
+    app_module.reply_cache.clear()
+
+    user = f'asgi-user-{next(_users)}'
+    with app_module.app.app_context():
+        token = create_access_token(identity=user)
+    with TestClient(asgi_app.application) as client:
+        client.user = user
+        client.auth_headers = {'Authorization': f'Bearer {token}'}
+        client.upstream = upstream
+        client.requests = requests
+        client.io_calls = io_calls
+        yield client
+
+
+def test_chat_requires_a_valid_token(asgi):
+    for headers in ({}, {'Authorization': 'Bearer not-a-token'}):
+        response = asgi.post('/api/nutritionist/chat', json={'message': '你好'}, headers=headers)
+        assert response.status_code == 401
+        assert response.json() == {'msg': 'Missing or invalid Authorization Header'}
+    assert asgi.requests == []
+
+
+@pytest.mark.parametrize('path, service_type', [
+    ('/api/nutritionist/chat', 'nutritionist'), ('/api/ai/fitness/chat', 'fitness_trainer')
+])
+def test_chat_reply_is_saved_with_conversation_io_off_the_event_loop(app_module, asgi, path, service_type):
+    asgi.upstream.append(FakeAsyncResponse(content=' 多喝水 '))
+    response = asgi.post(path, json={'message': '口渴'}, headers=asgi.auth_headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body['reply'] == '多喝水'
+
+    saved = app_module.ai_conversations.recent(asgi.user, service_type)
+    assert [(m['sender'], m['message']) for m in saved] == [('user', '口渴'), ('ai', '多喝水')]
+    assert body['conversation_id'] == saved[-1]['id']
+    assert asgi.requests[0][0]['messages'][-1] == {'role': 'user', 'content': '口渴'}
+    assert asgi.io_calls == [('context', False), ('save', False)]
+
+
+def test_stream_flag_returns_sse_and_saves_off_the_event_loop(app_module, asgi):
+    lines = ['data: ' + json.dumps({'choices': [{'delta': {'content': part}}]}, ensure_ascii=False)
+             for part in ('先', '热身')] + ['data: [DONE]']
+    upstream = FakeAsyncResponse(lines=lines)
+    asgi.upstream.append(upstream)
+    response = asgi.post('/api/ai/fitness/chat', params={'stream': '1'}, json={'message': '怎么练'},
+                         headers=asgi.auth_headers)
+
+    assert response.headers['content-type'].startswith('text/event-stream')
+    assert response.headers['cache-control'] == 'no-cache'
+    blocks = response.text.split('\n\n')
+    assert blocks[:2] == ['data: {"delta": "先"}', 'data: {"delta": "热身"}']
+    event, data = blocks[2].split('\n')
+    assert event == 'event: done'
+    assert json.loads(data[len('data: '):])['reply'] == '先热身'
+    assert upstream.closed
+    assert asgi.requests[0][1] is True
+    assert asgi.io_calls == [('context', False), ('save', False)]
+
+
+def test_upstream_error_falls_back_to_simulated_reply(app_module, asgi):
+    asgi.upstream.append(FakeAsyncResponse(status_code=500))
+    response = asgi.post('/api/nutritionist/chat', json={'message': '减肥'}, headers=asgi.auth_headers)
+    assert response.json()['reply'] == app_module.get_simulated_reply('减肥', 'nutritionist')
+    assert app_module.reply_cache.stats()['size'] == 0
+
+
+def test_keyword_chat_validates_and_loads_user_context_off_the_event_loop(asgi):
+    response = asgi.post('/api/ai/chat', json={}, headers=asgi.auth_headers)
+    assert (response.status_code, response.json()) == (400, {'error': 'Message is required'})
+
+    response = asgi.post('/api/ai/chat', json={'message': '我想减脂'}, headers=asgi.auth_headers)
+    assert response.status_code == 200
+    assert response.json()['reply']
+    assert asgi.io_calls == [('user_context', False)]
+
+
+def test_cors_headers_match_the_flask_configuration(app_module, asgi):
+    origin = app_module.CORS_ORIGINS[0]
+    asgi.upstream.append(FakeAsyncResponse(content='好'))
+    response = asgi.post('/api/nutritionist/chat', json={'message': '你好'},
+                         headers={**asgi.auth_headers, 'Origin': origin})
+    assert response.headers['access-control-allow-origin'] == origin
+    assert response.headers['access-control-allow-credentials'] == 'true'
+
+    response = asgi.post('/api/ai/chat', json={'message': '你好'},
+                         headers={**asgi.auth_headers, 'Origin': 'https://evil.example'})
+    assert 'access-control-allow-origin' not in response.headers
+
+
+def test_other_routes_are_served_by_flask(asgi):
+    response = asgi.get('/api/health')
+    assert (response.status_code, response.json()['status']) == (200, 'healthy')
+    response = asgi.get('/api/ai/chat/history', headers=asgi.auth_headers)
+    assert response.status_code == 200
+    assert response.json()['conversations'] == []
+    # 预检请求同样交给Flask-CORS处理
+    response = asgi.options('/api/nutritionist/chat', headers={
+        'Origin': 'http://localhost:3000', 'Access-Control-Request-Method': 'POST'})
+    assert response.headers['access-control-allow-origin'] == 'http://localhost:3000'
@@ -0,0 +1,126 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+from flask import Flask
+from sqlalchemy import select
+
+from bulk_import import (
+    FORMAT_CSV, FORMAT_NDJSON, HealthDataImporter, RowError, WorkoutImporter, _number, detect_format, iter_records
+)
+from models import db, FitnessAggregate, FitnessWorkout, HealthMetricSample, User
+
+
+class FakeFitnessService:
+    def calculate_calories_burned_batch(self, items):
+        return [duration * 5.0 for _, duration, _ in items]
+
+
+@pytest.fixture
+def user_id(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "test.db"}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user = User(username='alice', email='alice@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        yield user.id
+
+
+def _ndjson(*lines):
+    return io.BytesIO('\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines).encode('utf-8'))
+
+
+def test_detect_format():
+    assert detect_format('text/csv') == FORMAT_CSV
+    assert detect_format('application/x-ndjson') == FORMAT_NDJSON
+    assert detect_format('application/json', requested='csv') == FORMAT_CSV
+    assert detect_format('application/json') is None
+
+
+def test_iter_records_reports_unparseable_lines():
+    records = list(iter_records(_ndjson({'a': 1}, 'not json', '[1, 2]', ''), FORMAT_NDJSON))
+    assert records[0] == (1, {'a': 1})
+    assert [line for line, record in records if isinstance(record, RowError)] == [2, 3]
+
+    csv_stream = io.BytesIO('﻿type,duration\nrun,30\nswim,20,extra\n'.encode('utf-8'))
+    records = list(iter_records(csv_stream, FORMAT_CSV))
+    assert records[0] == (2, {'type': 'run', 'duration': '30'})
+    assert isinstance(records[1][1], RowError)
+
+
+@pytest.mark.parametrize('value', ['NaN', 'inf', '-Infinity', float('nan'), 1e400, 'abc', [1]])
+def test_number_rejects_non_numeric_and_non_finite(value):
+    with pytest.raises(RowError):
+        _number({'duration': value}, 'duration', int)
+    with pytest.raises(RowError):
+        _number({'calories_burned': value}, 'calories_burned')
+
+
+def test_number_enforces_minimum_and_required():
+    assert _number({'duration': '30'}, 'duration', int) == 30
+    assert _number({}, 'calories_burned') is None
+    with pytest.raises(RowError):
+        _number({}, 'duration', int, required=True)
+    with pytest.raises(RowError):
+        _number({'duration': -1}, 'duration', int)
+
+
+def test_workout_import_reports_bad_rows_and_keeps_going(user_id):
+    stream = _ndjson(
+        {'type': 'run', 'duration': 30},
+        '{"type": "run", "duration": NaN}',
+        {'type': 'run', 'duration': 10, 'calories_burned': 'Infinity'},
+        {'duration': 20},
+        {'type': 'swim', 'duration': 20, 'calories_burned': 150, 'exercises': ['自由泳']},
+    )
+    report = WorkoutImporter(user_id, FakeFitnessService(), batch_size=2).run(stream, FORMAT_NDJSON)
+
+    assert (report['imported'], report['failed']) == (2, 3)
+    assert [error['line'] for error in report['errors']] == [2, 3, 4]
+    calories = db.session.execute(select(FitnessWorkout.calories_burned).order_by(FitnessWorkout.id)).scalars().all()
+    assert calories == [150, 150]
+    aggregate = db.session.get(FitnessAggregate, user_id)
+    assert (aggregate.total_workouts, aggregate.total_calories, aggregate.total_duration) == (2, 300, 50)
+
+
+def test_prepare_failures_are_reported_per_row(user_id):
+    class OverflowingFitnessService:
+        def calculate_calories_burned_batch(self, items):
+            return [float('inf') if duration == 999 else duration * 5.0 for _, duration, _ in items]
+
+    stream = _ndjson({'type': 'run', 'duration': 30}, {'type': 'run', 'duration': 999}, {'type': 'run', 'duration': 10})
+    report = WorkoutImporter(user_id, OverflowingFitnessService()).run(stream, FORMAT_NDJSON)
+
+    assert (report['imported'], report['failed']) == (2, 1)
+    assert report['errors'][0]['line'] == 2
+
+
+def test_error_list_is_truncated(user_id):
+    stream = _ndjson(*[{'duration': 1}] * 5)
+    report = WorkoutImporter(user_id, FakeFitnessService(), max_errors=2).run(stream, FORMAT_NDJSON)
+    assert report['failed'] == 5
+    assert len(report['errors']) == 2
+    assert report['errors_truncated']
+
+
+def test_health_data_import_feeds_numeric_metrics_into_time_series(user_id):
+    stream = _ndjson(
+        {'data_type': 'heart_rate', 'value': 72, 'recorded_at': '2026-01-01T08:00:00+08:00'},
+        {'data_type': 'heart_rate', 'value': 'NaN', 'recorded_at': '2026-01-01T01:00:00'},
+        {'data_type': 'mood', 'value': 'good', 'recorded_at': '2026-01-01T01:00:00'},
+        {'data_type': 'steps', 'value': {'count': 100}, 'recorded_at': '2026-01-01T01:00:00'},
+    )
+    report = HealthDataImporter(user_id).run(stream, FORMAT_NDJSON)
+
+    assert report['imported'] == 4
+    samples = db.session.execute(select(HealthMetricSample.metric, HealthMetricSample.value,
+                                        HealthMetricSample.recorded_at)).all()
+    assert [(metric, value, recorded_at.isoformat()) for metric, value, recorded_at in samples] == [
+        ('heart_rate', 72.0, '2026-01-01T00:00:00')
+    ]
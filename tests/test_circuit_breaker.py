@@ -0,0 +1,81 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', clock)
+    return CircuitBreaker('test', failure_rate_threshold=0.5, slow_call_seconds=2.0,
+                          slow_call_rate_threshold=0.8, window_seconds=60, minimum_calls=4,
+                          open_seconds=30, half_open_max_calls=1)
+
+
+def test_stays_closed_below_minimum_calls(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_opens_when_failure_rate_reaches_threshold(breaker):
+    breaker.record_success(0.1)
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+    assert breaker.snapshot()['rejected_calls'] == 1
+
+
+def test_opens_on_slow_calls(breaker):
+    for _ in range(4):
+        breaker.record_success(2.5)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_old_calls_leave_the_window(breaker, clock):
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.advance(61)
+    breaker.record_success(0.1)
+    breaker.record_success(0.1)
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()['window_calls'] == 4
+
+
+def _trip(breaker):
+    for _ in range(4):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_half_open_probe_success_closes(breaker, clock):
+    _trip(breaker)
+    clock.advance(30)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    # 探测名额已被占用
+    assert not breaker.allow_request()
+    breaker.record_success(0.1)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_probe_failure_reopens(breaker, clock):
+    _trip(breaker)
+    clock.advance(30)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.snapshot()['retry_in_seconds'] == 30
+
+
+def test_release_frees_half_open_probe(breaker, clock):
+    _trip(breaker)
+    clock.advance(30)
+    assert breaker.allow_request()
+    breaker.release()
+    assert breaker.allow_request()
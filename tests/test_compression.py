@@ -0,0 +1,102 @@
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('dotenv')
+
+from flask import Flask, Response, jsonify
+
+from compression import StaticAsset, init_compression, negotiate, parse_accept_encoding
+
+
+@pytest.fixture
+def app(tmp_path):
+    static_dir = tmp_path / 'static'
+    static_dir.mkdir()
+    (static_dir / 'index.html').write_text('<html>' + 'x' * 4000 + '</html>', encoding='utf-8')
+    (static_dir / 'notes.txt').write_text('ignored', encoding='utf-8')
+
+    app = Flask(__name__)
+
+    @app.route('/big')
+    def big():
+        response = jsonify({'items': list(range(2000))})
+        response.set_etag('abc')
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    @app.route('/stream')
+    def stream():
+        return Response((chunk for chunk in ['{"a":', '1}'] * 1000), mimetype='application/json')
+
+    app.static_assets = init_compression(app, str(static_dir))
+    return app
+
+
+def test_parse_accept_encoding_reads_quality_values():
+    assert parse_accept_encoding('gzip;q=0.5, br, identity;q=0, x;q=bad') == {
+        'gzip': 0.5, 'br': 1.0, 'identity': 0.0, 'x': 0.0
+    }
+    assert parse_accept_encoding(None) == {}
+
+
+def test_negotiate_prefers_quality_then_server_order():
+    available = ('br', 'gzip')
+    assert negotiate('gzip, br', available) == 'br'
+    assert negotiate('gzip;q=1, br;q=0.5', available) == 'gzip'
+    assert negotiate('*', available) == 'br'
+    assert negotiate('br;q=0, *;q=0.1', available) == 'gzip'
+    assert negotiate('identity', available) is None
+    assert negotiate('', available) is None
+
+
+def test_large_json_is_compressed_with_vary_and_suffixed_etag(app):
+    response = app.test_client().get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.get_etag() == ('abc-gzip', False)
+    assert json.loads(gzip.decompress(response.data))['items'][-1] == 1999
+
+
+def test_small_and_unaccepted_responses_are_not_compressed_but_vary(app):
+    client = app.test_client()
+    small = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+    assert 'Accept-Encoding' in small.headers['Vary']
+    plain = client.get('/big')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+
+def test_streamed_responses_are_left_alone(app):
+    response = app.test_client().get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_static_assets_are_precompressed_and_revalidated(app):
+    assert list(app.static_assets) == ['index.html']
+    client = app.test_client()
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data).startswith(b'<html>')
+    etag, _ = response.get_etag()
+    assert etag.endswith('-gzip')
+
+    cached = client.get('/index.html', headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'"{etag}"'})
+    assert cached.status_code == 304
+    # 不同编码的表示使用不同的ETag
+    plain = client.get('/index.html', headers={'If-None-Match': f'"{etag}"'})
+    assert plain.status_code == 200
+    assert 'Content-Encoding' not in plain.headers
+
+
+def test_incompressible_static_file_has_no_variant(tmp_path):
+    path = tmp_path / 'tiny.js'
+    path.write_text('x', encoding='utf-8')
+    assert StaticAsset(str(path)).variants == {}
@@ -0,0 +1,138 @@
+import random
+
+import pytest
+
+from conversation_context import MESSAGE_OVERHEAD_TOKENS, ConversationContext, estimate_tokens
+
+
+def _history(texts, start_id=1):
+    return [{'id': start_id + i, 'sender': 'user' if i % 2 == 0 else 'ai', 'message': text}
+            for i, text in enumerate(texts)]
+
+
+def _cost(messages):
+    return sum(estimate_tokens(m['content']) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def _summary_tokens(context):
+    return sum(state.tokens for state in context._states.values())
+
+
+def test_estimate_tokens_counts_cjk_characters_individually():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('abcd') == 1
+    assert estimate_tokens('abcde') == 2
+    assert estimate_tokens('深蹲三组') == 4
+    assert estimate_tokens('深蹲 squat') == 2 + 2
+
+
+def test_recent_messages_are_packed_newest_first_within_budget():
+    context = ConversationContext(token_budget=30, recent_messages=10)
+    history = _history(['早' * 10, '午' * 10, '晚' * 10])
+    messages = context.build_messages('alice', 'nutritionist', history)
+    # 每条 10 + 4 个token，只能放下最新的两条，且保持时间顺序
+    assert [m['content'] for m in messages] == ['午' * 10, '晚' * 10]
+    assert [m['role'] for m in messages] == ['assistant', 'user']
+    assert _cost(messages) <= 30
+
+
+def test_packing_stops_at_first_message_that_does_not_fit():
+    context = ConversationContext(token_budget=40, recent_messages=10)
+    history = _history(['短', '长' * 50, '短'])
+    messages = context.build_messages('alice', 'nutritionist', history)
+    # 不跳过放不下的消息去装更早的消息，避免上下文不连续
+    assert [m['content'] for m in messages] == ['短']
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_built_context_never_exceeds_budget(seed):
+    rng = random.Random(seed)
+    budget = rng.choice([20, 50, 120, 400])
+    context = ConversationContext(token_budget=budget, recent_messages=rng.randint(1, 8),
+                                  summary_max_tokens=rng.choice([10, 60, 1000]), snippet_chars=rng.randint(5, 80))
+    history = []
+    for turn in range(40):
+        for sender in ('user', 'ai'):
+            text = rng.choice(['深蹲', 'squat ', '怎么减脂？', 'Eat more protein. ']) * rng.randint(1, 30)
+            history.append({'id': len(history) + 1, 'sender': sender, 'message': text})
+        context.record_turn('alice', 'fitness_trainer', history)
+        messages = context.build_messages('alice', 'fitness_trainer', history)
+        assert _cost(messages) <= budget
+
+
+def test_summary_that_does_not_fit_is_left_out():
+    context = ConversationContext(token_budget=20, recent_messages=1, summary_max_tokens=1000)
+    history = _history(['问题' * 20, '回答' * 20, '好'])
+    context.record_turn('alice', 'nutritionist', history)
+    assert context.get_summary('alice', 'nutritionist')
+    messages = context.build_messages('alice', 'nutritionist', history)
+    assert messages == [{'role': 'user', 'content': '好'}]
+
+
+def test_summary_is_folded_incrementally():
+    context = ConversationContext(recent_messages=2)
+    history = _history(['第一问', '第一答', '第二问', '第二答'])
+    context.record_turn('alice', 'nutritionist', history)
+    assert context.get_summary('alice', 'nutritionist') == '- 用户: 第一问\n- 助手: 第一答'
+    # 同一历史重复调用不会重复折叠
+    context.record_turn('alice', 'nutritionist', history)
+    history += _history(['第三问', '第三答'], start_id=5)
+    context.record_turn('alice', 'nutritionist', history)
+    assert context.get_summary('alice', 'nutritionist').splitlines() == [
+        '- 用户: 第一问', '- 助手: 第一答', '- 用户: 第二问', '- 助手: 第二答'
+    ]
+    messages = context.build_messages('alice', 'nutritionist', history[-2:])
+    assert messages[0]['role'] == 'system'
+    assert [m['content'] for m in messages[1:]] == ['第三问', '第三答']
+
+
+def test_summary_keeps_first_sentence_of_replies_and_merges_repeats():
+    context = ConversationContext(recent_messages=1, snippet_chars=20)
+    texts = [('user', '如何  减脂？\n'), ('ai', '控制热量缺口。每天减少300千卡，并保证蛋白质摄入。'), ('user', '如何 减脂？'),
+             ('ai', 'Walk daily. Also sleep well.'), ('user', '如何 减脂？'), ('user', '如何 减脂？'), ('ai', '好')]
+    history = [{'id': i + 1, 'sender': sender, 'message': text} for i, (sender, text) in enumerate(texts)]
+    context.record_turn('alice', 'nutritionist', history)
+    assert context.get_summary('alice', 'nutritionist').splitlines() == [
+        '- 用户: 如何 减脂？', '- 助手: 控制热量缺口。', '- 用户: 如何 减脂？', '- 助手: Walk daily.',
+        '- 用户: 如何 减脂？'
+    ]
+
+
+def test_summary_stays_within_its_token_cap():
+    context = ConversationContext(recent_messages=2, summary_max_tokens=40, snippet_chars=10)
+    history = []
+    for turn in range(200):
+        history += _history([f'问题{turn}' * 5, f'回答{turn}' * 5], start_id=len(history) + 1)
+        context.record_turn('alice', 'nutritionist', history[-50:])
+        assert _summary_tokens(context) <= 40
+    state = context._states[('alice', 'nutritionist')]
+    assert state.tokens == sum(estimate_tokens(line) for line in state.lines)
+    summary = context.get_summary('alice', 'nutritionist').splitlines()
+    # 丢弃的条目数注明在开头，保留的是最近折叠的条目
+    assert summary[0] == f'（更早的{398 - len(state.lines)}条消息已省略）'
+    assert summary[-1] == '- 助手: 回答198回答198…'
+
+
+def test_summary_states_are_bounded_by_lru():
+    context = ConversationContext(recent_messages=1, max_states=3)
+    history = _history(['问', '答'])
+    for user in ('alice', 'bob', 'carol'):
+        context.record_turn(user, 'nutritionist', history)
+    context.get_summary('alice', 'nutritionist')
+    context.record_turn('dave', 'nutritionist', history)
+    assert len(context._states) == 3
+    assert context.get_summary('bob', 'nutritionist') == ''
+    assert context.get_summary('alice', 'nutritionist') == '- 用户: 问'
+
+    context.clear('alice')
+    assert set(context._states) == {('carol', 'nutritionist'), ('dave', 'nutritionist')}
+    context.clear()
+    assert not context._states
+
+
+def test_zero_budget_disables_context():
+    context = ConversationContext(token_budget=0, recent_messages=1)
+    history = _history(['问', '答'])
+    context.record_turn('alice', 'nutritionist', history)
+    assert context.build_messages('alice', 'nutritionist', history) == []
+    assert not context._states
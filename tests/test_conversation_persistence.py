@@ -0,0 +1,147 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+from flask import Flask
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from conversation_persistence import ConversationWriter, DatabaseSpillStorage, UserIdResolver
+from conversation_store import ConversationStore
+from models import db, AIConversation, User
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "test.db"}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='alice', email='alice@example.com', password_hash='x'))
+        db.session.commit()
+    return app
+
+
+def _entry(message_id, message='hi'):
+    return {'id': message_id, 'message': message, 'sender': 'user', 'timestamp': datetime(2026, 1, 1).isoformat()}
+
+
+def _stored_seqs(app):
+    with app.app_context():
+        return sorted(db.session.execute(select(AIConversation.seq)).scalars())
+
+
+def test_flush_writes_batch_and_drops_unknown_users(app):
+    writer = ConversationWriter(app, UserIdResolver(app))
+    writer._flush([('alice', 'fitness_trainer', _entry(1)), ('alice', 'fitness_trainer', _entry(2)),
+                   ('ghost', 'fitness_trainer', _entry(1))])
+    assert _stored_seqs(app) == [1, 2]
+    stats = writer.stats()
+    assert (stats['written'], stats['dropped'], stats['pending_retry']) == (2, 1, 0)
+
+
+def test_rows_violating_constraints_are_dead_lettered(app):
+    writer = ConversationWriter(app, UserIdResolver(app))
+    writer._flush([('alice', 'fitness_trainer', _entry(1))])
+    # 重复的序号违反唯一索引：整批失败后逐条重试，只有该行转入死信
+    writer._flush([('alice', 'fitness_trainer', _entry(1, 'dup')), ('alice', 'fitness_trainer', _entry(2))])
+    assert _stored_seqs(app) == [1, 2]
+    stats = writer.stats()
+    assert (stats['written'], stats['dead_lettered'], stats['pending_retry'], stats['failed_flushes']) == (2, 1, 0, 1)
+    assert writer.dead_letters[0]['entry']['message'] == 'dup'
+
+    # 死信不会阻塞之后的写入
+    writer._flush([('alice', 'fitness_trainer', _entry(3))])
+    assert _stored_seqs(app) == [1, 2, 3]
+
+
+def test_transient_failures_keep_rows_for_retry(app):
+    class FlakyResolver(UserIdResolver):
+        failures = 2
+
+        def resolve_many(self, usernames):
+            if self.failures:
+                self.failures -= 1
+                raise OperationalError('SELECT', {}, Exception('database is down'))
+            return super().resolve_many(usernames)
+
+    writer = ConversationWriter(app, FlakyResolver(app))
+    writer._flush([('alice', 'fitness_trainer', _entry(1)), ('alice', 'fitness_trainer', _entry(2))])
+    assert writer.stats()['pending_retry'] == 2
+    assert _stored_seqs(app) == []
+
+    writer._flush([('alice', 'fitness_trainer', _entry(3))])
+    assert _stored_seqs(app) == [1, 2, 3]
+    assert writer.stats()['pending_retry'] == 0
+
+
+def test_background_thread_writes_queue_before_stopping(app):
+    writer = ConversationWriter(app, UserIdResolver(app), batch_size=2, flush_interval=0.05)
+    writer.start()
+    for message_id in range(1, 6):
+        writer.enqueue('alice', 'nutritionist', _entry(message_id))
+    writer.stop()
+    assert _stored_seqs(app) == [1, 2, 3, 4, 5]
+
+
+def test_full_queue_drops_without_keeping_unflushed_entries(app):
+    writer = ConversationWriter(app, UserIdResolver(app), max_queue=1)
+    writer.enqueue('alice', 'fitness_trainer', _entry(1))
+    writer.enqueue('alice', 'fitness_trainer', _entry(2))
+    assert writer.stats()['dropped'] == 1
+    assert [m['id'] for m in writer.unflushed('alice', 'fitness_trainer')] == [1]
+
+
+def test_database_storage_reserves_id_blocks(app):
+    storage = DatabaseSpillStorage(app, UserIdResolver(app))
+    assert [storage.reserve_ids('alice', 'fitness_trainer', 10) for _ in range(3)] == [1, 11, 21]
+    assert storage.reserve_ids('alice', 'nutritionist', 5) == 1
+    assert storage.reserve_ids('ghost', 'fitness_trainer', 10) is None
+
+
+def test_database_storage_starts_after_existing_messages(app):
+    writer = ConversationWriter(app, UserIdResolver(app))
+    writer._flush([('alice', 'fitness_trainer', _entry(1)), ('alice', 'fitness_trainer', _entry(7))])
+    storage = DatabaseSpillStorage(app, UserIdResolver(app))
+    assert storage.message_count('alice', 'fitness_trainer') == 2
+    assert storage.reserve_ids('alice', 'fitness_trainer', 10) == 8
+
+
+def test_spilled_messages_stay_readable_until_written(app):
+    writer = ConversationWriter(app, UserIdResolver(app))
+    storage = DatabaseSpillStorage(app, UserIdResolver(app), writer)
+    store = ConversationStore(storage, window_size=2, writer=writer)
+    for i in range(5):
+        store.append('alice', 'fitness_trainer', f'm{i}', 'user')
+
+    # 写入器尚未写入任何消息，溢出窗口的消息从写入器读取，历史不出现缺口
+    assert _stored_seqs(app) == []
+    assert [m['id'] for m in store.history('alice', 'fitness_trainer')] == [1, 2, 3, 4, 5]
+    page, has_more = store.page('alice', 'fitness_trainer', before=4, limit=2)
+    assert ([m['id'] for m in page], has_more) == ([2, 3], True)
+    version = store.version('alice', 'fitness_trainer')
+
+    # 写入后读取结果和版本都不变，也不会重复
+    writer.start()
+    writer.stop()
+    assert _stored_seqs(app) == [1, 2, 3, 4, 5]
+    assert writer.unflushed('alice', 'fitness_trainer') == []
+    assert [m['id'] for m in store.history('alice', 'fitness_trainer')] == [1, 2, 3, 4, 5]
+    assert store.version('alice', 'fitness_trainer') == version
+
+
+def test_message_count_does_not_double_count_written_messages(app):
+    writer = ConversationWriter(app, UserIdResolver(app))
+    storage = DatabaseSpillStorage(app, UserIdResolver(app), writer)
+    writer.enqueue('alice', 'nutritionist', _entry(1))
+    writer.enqueue('alice', 'nutritionist', _entry(2))
+    assert storage.message_count('alice', 'nutritionist') == 2
+    # 已写入表、尚未从写入器移除的消息只计一次
+    with app.app_context(), db.engine.begin() as connection:
+        connection.execute(AIConversation.__table__.insert(), writer._build_rows(
+            [('alice', 'nutritionist', _entry(1))]))
+    assert storage.message_count('alice', 'nutritionist') == 2
+    assert [m['id'] for m in storage.fetch('alice', 'nutritionist')] == [1, 2]
@@ -0,0 +1,186 @@
+import threading
+
+import pytest
+
+from conversation_store import ConversationStore, SQLiteSpillStorage
+
+
+@pytest.fixture
+def storage_path(tmp_path):
+    return str(tmp_path / 'spill.db')
+
+
+@pytest.fixture
+def storage(storage_path):
+    storage = SQLiteSpillStorage(storage_path)
+    yield storage
+    storage.close()
+
+
+def _ids(messages):
+    return [m['id'] for m in messages]
+
+
+def test_append_assigns_increasing_ids_and_keeps_window(storage):
+    store = ConversationStore(storage, window_size=3)
+    for i in range(5):
+        store.append('alice', 'fitness_trainer', f'm{i}', 'user')
+    assert _ids(store.recent('alice', 'fitness_trainer')) == [3, 4, 5]
+    # 溢出的消息仍可从持久化存储读到
+    assert _ids(store.history('alice', 'fitness_trainer')) == [1, 2, 3, 4, 5]
+    assert store.memory_usage()['messages_spilled'] == 2
+
+
+def test_ids_are_reserved_from_storage_in_blocks(storage):
+    calls = []
+    reserve_ids = storage.reserve_ids
+
+    def counting_reserve_ids(user, service_type, count):
+        calls.append(count)
+        return reserve_ids(user, service_type, count)
+
+    storage.reserve_ids = counting_reserve_ids
+    store = ConversationStore(storage, id_block_size=4)
+    ids = [store.append('alice', 'fitness_trainer', f'm{i}', 'user')['id'] for i in range(10)]
+    assert ids == list(range(1, 11))
+    # 每段4个id只访问一次存储
+    assert calls == [4, 4, 4]
+
+
+def test_ids_are_unique_across_stores_sharing_storage(storage_path):
+    stores = [ConversationStore(SQLiteSpillStorage(storage_path), window_size=5, id_block_size=3)
+              for _ in range(2)]
+    ids = []
+    lock = threading.Lock()
+
+    def worker(store):
+        for i in range(20):
+            entry = store.append('alice', 'fitness_trainer', f'm{i}', 'user')
+            with lock:
+                ids.append(entry['id'])
+
+    threads = [threading.Thread(target=worker, args=(store,)) for store in stores for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert len(set(ids)) == 80
+
+
+def test_evicted_conversation_reloads_and_continues_numbering(storage):
+    store = ConversationStore(storage, window_size=10, max_conversations=1, id_block_size=5)
+    store.append('alice', 'fitness_trainer', 'a1', 'user')
+    store.append('alice', 'fitness_trainer', 'a2', 'ai')
+    # 第二个对话使第一个对话被整体溢出
+    store.append('bob', 'fitness_trainer', 'b1', 'user')
+    assert store.memory_usage()['conversations'] == 1
+    assert store.memory_usage()['messages_spilled'] == 2
+
+    # 重新加载的窗口从新预留的一段继续编号，未用完的旧段作废
+    entry = store.append('alice', 'fitness_trainer', 'a3', 'user')
+    assert entry['id'] == 6
+    assert [m['message'] for m in store.recent('alice', 'fitness_trainer')] == ['a1', 'a2', 'a3']
+
+
+def test_recent_for_unknown_conversation_does_not_create_window(storage):
+    store = ConversationStore(storage)
+    assert store.recent('nobody', 'fitness_trainer') == []
+    assert store.memory_usage()['conversations'] == 0
+
+
+def test_page_walks_backwards_and_forwards(storage):
+    store = ConversationStore(storage, window_size=4)
+    for i in range(10):
+        store.append('alice', 'nutritionist', f'm{i}', 'user')
+
+    latest, has_more = store.page('alice', 'nutritionist', limit=3)
+    assert (_ids(latest), has_more) == ([8, 9, 10], True)
+    older, has_more = store.page('alice', 'nutritionist', before=4, limit=5)
+    assert (_ids(older), has_more) == ([1, 2, 3], False)
+    newer, has_more = store.page('alice', 'nutritionist', after=5, limit=3)
+    assert (_ids(newer), has_more) == ([6, 7, 8], True)
+    tail, has_more = store.page('alice', 'nutritionist', after=8, limit=3)
+    assert (_ids(tail), has_more) == ([9, 10], False)
+
+
+@pytest.fixture
+def paged_store(storage):
+    # 窗口为 6..10，1..5 只在持久化存储中
+    store = ConversationStore(storage, window_size=5)
+    for i in range(10):
+        store.append('alice', 'nutritionist', f'm{i}', 'user')
+    return store
+
+
+@pytest.mark.parametrize('after, limit, expected', [
+    (4, 3, ([5, 6, 7], True)),      # 跨越存储与窗口的边界
+    (5, 3, ([6, 7, 8], True)),      # 正好在窗口第一条之前
+    (5, 5, ([6, 7, 8, 9, 10], False)),
+    (6, 10, ([7, 8, 9, 10], False)),
+    (9, 3, ([10], False)),
+    (10, 3, ([], False)),           # 最新一条
+    (100, 3, ([], False)),          # 超过最新id
+])
+def test_page_after_cursor_at_window_boundary(paged_store, after, limit, expected):
+    messages, has_more = paged_store.page('alice', 'nutritionist', after=after, limit=limit)
+    assert (_ids(messages), has_more) == expected
+
+
+@pytest.mark.parametrize('before, limit, expected', [
+    (6, 3, ([3, 4, 5], True)),      # 正好是窗口第一条：全部来自存储
+    (6, 5, ([1, 2, 3, 4, 5], False)),
+    (7, 3, ([4, 5, 6], True)),      # 跨越边界
+    (7, 6, ([1, 2, 3, 4, 5, 6], False)),
+    (5, 3, ([2, 3, 4], True)),
+    (2, 3, ([1], False)),
+    (1, 3, ([], False)),
+    (11, 3, ([8, 9, 10], True)),    # 紧接最新一条
+    (100, 10, (list(range(1, 11)), False)),  # 超过最新id
+])
+def test_page_before_cursor_at_window_boundary(paged_store, before, limit, expected):
+    messages, has_more = paged_store.page('alice', 'nutritionist', before=before, limit=limit)
+    assert (_ids(messages), has_more) == expected
+
+
+def test_page_of_evicted_conversation_reads_storage(storage):
+    store = ConversationStore(storage, window_size=3, max_conversations=1)
+    for i in range(5):
+        store.append('alice', 'nutritionist', f'm{i}', 'user')
+    store.append('bob', 'nutritionist', 'hi', 'user')
+    assert (_ids(store.page('alice', 'nutritionist', after=0, limit=10)[0])) == [1, 2, 3, 4, 5]
+    assert store.page('alice', 'nutritionist', after=5, limit=10) == ([], False)
+    assert _ids(store.page('alice', 'nutritionist', before=3, limit=10)[0]) == [1, 2]
+
+
+def test_version_changes_on_every_append(storage_path):
+    store = ConversationStore(SQLiteSpillStorage(storage_path), window_size=2, max_conversations=1)
+    versions = [store.version('alice', 'fitness_trainer')]
+    for i in range(4):
+        store.append('alice', 'fitness_trainer', f'm{i}', 'user')
+        versions.append(store.version('alice', 'fitness_trainer'))
+    # 被淘汰（整体溢出）前后同样变化
+    store.append('bob', 'fitness_trainer', 'hi', 'user')
+    versions.append(store.version('alice', 'fitness_trainer'))
+    assert len(set(versions)) == len(versions)
+
+    # 其他进程写入存储的消息同样改变版本
+    before = store.version('alice', 'fitness_trainer')
+    other = ConversationStore(SQLiteSpillStorage(storage_path), window_size=1)
+    other.append('alice', 'fitness_trainer', 'x', 'user')
+    other.append('alice', 'fitness_trainer', 'y', 'user')
+    assert store.version('alice', 'fitness_trainer') != before
+
+
+def test_writer_receives_every_new_message(storage):
+    class Writer:
+        def __init__(self):
+            self.entries = []
+
+        def enqueue(self, user, service_type, entry):
+            self.entries.append((user, service_type, entry['id']))
+
+    writer = Writer()
+    store = ConversationStore(storage, writer=writer)
+    store.append('alice', 'fitness_trainer', 'hi', 'user')
+    store.append('alice', 'nutritionist', 'hi', 'user')
+    assert writer.entries == [('alice', 'fitness_trainer', 1), ('alice', 'nutritionist', 1)]
@@ -0,0 +1,102 @@
+import pytest
+
+pytest.importorskip('dotenv')
+
+import dashboard_cache
+from dashboard_cache import DashboardCache
+
+
+def _counter():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+    return compute, calls
+
+
+def test_values_are_cached_per_user_and_endpoint():
+    cache = DashboardCache(max_users=10, ttl=60)
+    compute, calls = _counter()
+    assert cache.get_or_compute('alice', 'profile', compute) == 1
+    assert cache.get_or_compute('alice', 'profile', compute) == 1
+    assert cache.get_or_compute('alice', 'progress', compute) == 2
+    assert cache.get_or_compute('bob', 'profile', compute) == 3
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == ({'profile': 1}, {'profile': 2, 'progress': 1})
+
+
+def test_entries_expire_after_ttl(monkeypatch, clock):
+    monkeypatch.setattr(dashboard_cache.time, 'monotonic', clock)
+    cache = DashboardCache(max_users=10, ttl=60)
+    compute, calls = _counter()
+    cache.get_or_compute('alice', 'profile', compute)
+    clock.advance(59)
+    assert cache.get_or_compute('alice', 'profile', compute) == 1
+    clock.advance(1)
+    assert cache.get_or_compute('alice', 'profile', compute) == 2
+
+
+def test_invalidate_drops_only_that_user():
+    cache = DashboardCache(max_users=10, ttl=60)
+    compute, calls = _counter()
+    cache.get_or_compute('alice', 'profile', compute)
+    cache.get_or_compute('bob', 'profile', compute)
+    cache.invalidate('alice')
+    assert cache.get_or_compute('alice', 'profile', compute) == 3
+    assert cache.get_or_compute('bob', 'profile', compute) == 2
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_least_recently_used_users_are_evicted():
+    cache = DashboardCache(max_users=2, ttl=60)
+    for user in ('alice', 'bob'):
+        cache.get_or_compute(user, 'profile', lambda: user)
+    cache.get_or_compute('alice', 'profile', lambda: 'recomputed')
+    cache.get_or_compute('carol', 'profile', lambda: 'carol')
+    assert cache.stats()['users'] == 2
+    assert cache.get_or_compute('alice', 'profile', lambda: 'recomputed') == 'alice'
+    assert cache.get_or_compute('bob', 'profile', lambda: 'recomputed') == 'recomputed'
+
+
+@pytest.mark.parametrize('write', [lambda cache: cache.invalidate('alice'), lambda cache: cache.clear()])
+def test_result_computed_across_a_write_is_not_stored(write):
+    cache = DashboardCache(max_users=10, ttl=60)
+
+    def stale():
+        # 计算期间发生写入：结果基于写入前的数据
+        write(cache)
+        return 'stale'
+
+    assert cache.get_or_compute('alice', 'profile', stale) == 'stale'
+    assert cache.get_or_compute('alice', 'profile', lambda: 'fresh') == 'fresh'
+    assert cache.get_or_compute('alice', 'profile', lambda: 'again') == 'fresh'
+
+
+def test_generations_are_kept_only_while_computing():
+    cache = DashboardCache(max_users=10, ttl=60)
+
+    def nested():
+        # 同一用户的并发计算：外层计算结束前内层已结束
+        cache.get_or_compute('alice', 'progress', lambda: cache.invalidate('alice'))
+        assert cache._computing == {'alice': 1}
+        return 'outer'
+
+    cache.get_or_compute('alice', 'profile', nested)
+    for i in range(100):
+        cache.invalidate(f'user{i}')
+    assert cache._computing == {}
+    assert cache._generations == {}
+
+
+def test_failed_compute_is_not_cached():
+    cache = DashboardCache(max_users=10, ttl=60)
+
+    def fail():
+        raise RuntimeError('database is down')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('alice', 'profile', fail)
+    assert cache.stats()['users'] == 0
+    assert cache._computing == {}
+    assert cache.get_or_compute('alice', 'profile', lambda: 'ok') == 'ok'
@@ -0,0 +1,91 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+pytest.importorskip('dotenv')
+
+import data_export
+from bulk_import import FORMAT_CSV, FORMAT_NDJSON, WorkoutImporter
+from data_export import csv_chunks, encode_chunks, ndjson_chunks
+from models import db, AIConversation, HealthData
+from repositories import GoalRepository, UserRepository, WorkoutRepository
+
+
+class FakeFitnessService:
+    def calculate_calories_burned_batch(self, items):
+        return [duration * 5.0 for _, duration, _ in items]
+
+
+@pytest.fixture
+def alice(db_app):
+    user = UserRepository.create('alice', 'alice@example.com', 'secret')
+    WorkoutRepository.add(user.id, {'type': 'strength', 'duration': 45, 'calories_burned': 300,
+                                    'exercises': ['深蹲', '卧推'], 'notes': '腿日, "加重"',
+                                    'workout_date': '2026-03-01T08:00:00'})
+    WorkoutRepository.add(user.id, {'type': 'running', 'duration': 30, 'calories_burned': 250,
+                                    'workout_date': '2026-03-02T07:30:00'})
+    GoalRepository.add(user.id, {'type': 'weight_loss', 'target': 55, 'unit': 'kg'})
+    db.session.add(HealthData(user_id=user.id, data_type='sleep', value=json.dumps({'hours': 7.5}),
+                              recorded_at=datetime(2026, 3, 1, 7)))
+    db.session.add(AIConversation(user_id=user.id, ai_type='nutritionist', message='吃什么', sender='user', seq=1,
+                                  timestamp=datetime(2026, 3, 1, 12)))
+    db.session.commit()
+    return user
+
+
+def _workouts_without_ids(user_id):
+    return [{key: value for key, value in w.items() if key != 'id'} for w in WorkoutRepository.all(user_id)]
+
+
+def test_ndjson_lists_every_resource_in_order(alice):
+    text = ''.join(ndjson_chunks(alice.id, ['workouts', 'goals', 'health_data', 'conversations']))
+    records = [json.loads(line) for line in text.splitlines()]
+    assert [r['record_type'] for r in records] == ['workouts', 'workouts', 'goals', 'health_data', 'conversations']
+    assert {key: value for key, value in records[0].items() if key != 'record_type'} == \
+        WorkoutRepository.all(alice.id)[0]
+    assert records[3]['value'] == {'hours': 7.5}
+    assert (records[4]['id'], records[4]['message']) == (1, '吃什么')
+
+
+def test_csv_lists_use_the_bulk_import_separator(alice):
+    rows = list(csv.DictReader(io.StringIO(''.join(csv_chunks(alice.id, 'workouts')))))
+    assert list(rows[0]) == data_export.EXPORT_RESOURCES['workouts'][3]
+    assert rows[0]['exercises'] == '深蹲;卧推'
+    assert rows[0]['notes'] == '腿日, "加重"'
+    assert rows[1]['exercises'] == ''
+
+
+@pytest.mark.parametrize('fmt', [FORMAT_CSV, FORMAT_NDJSON])
+def test_exported_workouts_import_back_unchanged(alice, fmt):
+    bob = UserRepository.create('bob', 'bob@example.com', 'secret')
+    if fmt == FORMAT_CSV:
+        exported = ''.join(csv_chunks(alice.id, 'workouts'))
+    else:
+        exported = ''.join(ndjson_chunks(alice.id, ['workouts']))
+    report = WorkoutImporter(bob.id, FakeFitnessService()).run(io.BytesIO(exported.encode('utf-8')), fmt)
+    assert (report['imported'], report['failed']) == (2, 0)
+    assert _workouts_without_ids(bob.id) == _workouts_without_ids(alice.id)
+
+
+def test_output_is_chunked_and_gzip_stream_decompresses(alice, monkeypatch):
+    monkeypatch.setattr(data_export, 'CHUNK_SIZE', 50)
+    chunks = list(ndjson_chunks(alice.id, ['workouts', 'goals']))
+    assert len(chunks) == 3
+    assert len(list(csv_chunks(alice.id, 'workouts'))) > 1
+
+    plain = b''.join(encode_chunks(iter(chunks)))
+    assert plain == ''.join(chunks).encode('utf-8')
+    compressed = b''.join(encode_chunks(iter(chunks), compress=True))
+    assert compressed[:2] == b'\x1f\x8b'
+    assert gzip.decompress(compressed) == plain
+
+
+def test_export_is_scoped_to_the_user(alice):
+    bob = UserRepository.create('bob', 'bob@example.com', 'secret')
+    assert ''.join(ndjson_chunks(bob.id, list(data_export.EXPORT_RESOURCES))) == ''
+    assert ''.join(csv_chunks(bob.id, 'goals')).splitlines() == [','.join(data_export.EXPORT_RESOURCES['goals'][3])]
@@ -0,0 +1,85 @@
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_jwt_extended')
+pytest.importorskip('dotenv')
+
+from flask import Flask, jsonify
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required
+
+from etags import conditional_get, make_etag
+
+
+@pytest.fixture
+def versions():
+    return {'alice': 1, 'bob': 1}
+
+
+@pytest.fixture
+def client(versions):
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'test'
+    JWTManager(app)
+    calls = []
+
+    @app.route('/goals')
+    @jwt_required()
+    @conditional_get('goals', lambda user: versions[user])
+    def goals():
+        calls.append(1)
+        return jsonify({'goals': []})
+
+    client = app.test_client()
+    client.calls = calls
+    with app.app_context():
+        client.tokens = {user: create_access_token(identity=user) for user in versions}
+    return client
+
+
+def _get(client, user='alice', etag=None, path='/goals'):
+    headers = {'Authorization': f'Bearer {client.tokens[user]}'}
+    if etag:
+        headers['If-None-Match'] = f'"{etag}"'
+    return client.get(path, headers=headers)
+
+
+def test_make_etag_depends_on_every_component():
+    base = make_etag('goals', 1, 'alice')
+    assert base == make_etag('goals', 1, 'alice')
+    assert len({base, make_etag('profile', 1, 'alice'), make_etag('goals', 2, 'alice'),
+                make_etag('goals', 1, 'bob')}) == 4
+
+
+def test_matching_etag_returns_304_without_running_view(client):
+    first = _get(client)
+    etag, _ = first.get_etag()
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    second = _get(client, etag=etag)
+    assert second.status_code == 304
+    assert second.get_etag()[0] == etag
+    assert len(client.calls) == 1
+
+
+def test_version_change_invalidates_etag(client, versions):
+    etag, _ = _get(client).get_etag()
+    versions['alice'] += 1
+    response = _get(client, etag=etag)
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+
+
+def test_etags_differ_per_user_and_query(client):
+    alice, _ = _get(client).get_etag()
+    bob, _ = _get(client, user='bob').get_etag()
+    filtered, _ = _get(client, path='/goals?status=active').get_etag()
+    assert len({alice, bob, filtered}) == 3
+    assert _get(client, user='bob', etag=alice).status_code == 200
+
+
+def test_encoding_suffixed_etag_is_recognised(client):
+    etag, _ = _get(client).get_etag()
+    response = _get(client, etag=f'{etag}-gzip')
+    assert response.status_code == 304
+    assert response.get_etag()[0] == f'{etag}-gzip'
@@ -0,0 +1,159 @@
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+pytest.importorskip('flask_jwt_extended')
+pytest.importorskip('dotenv')
+
+from flask_jwt_extended import JWTManager, create_access_token
+
+from dashboard_cache import dashboard_cache
+from fitness_routes import fitness_bp
+from repositories import UserRepository
+
+
+@pytest.fixture
+def client(db_app):
+    db_app.config['JWT_SECRET_KEY'] = 'test-secret-key-for-unit-tests-only'
+    JWTManager(db_app)
+    db_app.register_blueprint(fitness_bp, url_prefix='/api')
+    UserRepository.create('alice', 'alice@example.com', 'secret', {'weight': 60})
+    dashboard_cache.clear()
+    client = db_app.test_client()
+    client.headers = {'Authorization': f'Bearer {create_access_token(identity="alice")}'}
+    yield client
+    dashboard_cache.clear()
+
+
+def _post_workout(client, **fields):
+    data = {'type': 'running', 'duration': 30, 'workout_date': '2026-03-01T08:00:00'}
+    data.update(fields)
+    return client.post('/api/workouts', json=data, headers=client.headers)
+
+
+def test_add_workout_validates_each_field(client):
+    assert _post_workout(client).status_code == 201
+    cases = [
+        ({'duration': 'half an hour'}, 'duration must be a number'),
+        ({'duration': -5}, 'duration must be >= 0'),
+        ({'duration': None}, 'duration is required'),
+        ({'calories_burned': 'lots'}, 'calories_burned must be a number'),
+        ({'calories_burned': float('inf')}, 'calories_burned must be a finite number'),
+        ({'workout_date': 'yesterday'}, 'Invalid workout_date'),
+    ]
+    for fields, error in cases:
+        response = _post_workout(client, **fields)
+        assert (response.status_code, response.get_json()['error']) == (400, error), fields
+
+
+def test_add_workout_computes_missing_calories(client):
+    workout = _post_workout(client, duration='45').get_json()['workout']
+    assert workout['duration'] == 45
+    assert workout['calories_burned'] > 0
+
+
+def test_update_workout_reports_invalid_field(client):
+    workout_id = _post_workout(client).get_json()['workout']['id']
+    response = client.put(f'/api/workouts/{workout_id}', json={'calories_burned': 'x'}, headers=client.headers)
+    assert (response.status_code, response.get_json()['error']) == (400, 'calories_burned must be a number')
+    response = client.put(f'/api/workouts/{workout_id}', json={'duration': 50}, headers=client.headers)
+    assert response.status_code == 200
+    assert response.get_json()['workout']['duration'] == 50
+    assert client.put('/api/workouts/999', json={'duration': 1}, headers=client.headers).status_code == 404
+
+
+def _get_workouts(client, **params):
+    response = client.get('/api/workouts', query_string=params, headers=client.headers)
+    return response.status_code, response.get_json()
+
+
+def test_workout_cursor_pages_cover_every_record_once(client):
+    ids = [_post_workout(client, workout_date=f'2026-03-0{day}T08:00:00').get_json()['workout']['id']
+           for day in (1, 2, 2, 3, 3)]
+    seen, cursor = [], None
+    while True:
+        params = {'limit': 2, 'cursor': cursor} if cursor else {'limit': 2}
+        status, body = _get_workouts(client, **params)
+        assert status == 200
+        seen += [w['id'] for w in body['workouts']]
+        assert body['has_more'] == (body['next_cursor'] is not None)
+        if not body['has_more']:
+            break
+        cursor = body['next_cursor']
+    assert seen == [ids[4], ids[3], ids[2], ids[1], ids[0]]
+
+
+def test_workout_filters_and_invalid_parameters(client):
+    for day in (1, 2, 3):
+        _post_workout(client, workout_date=f'2026-03-0{day}T23:30:00')
+    _post_workout(client, type='yoga', workout_date='2026-03-02T07:00:00')
+
+    # 只给日期时 to 包含当天
+    status, body = _get_workouts(client, **{'from': '2026-03-02', 'to': '2026-03-02'})
+    assert status == 200
+    assert [w['workout_date'] for w in body['workouts']] == ['2026-03-02T23:30:00', '2026-03-02T07:00:00']
+    status, body = _get_workouts(client, type='yoga')
+    assert [w['type'] for w in body['workouts']] == ['yoga']
+
+    assert _get_workouts(client, cursor='garbage') == (400, {'error': 'Invalid cursor'})
+    assert _get_workouts(client, **{'from': 'last week'})[0] == 400
+
+
+def test_offset_parameter_keeps_legacy_pagination(client):
+    for day in (1, 2, 3):
+        _post_workout(client, workout_date=f'2026-03-0{day}T08:00:00')
+    status, body = _get_workouts(client, offset=1, limit=1)
+    assert status == 200
+    assert (body['total'], body['offset'], len(body['workouts'])) == (3, 1, 1)
+    assert body['workouts'][0]['workout_date'] == '2026-03-02T08:00:00'
+
+
+def _dashboard(client):
+    profile = client.get('/api/profile', headers=client.headers).get_json()
+    progress = client.get('/api/progress', headers=client.headers).get_json()['progress']
+    analysis = client.get('/api/analysis', headers=client.headers)
+    assert analysis.status_code == 200
+    return profile, progress
+
+
+def test_dashboard_endpoints_are_served_from_cache(client):
+    _post_workout(client)
+    before = dashboard_cache.stats()
+    first = _dashboard(client)
+    assert _dashboard(client) == first
+    after = dashboard_cache.stats()
+    for name in ('profile', 'progress', 'analysis'):
+        assert after['misses'][name] == before['misses'].get(name, 0) + 1
+        assert after['hits'][name] == before['hits'].get(name, 0) + 1
+
+
+def test_workout_and_goal_writes_invalidate_dashboard(client):
+    before = dashboard_cache.stats()
+    workout_id = _post_workout(client, calories_burned=100).get_json()['workout']['id']
+    profile, _ = _dashboard(client)
+    assert (profile['stats']['total_workouts'], profile['stats']['total_calories']) == (1, 100)
+
+    client.put(f'/api/workouts/{workout_id}', json={'calories_burned': 250}, headers=client.headers)
+    profile, _ = _dashboard(client)
+    assert profile['stats']['total_calories'] == 250
+
+    client.post('/api/goals', json={'type': 'endurance', 'target': 10}, headers=client.headers)
+    profile, _ = _dashboard(client)
+    assert profile['stats']['active_goals'] == 1
+
+    client.delete(f'/api/workouts/{workout_id}', headers=client.headers)
+    profile, _ = _dashboard(client)
+    assert profile['stats']['total_workouts'] == 0
+    assert profile['recent_workouts'] == []
+    # 每次写入后都重新计算，没有命中旧缓存
+    after = dashboard_cache.stats()
+    assert after['invalidations'] == before['invalidations'] + 4
+    assert after['hits'] == before['hits']
+
+
+def test_profile_update_invalidates_dashboard(client):
+    from auth_routes import auth_bp
+    client.application.register_blueprint(auth_bp, url_prefix='/api/auth')
+    assert _dashboard(client)[0]['basic_info']['weight'] == 60
+    response = client.put('/api/auth/profile', json={'profile': {'weight': 58}}, headers=client.headers)
+    assert response.status_code == 200
+    assert _dashboard(client)[0]['basic_info']['weight'] == 58
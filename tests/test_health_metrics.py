@@ -0,0 +1,117 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+from flask import Flask
+
+from health_metrics import (
+    aggregate, bucket_start, choose_resolution, ensure_sample_partitions, parse_sample, query_series,
+    record_samples, samples_from_health_data, to_utc_naive
+)
+from models import db, utcnow, User
+
+
+@pytest.fixture
+def user_id(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "test.db"}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        user = User(username='alice', email='alice@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        yield user.id
+
+
+def test_to_utc_naive_converts_aware_times_only():
+    aware = datetime(2026, 1, 1, 8, 0, tzinfo=timezone(timedelta(hours=8)))
+    assert to_utc_naive(aware) == datetime(2026, 1, 1, 0, 0)
+    assert to_utc_naive(datetime(2026, 1, 1, 8, 0)) == datetime(2026, 1, 1, 8, 0)
+
+
+def test_utcnow_is_naive_utc(user_id):
+    before = datetime.now(timezone.utc).replace(tzinfo=None)
+    now = utcnow()
+    assert now.tzinfo is None
+    assert before <= now <= datetime.now(timezone.utc).replace(tzinfo=None)
+    # 模型默认值同样是不带时区的UTC时间
+    created_at = db.session.get(User, user_id).created_at
+    assert created_at.tzinfo is None
+    assert abs(created_at - now) < timedelta(minutes=1)
+
+
+def test_parse_sample_validates_and_normalizes():
+    assert parse_sample({'metric': 'weight', 'value': '70.5', 'recorded_at': '2026-01-01T08:00:00+08:00'}) == (
+        'weight', 70.5, datetime(2026, 1, 1, 0, 0)
+    )
+    for record in [{'metric': 'mood', 'value': 1}, {'metric': 'weight'}, {'metric': 'weight', 'value': 'abc'},
+                   {'metric': 'weight', 'value': 'NaN'}, {'metric': 'weight', 'value': float('inf')},
+                   {'metric': 'weight', 'value': 1, 'recorded_at': 'yesterday'}]:
+        with pytest.raises(ValueError):
+            parse_sample(record)
+
+
+def test_buckets_and_resolution():
+    moment = datetime(2026, 1, 1, 8, 30, 45, 123)
+    assert bucket_start(moment, 'minute') == datetime(2026, 1, 1, 8, 30)
+    assert bucket_start(moment, 'hour') == datetime(2026, 1, 1, 8)
+    assert bucket_start(moment, 'day') == datetime(2026, 1, 1)
+    start = datetime(2026, 1, 1)
+    assert choose_resolution(start, start + timedelta(hours=6)) == 'minute'
+    assert choose_resolution(start, start + timedelta(days=30)) == 'hour'
+    assert choose_resolution(start, start + timedelta(days=365)) == 'day'
+
+
+def test_aggregate_combines_samples_per_bucket():
+    buckets = aggregate([('heart_rate', 60.0, datetime(2026, 1, 1, 8, 0, 10)),
+                         ('heart_rate', 80.0, datetime(2026, 1, 1, 8, 0, 50)),
+                         ('heart_rate', 70.0, datetime(2026, 1, 1, 9, 0))])
+    assert buckets[('heart_rate', 'minute', datetime(2026, 1, 1, 8, 0))] == [60.0, 80.0, 140.0, 2]
+    assert buckets[('heart_rate', 'day', datetime(2026, 1, 1))] == [60.0, 80.0, 210.0, 3]
+
+
+def test_samples_from_health_data_keeps_finite_numeric_metrics():
+    recorded_at = datetime(2026, 1, 1)
+    rows = [
+        {'data_type': 'steps', 'value': '1000', 'recorded_at': recorded_at},
+        {'data_type': 'steps', 'value': 'NaN', 'recorded_at': recorded_at},
+        {'data_type': 'steps', 'value': 'true', 'recorded_at': recorded_at},
+        {'data_type': 'weight', 'value': '{"kg": 70}', 'recorded_at': recorded_at},
+        {'data_type': 'mood', 'value': '3', 'recorded_at': recorded_at},
+    ]
+    assert samples_from_health_data(rows) == [('steps', 1000.0, recorded_at)]
+
+
+def test_record_samples_ignores_duplicates_and_updates_rollups(user_id):
+    start = datetime(2026, 1, 1, 8, 0)
+    samples = [('heart_rate', 60.0, start), ('heart_rate', 80.0, start + timedelta(seconds=30)),
+               ('heart_rate', 100.0, start + timedelta(hours=1))]
+    assert record_samples(user_id, samples) == 3
+    # 重复上报不重复计入预聚合
+    assert record_samples(user_id, samples[:1] + [('heart_rate', 40.0, start + timedelta(minutes=1))]) == 1
+
+    minutes = query_series(user_id, 'heart_rate', start, start + timedelta(minutes=2), 'minute')
+    assert [(p['min'], p['max'], p['avg'], p['count']) for p in minutes] == [(60.0, 80.0, 70.0, 2), (40.0, 40.0, 40.0, 1)]
+    day = query_series(user_id, 'heart_rate', start, start + timedelta(days=1), 'day')
+    assert [(p['min'], p['max'], p['count']) for p in day] == [(40.0, 100.0, 4)]
+    assert math.isclose(day[0]['avg'], 70.0)
+
+
+def test_partition_ddl_covers_requested_months():
+    class Recorder:
+        def __init__(self):
+            self.statements = []
+
+        def execute(self, statement):
+            self.statements.append(str(statement))
+
+    connection = Recorder()
+    ensure_sample_partitions(connection, months_back=1, months_ahead=1, today=datetime(2026, 1, 15))
+    assert [s.split()[5] for s in connection.statements] == [
+        'health_metric_samples_202512', 'health_metric_samples_202601', 'health_metric_samples_202602'
+    ]
+    assert "FROM ('2025-12-01') TO ('2026-01-01')" in connection.statements[0]
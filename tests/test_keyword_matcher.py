@@ -0,0 +1,41 @@
+from keyword_matcher import KeywordMatcher
+
+
+def _naive_match(entries, text):
+    # 原实现：按顺序逐个判断 keyword in message
+    for keyword, value in entries:
+        if keyword in text:
+            return value
+    return None
+
+
+ENTRIES = [
+    ('体能概况', 'overview'),
+    ('训练计划', 'plan'),
+    ('计划', 'generic_plan'),
+    ('如何增肌', 'muscle'),
+    ('增肌', 'muscle_short'),
+]
+
+
+def test_earlier_entries_take_priority_like_sequential_lookup():
+    matcher = KeywordMatcher(ENTRIES)
+    for text in ['帮我做个训练计划', '我想知道如何增肌', '增肌和计划', '只有计划', '体能概况和训练计划', '你好', '']:
+        assert matcher.match(text) == _naive_match(ENTRIES, text), text
+
+
+def test_explicit_priority_overrides_order():
+    matcher = KeywordMatcher([('a', 'low', 5), ('b', 'high', 1)])
+    assert matcher.match('ab') == 'high'
+
+
+def test_overlapping_keywords_found_through_failure_links():
+    matcher = KeywordMatcher([('he', 1), ('she', 2), ('his', 3), ('hers', 4)])
+    assert matcher.find_all('ushers') == [(3, 'she'), (3, 'he'), (5, 'hers')]
+
+
+def test_empty_keywords_and_none_text_are_ignored():
+    matcher = KeywordMatcher([('', 'empty'), ('x', 'x')])
+    assert matcher.match(None) is None
+    assert matcher.match('abc') is None
+    assert matcher.match('xyz') == 'x'
@@ -0,0 +1,118 @@
+import re
+
+import metrics
+from metrics import REGISTRY, CallbackMetric, Counter, Histogram, Registry, record_usage
+
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*",?)*\})? (\S+)$')
+
+
+def _parse(text):
+    """按Prometheus文本格式解析，返回 {指标名: (类型, [(样本名, 标签, 数值), ...])}，格式不符时断言失败"""
+    assert text.endswith('\n')
+    families, current = {}, None
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            name = line.split(' ')[2]
+            assert name not in families, f'duplicate metric {name}'
+            current = name
+        elif line.startswith('# TYPE '):
+            _, _, name, type_name = line.split(' ')
+            assert name == current
+            families[name] = (type_name, [])
+        else:
+            match = SAMPLE_RE.match(line)
+            assert match, line
+            sample, labels, value = match.groups()
+            assert sample == current or sample.rsplit('_', 1)[0] == current, line
+            float(value.replace('+Inf', 'inf'))
+            families[current][1].append((sample, labels or '', value))
+    return families
+
+
+def test_counter_and_labels_render_sorted_and_escaped():
+    registry = Registry()
+    counter = registry.register(Counter('demo_total', 'Demo counter', ['service_type', 'outcome']))
+    counter.inc(service_type='nutritionist', outcome='success')
+    counter.inc(2.5, service_type='nutritionist', outcome='success')
+    counter.inc(service_type='a"b\\c\nd', outcome='x')
+    assert registry.render() == (
+        '# HELP demo_total Demo counter\n'
+        '# TYPE demo_total counter\n'
+        'demo_total{service_type="a\\"b\\\\c\\nd",outcome="x"} 1\n'
+        'demo_total{service_type="nutritionist",outcome="success"} 3.5\n'
+    )
+    _parse(registry.render())
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.register(Histogram('demo_seconds', 'Demo latency', ['service_type'], buckets=(1, 0.1)))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, service_type='fitness_trainer')
+    lines = registry.render().splitlines()[2:]
+    assert lines == [
+        'demo_seconds_bucket{service_type="fitness_trainer",le="0.1"} 2',
+        'demo_seconds_bucket{service_type="fitness_trainer",le="1"} 3',
+        'demo_seconds_bucket{service_type="fitness_trainer",le="+Inf"} 4',
+        'demo_seconds_sum{service_type="fitness_trainer"} 3.65',
+        'demo_seconds_count{service_type="fitness_trainer"} 4',
+    ]
+
+
+def test_callback_metric_accepts_scalar_or_labelled_values():
+    registry = Registry()
+    registry.register(CallbackMetric('demo_bytes', 'Demo gauge', lambda: 1024))
+    registry.register(CallbackMetric('demo_state', 'Demo state', lambda: [(('open',), 0), (('closed',), 1)],
+                                     labelnames=['state']))
+    families = _parse(registry.render())
+    assert families['demo_bytes'] == ('gauge', [('demo_bytes', '', '1024')])
+    assert families['demo_state'][1] == [('demo_state', '{state="open"}', '0'),
+                                         ('demo_state', '{state="closed"}', '1')]
+
+
+def test_ai_metric_names_and_labels():
+    expected = {
+        'ai_upstream_latency_seconds': ('histogram', ('service_type',)),
+        'ai_upstream_time_to_first_token_seconds': ('histogram', ('service_type',)),
+        'ai_upstream_requests_total': ('counter', ('service_type', 'outcome')),
+        'ai_prompt_tokens_total': ('counter', ('service_type',)),
+        'ai_completion_tokens_total': ('counter', ('service_type',)),
+        'ai_fallback_total': ('counter', ('service_type', 'reason')),
+    }
+    defined = {metric.name: (metric.type_name, metric.labelnames) for metric in REGISTRY._metrics
+               if metric.name in expected}
+    assert defined == expected
+    # 回退原因即 ai_fallback_total 和 ai_upstream_requests_total 的 reason/outcome 标签值
+    assert (metrics.FALLBACK_NO_KEY, metrics.FALLBACK_HTTP_ERROR, metrics.FALLBACK_EXCEPTION,
+            metrics.FALLBACK_BREAKER_OPEN) == ('no_key', 'http_error', 'exception', 'breaker_open')
+
+
+def test_record_usage_counts_tokens(monkeypatch):
+    prompt = Counter('p', 'p', ['service_type'])
+    completion = Counter('c', 'c', ['service_type'])
+    monkeypatch.setattr(metrics, 'AI_PROMPT_TOKENS', prompt)
+    monkeypatch.setattr(metrics, 'AI_COMPLETION_TOKENS', completion)
+    record_usage('nutritionist', {'prompt_tokens': 120, 'completion_tokens': 30})
+    record_usage('nutritionist', {'prompt_tokens': 10})
+    record_usage('nutritionist', None)
+    assert prompt._values == {('nutritionist',): 130}
+    assert completion._values == {('nutritionist',): 30}
+
+
+def test_metrics_endpoint_serves_every_family_in_text_format(app_module):
+    response = app_module.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == Registry.CONTENT_TYPE
+    families = _parse(response.get_data(as_text=True))
+    for name in ('ai_upstream_latency_seconds', 'ai_fallback_total', 'ai_reply_cache_hits_total',
+                 'ai_singleflight_coalesced_total', 'dashboard_cache_invalidations_total',
+                 'conversation_store_memory_bytes'):
+        assert name in families
+    assert families['ai_reply_cache_hits_total'][0] == 'counter'
+    states = families['ai_circuit_breaker_state']
+    assert states[0] == 'gauge'
+    assert sorted(labels for _, labels, _ in states[1]) == [
+        '{state="closed"}', '{state="half_open"}', '{state="open"}'
+    ]
+    assert sum(int(value) for _, _, value in states[1]) == 1
+
@@ -0,0 +1,126 @@
+import json
+
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+pytest.importorskip('dotenv')
+
+from sqlalchemy import create_engine, inspect, text
+
+from migrations import MIGRATIONS, run_migrations
+from models import db
+
+ALL_VERSIONS = [version for version, _, _ in MIGRATIONS]
+
+# 早期 init_db.py 以原始SQL建出的表（SQLite写法）
+LEGACY_SCHEMA = [
+    'CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(50) UNIQUE NOT NULL, '
+    'email VARCHAR(100) UNIQUE NOT NULL, password_hash VARCHAR(255) NOT NULL, profile TEXT, '
+    'created_at TIMESTAMP, updated_at TIMESTAMP)',
+    'CREATE TABLE health_data (id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), '
+    'weight DECIMAL(5,2), height DECIMAL(5,2), bmi DECIMAL(4,2), heart_rate INTEGER, '
+    'blood_pressure VARCHAR(20), recorded_at TIMESTAMP, notes TEXT)',
+    'CREATE TABLE fitness_workouts (id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), '
+    'workout_type VARCHAR(50) NOT NULL, duration_minutes INTEGER NOT NULL, calories_burned INTEGER, '
+    'intensity VARCHAR(20), date DATE NOT NULL, notes TEXT, created_at TIMESTAMP)',
+    'CREATE TABLE fitness_goals (id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), '
+    'goal_type VARCHAR(50) NOT NULL, target_value DECIMAL(8,2), current_value DECIMAL(8,2), deadline DATE, '
+    "status VARCHAR(20) DEFAULT 'active', created_at TIMESTAMP, updated_at TIMESTAMP)",
+    'CREATE TABLE ai_conversations (id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), '
+    'user_message TEXT NOT NULL, ai_response TEXT NOT NULL, message_type VARCHAR(50), created_at TIMESTAMP)',
+    'CREATE TABLE training_plans (id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), '
+    'plan_name VARCHAR(100) NOT NULL, plan_type VARCHAR(50), duration_weeks INTEGER, description TEXT, '
+    "exercises TEXT, status VARCHAR(20) DEFAULT 'active', created_at TIMESTAMP, updated_at TIMESTAMP)",
+]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "migrations.db"}')
+    yield engine
+    engine.dispose()
+
+
+def _assert_matches_models(engine):
+    """迁移后的表包含模型定义的全部列和索引"""
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        assert {column.name for column in table.columns} <= columns, table.name
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        assert {index.name for index in table.indexes} <= indexes, table.name
+
+
+def test_empty_database_migrates_to_model_schema_once(engine):
+    assert run_migrations(engine, verbose=False) == ALL_VERSIONS
+    _assert_matches_models(engine)
+    # 再次执行不做任何事
+    assert run_migrations(engine, verbose=False) == []
+    with engine.connect() as connection:
+        assert connection.execute(text('SELECT COUNT(*) FROM schema_migrations')).scalar() == len(ALL_VERSIONS)
+
+
+def test_legacy_schema_is_reconciled_and_rows_converted(engine):
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text(
+            "INSERT INTO users (id, username, email, password_hash, profile) VALUES "
+            "(1, 'demo', 'demo@example.com', 'x', :profile)"
+        ), {'profile': json.dumps({'age': 30, 'weight': 70, 'goals': ['减脂']})})
+        connection.execute(text(
+            "INSERT INTO fitness_workouts (user_id, workout_type, duration_minutes, calories_burned, date) VALUES "
+            "(1, 'running', 30, 300, '2024-01-14'), (1, 'yoga', 45, 200, '2024-01-15')"
+        ))
+        connection.execute(text(
+            "INSERT INTO ai_conversations (user_id, user_message, ai_response, created_at) VALUES "
+            "(1, '第一个问题', '第一个回答', '2024-01-15 10:00:00'), "
+            "(1, '第二个问题', '第二个回答', '2024-01-15 11:00:00')"
+        ))
+        connection.execute(text(
+            "INSERT INTO health_data (user_id, weight, heart_rate, recorded_at) VALUES (1, 70.5, 62, '2024-01-15')"
+        ))
+
+    assert run_migrations(engine, verbose=False) == ALL_VERSIONS
+    _assert_matches_models(engine)
+    assert run_migrations(engine, verbose=False) == []
+
+    with engine.connect() as connection:
+        user = connection.execute(text('SELECT age, weight, fitness_goals FROM users')).one()
+        assert (user.age, user.weight, json.loads(user.fitness_goals)) == (30, 70, ['减脂'])
+
+        workouts = connection.execute(text(
+            'SELECT workout_type, duration, workout_date FROM fitness_workouts ORDER BY id')).all()
+        assert [(w.workout_type, w.duration) for w in workouts] == [('running', 30), ('yoga', 45)]
+        assert str(workouts[0].workout_date).startswith('2024-01-14')
+
+        messages = connection.execute(text(
+            'SELECT seq, sender, message FROM ai_conversations ORDER BY seq')).all()
+        assert [tuple(m) for m in messages] == [
+            (1, 'user', '第一个问题'), (2, 'ai', '第一个回答'), (3, 'user', '第二个问题'), (4, 'ai', '第二个回答')
+        ]
+
+        vitals = connection.execute(text('SELECT data_type, value FROM health_data')).one()
+        assert vitals.data_type == 'vitals'
+        assert json.loads(vitals.value) == {'weight': 70.5, 'heart_rate': 62}
+
+        aggregate = connection.execute(text(
+            'SELECT total_workouts, total_calories, total_duration FROM fitness_aggregates WHERE user_id = 1')).one()
+        assert tuple(aggregate) == (2, 500, 75)
+
+
+def test_partially_migrated_database_only_runs_remaining_versions(engine):
+    with engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE schema_migrations (version INTEGER PRIMARY KEY, description VARCHAR(255) NOT NULL, '
+            'applied_at TIMESTAMP NOT NULL)'
+        ))
+    # 前三个迁移单独执行后，再执行剩余的迁移
+    for version, description, migrate in MIGRATIONS[:3]:
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(text(
+                "INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, '2024-01-01')"
+            ), {'v': version, 'd': description})
+    assert run_migrations(engine, verbose=False) == ALL_VERSIONS[3:]
+    _assert_matches_models(engine)
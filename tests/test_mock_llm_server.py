@@ -0,0 +1,130 @@
+import http.client
+import json
+import random
+import statistics
+import threading
+
+import pytest
+
+from circuit_breaker import CircuitBreaker
+from mock_llm_server import SAMPLE_TOKENS, LatencyModel, create_server, parse_args
+
+
+@pytest.fixture
+def start_server():
+    servers = []
+
+    def start(*argv):
+        options = parse_args(['--port', '0', '--latency-dist', 'fixed', '--latency-ms', '0',
+                              '--tokens-per-second', '0', '--completion-tokens', '5', *argv])
+        server = create_server(options)
+        threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _connect(server):
+    return http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=5)
+
+
+def _post(connection, body, path='/v1/chat/completions'):
+    data = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+    connection.request('POST', path, body=data, headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    return response, response.read().decode('utf-8')
+
+
+def _sse_payloads(text):
+    return [line[len('data: '):] for line in text.split('\n\n') if line]
+
+
+def test_fixed_and_zero_latency():
+    assert LatencyModel('fixed', 250, 100).sample() == 0.25
+    for dist in ('fixed', 'uniform', 'normal', 'exponential', 'lognormal'):
+        assert LatencyModel(dist, 0, 0).sample() == 0
+    # 采样结果不为负
+    assert min(LatencyModel('normal', 10, 100).sample() for _ in range(200)) >= 0
+
+
+def test_lognormal_latency_has_the_requested_mean():
+    random.seed(7)
+    samples = [LatencyModel('lognormal', 800, 400).sample() for _ in range(20000)]
+    assert statistics.mean(samples) == pytest.approx(0.8, rel=0.05)
+    assert statistics.stdev(samples) == pytest.approx(0.4, rel=0.15)
+    assert max(samples) > 2 * statistics.median(samples)
+
+
+def test_completion_matches_the_openai_response_shape(start_server):
+    server = start_server()
+    response, text = _post(_connect(server), {
+        'model': 'deepseek-chat', 'max_tokens': 3, 'messages': [{'role': 'user', 'content': '你好'}]})
+    assert response.status == 200
+    body = json.loads(text)
+    assert body['object'] == 'chat.completion'
+    assert body['model'] == 'deepseek-chat'
+    assert body['choices'][0]['message'] == {'role': 'assistant', 'content': ''.join(SAMPLE_TOKENS[:3])}
+    assert body['usage'] == {'prompt_tokens': 2, 'completion_tokens': 3, 'total_tokens': 5}
+
+
+def test_stream_sends_sse_chunks_over_a_kept_alive_connection(start_server):
+    server = start_server()
+    connection = _connect(server)
+    request = {'stream': True, 'stream_options': {'include_usage': True},
+               'messages': [{'role': 'user', 'content': 'hi'}]}
+    response, text = _post(connection, request)
+    assert response.status == 200
+    assert response.getheader('Content-Type') == 'text/event-stream'
+    assert response.getheader('Transfer-Encoding') == 'chunked'
+
+    payloads = _sse_payloads(text)
+    assert payloads[-1] == '[DONE]'
+    chunks = [json.loads(p) for p in payloads[:-1]]
+    assert chunks[0]['choices'][0]['delta'] == {'role': 'assistant', 'content': ''}
+    assert ''.join(c['choices'][0]['delta'].get('content', '') for c in chunks if c['choices']) == \
+        ''.join(SAMPLE_TOKENS[:5])
+    assert chunks[-2]['choices'][0]['finish_reason'] == 'stop'
+    assert (chunks[-1]['choices'], chunks[-1]['usage']['completion_tokens']) == ([], 5)
+
+    # 同一连接上的第二个请求；未请求用量时不发送用量块
+    response, text = _post(connection, {'stream': True, 'messages': []})
+    assert 'usage' not in text
+    assert server.stats.snapshot() == {'requests': 2, 'streams': 2, 'errors': 0, 'rate_limited': 0}
+
+
+@pytest.mark.parametrize('argv, status, stat', [
+    (['--error-rate', '1'], 500, 'errors'),
+    (['--rate-limit-rate', '1', '--retry-after', '3'], 429, 'rate_limited'),
+])
+def test_injected_failures(start_server, argv, status, stat):
+    server = start_server(*argv)
+    response, text = _post(_connect(server), {'messages': []})
+    assert response.status == status
+    assert json.loads(text)['error']['message']
+    if status == 429:
+        assert response.getheader('Retry-After') == '3'
+    assert server.stats.snapshot()[stat] == 1
+
+
+def test_unknown_paths_and_invalid_bodies(start_server):
+    server = start_server()
+    connection = _connect(server)
+    assert _post(connection, {}, path='/v1/embeddings')[0].status == 404
+    assert _post(connection, b'{not json')[0].status == 400
+    connection.request('GET', '/health')
+    response = connection.getresponse()
+    assert (response.status, json.loads(response.read())['status']) == (200, 'ok')
+
+
+def test_app_streaming_client_reads_the_mock_stream(app_module, start_server, monkeypatch):
+    server = start_server('--completion-tokens', '8')
+    monkeypatch.setattr(app_module, 'DEEPSEEK_BASE_URL', f'http://127.0.0.1:{server.server_address[1]}/v1')
+    monkeypatch.setattr(app_module, 'DEEPSEEK_API_KEY', 'test-key')
+    monkeypatch.setattr(app_module, 'ai_breaker', CircuitBreaker('test', minimum_calls=1000))
+    app_module.reply_cache.clear()
+    parts = list(app_module.stream_external_ai_service('mock server test', 'fitness_trainer'))
+    assert ''.join(parts) == ''.join(SAMPLE_TOKENS[:8])
+    assert server.stats.snapshot()['streams'] == 1
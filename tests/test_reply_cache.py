@@ -0,0 +1,65 @@
+import reply_cache
+from reply_cache import ReplyCache, context_digest, normalize_message
+
+
+def test_normalize_message_unifies_width_case_whitespace_and_punctuation():
+    assert normalize_message('  ＨＥＬＬＯ   World！ ') == 'hello world'
+    assert normalize_message('如何增肌？') == normalize_message('如何增肌')
+    assert normalize_message(None) == ''
+
+
+def test_make_key_includes_context_digest():
+    context = [{'role': 'user', 'content': '我想减脂'}]
+    assert ReplyCache.make_key('fitness', 'v1', 'Hi!') == ('fitness', 'v1', 'hi', None)
+    assert ReplyCache.make_key('fitness', 'v1', 'hi', context)[3] == context_digest(context)
+    assert (ReplyCache.make_key('fitness', 'v1', 'hi', context)
+            != ReplyCache.make_key('fitness', 'v1', 'hi', [{'role': 'user', 'content': '我想增肌'}]))
+    assert context_digest([]) is None
+
+
+def test_get_and_set_count_hits_and_misses():
+    cache = ReplyCache(max_size=10, ttl=60)
+    assert cache.get('a') is None
+    cache.set('a', 'reply')
+    assert cache.get('a') == 'reply'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 1, 1)
+
+
+def test_empty_replies_and_disabled_cache_are_not_stored():
+    cache = ReplyCache(max_size=10, ttl=60)
+    cache.set('a', '')
+    assert cache.get('a') is None
+    disabled = ReplyCache(max_size=0, ttl=60)
+    disabled.set('a', 'reply')
+    assert disabled.get('a') is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ReplyCache(max_size=2, ttl=60)
+    cache.set('a', '1')
+    cache.set('b', '2')
+    cache.get('a')
+    cache.set('c', '3')
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    assert cache.get('c') == '3'
+
+
+def test_entries_expire_after_ttl(monkeypatch, clock):
+    monkeypatch.setattr(reply_cache.time, 'monotonic', clock)
+    cache = ReplyCache(max_size=10, ttl=60)
+    cache.set('a', 'reply')
+    clock.advance(59)
+    assert cache.get('a') == 'reply'
+    clock.advance(1)
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_clear_returns_number_of_entries():
+    cache = ReplyCache(max_size=10, ttl=60)
+    cache.set('a', '1')
+    cache.set('b', '2')
+    assert cache.clear() == 2
+    assert cache.get('a') is None
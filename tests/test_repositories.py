@@ -0,0 +1,243 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+pytest.importorskip('dotenv')
+
+from models import db, FitnessAggregate, FitnessGoal
+from repositories import (
+    FitnessAggregateRepository, GoalRepository, UserRepository, WorkoutRepository, decode_cursor, encode_cursor
+)
+
+
+@pytest.fixture
+def alice(db_app):
+    return UserRepository.create('alice', 'alice@example.com', 'secret', {'age': 30, 'goals': ['减脂']})
+
+
+@pytest.fixture
+def bob(db_app):
+    return UserRepository.create('bob', 'bob@example.com', 'secret')
+
+
+def _workout(day, **fields):
+    data = {'type': 'strength', 'duration': 45, 'calories_burned': 300.4,
+            'exercises': ['深蹲'], 'workout_date': f'2026-03-{day:02d}T08:00:00'}
+    data.update(fields)
+    return data
+
+
+def test_users_are_looked_up_by_username(alice, bob):
+    assert UserRepository.get('alice').id == alice.id
+    assert UserRepository.get_id('bob') == bob.id
+    assert UserRepository.get('nobody') is None
+    assert UserRepository.get_id('nobody') is None
+    assert UserRepository.version('nobody') is None
+
+
+def test_user_password_and_email_checks(alice):
+    assert UserRepository.verify_password(alice, 'secret')
+    assert not UserRepository.verify_password(alice, 'wrong')
+    assert not UserRepository.verify_password(None, 'secret')
+    UserRepository.set_password(alice, 'changed')
+    assert UserRepository.verify_password(UserRepository.get('alice'), 'changed')
+
+    assert UserRepository.email_in_use('alice@example.com')
+    assert not UserRepository.email_in_use('alice@example.com', exclude_username='alice')
+    assert not UserRepository.email_in_use('carol@example.com')
+
+
+def test_profile_updates_merge_fields(alice):
+    version = UserRepository.version('alice')
+    UserRepository.update(alice, profile={'weight': 60.5, 'goals': ['增肌', '耐力']})
+    profile = UserRepository.profile(UserRepository.get('alice'))
+    assert profile == {'age': 30, 'weight': 60.5, 'goals': ['增肌', '耐力']}
+    assert UserRepository.version('alice') != version
+
+    user = UserRepository.to_dict(UserRepository.get('alice'))
+    assert (user['username'], user['email'], user['profile']) == ('alice', 'alice@example.com', profile)
+    assert UserRepository.profile(None) == {}
+
+
+def test_add_workout_returns_api_shape(alice):
+    workout = WorkoutRepository.add(alice.id, _workout(1, notes='早练'))
+    assert list(workout) == ['id', 'type', 'duration', 'calories_burned', 'exercises', 'notes', 'workout_date']
+    assert workout['type'] == 'strength'
+    assert workout['calories_burned'] == 300
+    assert workout['exercises'] == ['深蹲']
+    assert workout['workout_date'] == '2026-03-01T08:00:00'
+
+
+def test_list_recent_and_latest_workouts(alice, bob):
+    # 按插入顺序：日期 3, 1, 2
+    ids = [WorkoutRepository.add(alice.id, _workout(day))['id'] for day in (3, 1, 2)]
+    WorkoutRepository.add(bob.id, _workout(5))
+
+    workouts, total = WorkoutRepository.list(alice.id, limit=2, offset=1)
+    assert total == 3
+    assert [w['id'] for w in workouts] == ids[1:]
+    assert [w['id'] for w in WorkoutRepository.recent(alice.id, 2)] == ids[1:]
+    assert [w['workout_date'][:10] for w in WorkoutRepository.latest(alice.id, 2)] == ['2026-03-03', '2026-03-02']
+    assert [w['id'] for w in WorkoutRepository.all(alice.id)] == ids
+    assert WorkoutRepository.list(None) == ([], 0)
+
+
+def test_update_and_delete_only_touch_own_workouts(alice, bob):
+    workout_id = WorkoutRepository.add(alice.id, _workout(1))['id']
+
+    assert WorkoutRepository.update(bob.id, workout_id, {'duration': 5}) is None
+    assert not WorkoutRepository.delete(bob.id, workout_id)
+
+    updated = WorkoutRepository.update(alice.id, workout_id, {
+        'type': 'cardio', 'duration': 30, 'calories_burned': '250', 'notes': '慢跑',
+        'workout_date': '2026-03-02T07:30:00'
+    })
+    assert (updated['type'], updated['duration'], updated['calories_burned'], updated['notes']) == \
+        ('cardio', 30, 250, '慢跑')
+    assert updated['workout_date'] == '2026-03-02T07:30:00'
+    assert updated['exercises'] == ['深蹲']
+
+    assert WorkoutRepository.delete(alice.id, workout_id)
+    assert WorkoutRepository.all(alice.id) == []
+    assert WorkoutRepository.update(alice.id, workout_id, {'duration': 1}) is None
+
+
+def test_goals_are_listed_per_user_and_status(alice, bob):
+    first = GoalRepository.add(alice.id, {'type': 'weight_loss', 'target': 55, 'unit': 'kg',
+                                          'deadline': '2026-06-01T00:00:00'})
+    GoalRepository.add(bob.id, {'type': 'endurance', 'target': 10})
+    assert list(first) == ['id', 'type', 'target', 'current', 'unit', 'deadline', 'status', 'created_at']
+    assert (first['type'], first['target'], first['current'], first['status']) == ('weight_loss', 55, 0, 'active')
+    assert first['deadline'] == '2026-06-01T00:00:00'
+
+    assert [g['id'] for g in GoalRepository.list(alice.id)] == [first['id']]
+    assert GoalRepository.list(alice.id, status='completed') == []
+    assert GoalRepository.list(None) == []
+
+
+def test_goal_version_changes_on_add_and_update(alice):
+    assert GoalRepository.version(None) is None
+    versions = [GoalRepository.version(alice.id)]
+    goal = GoalRepository.add(alice.id, {'type': 'muscle_gain', 'target': 5})
+    versions.append(GoalRepository.version(alice.id))
+    GoalRepository.add(alice.id, {'type': 'endurance', 'target': 10})
+    versions.append(GoalRepository.version(alice.id))
+
+    db.session.get(FitnessGoal, goal['id']).status = 'completed'
+    db.session.commit()
+    versions.append(GoalRepository.version(alice.id))
+    assert len(set(versions)) == len(versions)
+
+
+def _recomputed(user_id):
+    workouts = WorkoutRepository.all(user_id)
+    return {
+        'total_workouts': len(workouts),
+        'total_calories': sum(w['calories_burned'] for w in workouts),
+        'total_duration': sum(w['duration'] for w in workouts)
+    }
+
+
+def _aggregate(user_id):
+    totals = FitnessAggregateRepository.get(user_id)
+    totals.pop('average_duration')
+    return totals
+
+
+def test_aggregate_matches_recomputed_totals_after_writes(alice, bob):
+    first = WorkoutRepository.add(alice.id, _workout(1))['id']
+    second = WorkoutRepository.add(alice.id, _workout(2, duration=30, calories_burned=120))['id']
+    WorkoutRepository.add(bob.id, _workout(3))
+    assert _aggregate(alice.id) == _recomputed(alice.id) == \
+        {'total_workouts': 2, 'total_calories': 420, 'total_duration': 75}
+
+    WorkoutRepository.update(alice.id, first, {'duration': 60, 'calories_burned': 500})
+    assert _aggregate(alice.id) == _recomputed(alice.id)
+    # 只修改非数值字段时汇总不变
+    WorkoutRepository.update(alice.id, second, {'notes': '拉伸'})
+    assert _aggregate(alice.id) == _recomputed(alice.id)
+
+    WorkoutRepository.delete(alice.id, second)
+    assert _aggregate(alice.id) == _recomputed(alice.id) == \
+        {'total_workouts': 1, 'total_calories': 500, 'total_duration': 60}
+    assert FitnessAggregateRepository.get(alice.id)['average_duration'] == 60
+    assert _aggregate(bob.id) == _recomputed(bob.id)
+
+
+def test_missing_aggregate_is_computed_on_read_and_created_on_next_write(alice):
+    WorkoutRepository.add(alice.id, _workout(1))
+    # 迁移前的历史数据没有汇总行
+    db.session.query(FitnessAggregate).delete()
+    db.session.commit()
+
+    assert _aggregate(alice.id) == _recomputed(alice.id)
+    assert db.session.get(FitnessAggregate, alice.id) is None
+
+    WorkoutRepository.add(alice.id, _workout(2))
+    assert db.session.get(FitnessAggregate, alice.id) is not None
+    assert _aggregate(alice.id) == _recomputed(alice.id)
+    assert FitnessAggregateRepository.get(None)['total_workouts'] == 0
+
+
+def test_aggregate_created_concurrently_is_incremented_once(alice, monkeypatch):
+    WorkoutRepository.add(alice.id, _workout(1))
+    increment = FitnessAggregateRepository._increment
+    calls = []
+
+    def racing_increment(*args):
+        calls.append(args)
+        # 第一次累加时汇总行“尚不存在”，随后创建时发现已被其他事务创建（IntegrityError）
+        return 0 if len(calls) == 1 else increment(*args)
+
+    monkeypatch.setattr(FitnessAggregateRepository, '_increment', staticmethod(racing_increment))
+    WorkoutRepository.add(alice.id, _workout(2, duration=20, calories_burned=100))
+    assert len(calls) == 2
+    assert _aggregate(alice.id) == _recomputed(alice.id) == \
+        {'total_workouts': 2, 'total_calories': 400, 'total_duration': 65}
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    position = (datetime(2026, 3, 1, 8, 0, 30, 123456), 42)
+    cursor = encode_cursor(*position)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == position
+    for bad in ('', 'not-a-cursor', encode_cursor(*position)[:-3], 'WyJ4Il0'):
+        with pytest.raises(ValueError):
+            decode_cursor(bad)
+
+
+def _walk(user_id, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        workouts, next_cursor = WorkoutRepository.page(
+            user_id, limit, cursor=decode_cursor(cursor) if cursor else None, **filters)
+        pages.append([w['id'] for w in workouts])
+        if next_cursor is None:
+            return pages
+        cursor = next_cursor
+
+
+def test_keyset_pages_break_date_ties_by_id(alice):
+    # 同一时刻的多条记录分布在页边界两侧
+    ids = [WorkoutRepository.add(alice.id, _workout(1))['id'] for _ in range(5)]
+    later = WorkoutRepository.add(alice.id, _workout(2))['id']
+    earlier = WorkoutRepository.add(alice.id, _workout(1, workout_date='2026-02-28T23:59:59'))['id']
+
+    pages = _walk(alice.id, 2)
+    assert pages == [[later, ids[4]], [ids[3], ids[2]], [ids[1], ids[0]], [earlier]]
+    # 恰好整页时最后一页之后没有游标
+    assert _walk(alice.id, 7) == [[later] + ids[::-1] + [earlier]]
+
+
+def test_keyset_pages_apply_date_range_and_type(alice, bob):
+    march = {day: WorkoutRepository.add(alice.id, _workout(day))['id'] for day in range(1, 6)}
+    yoga = WorkoutRepository.add(alice.id, _workout(3, type='yoga'))['id']
+    WorkoutRepository.add(bob.id, _workout(3))
+
+    # from 含、to 不含
+    assert _walk(alice.id, 2, date_from=datetime(2026, 3, 2, 8), date_to=datetime(2026, 3, 4, 8)) == \
+        [[yoga, march[3]], [march[2]]]
+    assert _walk(alice.id, 10, workout_type='yoga') == [[yoga]]
+    assert _walk(alice.id, 10, workout_type='strength', date_from=datetime(2026, 3, 5)) == [[march[5]]]
+    assert WorkoutRepository.page(None) == ([], None)
@@ -0,0 +1,109 @@
+from search_index import ConversationSearchIndex, tokenize
+
+
+def _message(message_id, text, sender='user'):
+    return {'id': message_id, 'message': text, 'sender': sender, 'timestamp': None}
+
+
+HISTORY = {
+    'alice': [
+        ('fitness_trainer', _message(1, '我想开始健身，有什么建议吗？')),
+        ('fitness_trainer', _message(2, '建议从有氧运动开始，每周三次', 'ai')),
+        ('nutritionist', _message(3, '减脂期间蛋白质摄入多少合适')),
+        ('nutritionist', _message(4, 'Protein intake: about 1.6g per kg', 'ai')),
+    ],
+    'bob': [('fitness_trainer', _message(1, '健身计划'))],
+}
+
+
+def _index(max_users=10):
+    loads = []
+
+    def loader(user):
+        loads.append(user)
+        return HISTORY.get(user, [])
+    return ConversationSearchIndex(loader, max_users=max_users), loads
+
+
+def test_tokenize_uses_bigrams_words_and_optional_unigrams():
+    assert tokenize('健身 Plan') == ['健身', 'plan']
+    assert tokenize('减脂餐') == ['减脂', '脂餐']
+    assert tokenize('肌') == ['肌']
+    assert set(tokenize('健身', unigrams=True)) == {'健', '身', '健身'}
+
+
+def test_search_matches_chinese_english_and_single_characters():
+    index, _ = _index()
+    hits, total = index.search('alice', '建议')
+    assert total == 2
+    assert {hit['id'] for hit in hits} == {1, 2}
+    assert index.search('alice', 'PROTEIN')[0][0]['id'] == 4
+    assert index.search('alice', '脂')[1] == 1
+
+
+def test_search_filters_by_service_and_is_per_user():
+    index, _ = _index()
+    assert index.search('alice', '建议', service_type='nutritionist') == ([], 0)
+    assert index.search('bob', '建议') == ([], 0)
+    assert index.search('alice', '计划') == ([], 0)
+
+
+def test_long_chinese_phrases_must_appear_contiguously():
+    index = ConversationSearchIndex(lambda user: [
+        ('fitness_trainer', _message(1, '坚持健身，身体更好')),
+        ('fitness_trainer', _message(2, '健身体能训练')),
+    ])
+    # 二元组“健身”“身体”在两条消息中都出现，但只有第2条连续出现“健身体”
+    hits, total = index.search('alice', '健身体')
+    assert total == 1
+    assert hits[0]['id'] == 2
+
+
+def test_new_messages_are_indexed_incrementally():
+    index, loads = _index()
+    index.search('alice', '建议')
+    index.add('alice', 'fitness_trainer', _message(5, '还有其他建议吗'))
+    index.add('carol', 'fitness_trainer', _message(1, '建议'))  # 未建立索引的用户忽略
+    hits, total = index.search('alice', '建议')
+    assert total == 3
+    assert loads == ['alice']
+
+
+def test_pagination_is_stable_and_newer_messages_rank_first_on_ties():
+    index, _ = _index()
+    for message_id in range(10, 15):
+        index.search('bob', '健身')
+        index.add('bob', 'fitness_trainer', _message(message_id, '健身计划'))
+    first, total = index.search('bob', '健身计划', limit=3)
+    second, _ = index.search('bob', '健身计划', limit=3, offset=3)
+    assert total == 6
+    assert [hit['id'] for hit in first + second] == [14, 13, 12, 11, 10, 1]
+
+
+def test_least_recently_used_indexes_are_evicted():
+    index, loads = _index(max_users=1)
+    index.search('alice', '建议')
+    index.search('bob', '健身')
+    index.search('alice', '建议')
+    assert loads == ['alice', 'bob', 'alice']
+    assert index.stats()['indexed_users'] == 1
+
+
+def test_messages_added_while_loading_are_indexed():
+    history = [('fitness_trainer', _message(1, '深蹲训练'))]
+    index = None
+
+    def loader(user):
+        # 加载读到历史之后、索引建好之前写入新消息
+        loaded = list(history)
+        history.append(('fitness_trainer', _message(2, '硬拉训练')))
+        index.add(user, 'fitness_trainer', history[-1][1])
+        return loaded
+
+    index = ConversationSearchIndex(loader)
+    hits, total = index.search('alice', '硬拉')
+    assert total == 1
+    assert hits[0]['id'] == 2
+    assert index.search('alice', '训练')[1] == 2
+    # 加载结束后不再缓存新消息
+    assert index._loading == {}
@@ -0,0 +1,174 @@
+import json
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+pytest.importorskip('dotenv')
+
+from data_export import CONVERSATION_SERIALIZER, HEALTH_DATA_SERIALIZER
+from models import (
+    db, AIConversation, Exercise, FitnessGoal, FitnessWorkout, HealthData, JSONText, ModelSerializer, TrainingPlan,
+    User, json_bytes, serialize_model, serializer_for
+)
+from repositories import GOAL_SERIALIZER, WORKOUT_SERIALIZER
+
+# 以下为改用预编译序列化器之前的实现，用于比对输出
+
+LEGACY_JSON_COLUMNS = ['fitness_goals', 'exercises', 'value', 'plan_data', 'metadata']
+
+
+def legacy_serialize_model(model):
+    result = {}
+    for column in model.__table__.columns:
+        value = getattr(model, column.name)
+        if column.name in LEGACY_JSON_COLUMNS and value:
+            try:
+                value = json.loads(value)
+            except Exception:
+                pass
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        result[column.name] = value
+    return result
+
+
+def _load_json(value, default):
+    if not value:
+        return default
+    try:
+        return json.loads(value)
+    except ValueError:
+        return default
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def legacy_workout(workout):
+    return {
+        'id': workout.id,
+        'type': workout.workout_type,
+        'duration': workout.duration,
+        'calories_burned': workout.calories_burned or 0,
+        'exercises': _load_json(workout.exercises, []),
+        'notes': workout.notes or '',
+        'workout_date': _isoformat(workout.workout_date)
+    }
+
+
+def legacy_goal(goal):
+    return {
+        'id': goal.id,
+        'type': goal.goal_type,
+        'target': goal.target_value,
+        'current': goal.current_value or 0,
+        'unit': goal.unit or '',
+        'deadline': _isoformat(goal.deadline),
+        'status': goal.status,
+        'created_at': _isoformat(goal.created_at)
+    }
+
+
+def legacy_health(row):
+    try:
+        value = json.loads(row.value) if row.value else None
+    except ValueError:
+        value = row.value
+    return {
+        'id': row.id,
+        'data_type': row.data_type,
+        'value': value,
+        'recorded_at': row.recorded_at.isoformat() if row.recorded_at else None
+    }
+
+
+def legacy_conversation(row):
+    return {
+        'id': row.seq,
+        'ai_type': row.ai_type,
+        'sender': row.sender,
+        'message': row.message,
+        'timestamp': row.timestamp.isoformat() if row.timestamp else None
+    }
+
+
+# JSON列的各种取值：正常、空、无法解析
+JSON_VALUES = [json.dumps(['深蹲', '硬拉'], ensure_ascii=False), json.dumps({'hours': 7}), None, '', 'not json']
+
+
+@pytest.fixture
+def rows(db_app):
+    user = User(username='alice', email='alice@example.com', password_hash='x', age=30,
+                fitness_goals=JSON_VALUES[0])
+    db.session.add(user)
+    db.session.flush()
+    when = datetime(2026, 3, 1, 8, 30, 15, 250000)
+    for i, value in enumerate(JSON_VALUES):
+        db.session.add(FitnessWorkout(user_id=user.id, workout_type='strength', duration=i * 10 or None,
+                                      calories_burned=i * 100 or None, exercises=value,
+                                      notes=None if i % 2 else f'note {i}', workout_date=when))
+        db.session.add(HealthData(user_id=user.id, data_type='sleep', value=value, recorded_at=when))
+        db.session.add(TrainingPlan(user_id=user.id, plan_name=f'plan {i}', plan_data=value))
+        db.session.add(AIConversation(user_id=user.id, ai_type='nutritionist', message=f'm{i}', sender='user',
+                                      seq=i + 1, timestamp=when if i % 2 else None))
+    for current, deadline in ((None, None), (0.0, when), (3.5, when)):
+        db.session.add(FitnessGoal(user_id=user.id, goal_type='weight_loss', target_value=55,
+                                   current_value=current, deadline=deadline, unit=None if current else 'kg'))
+    db.session.add(Exercise(name='深蹲', category='strength'))
+    db.session.commit()
+    db.session.expire_all()
+    return user
+
+
+def _all(model):
+    return db.session.execute(db.select(model).order_by(*model.__table__.primary_key.columns)).scalars().all()
+
+
+def test_json_columns_are_the_legacy_json_columns():
+    for model in (User, HealthData, FitnessWorkout, FitnessGoal, AIConversation, TrainingPlan, Exercise):
+        json_columns = {column.name for column in model.__table__.columns if isinstance(column.type, JSONText)}
+        assert json_columns == {column.name for column in model.__table__.columns
+                                if column.name in LEGACY_JSON_COLUMNS}, model
+
+
+@pytest.mark.parametrize('model', [User, HealthData, FitnessWorkout, FitnessGoal, TrainingPlan, Exercise])
+def test_serialize_model_matches_legacy_output(rows, model):
+    for row in _all(model):
+        result = serialize_model(row)
+        assert result == legacy_serialize_model(row)
+        assert list(result) == [column.name for column in model.__table__.columns]
+
+
+def test_serialize_model_decodes_conversation_metadata(rows):
+    # 旧实现按列名 getattr，metadata 列读到的是声明式基类的 MetaData 对象
+    conversation = _all(AIConversation)[0]
+    conversation.message_metadata = json.dumps({'source': 'app'})
+    result = serialize_model(conversation)
+    assert result['metadata'] == {'source': 'app'}
+    expected = legacy_serialize_model(conversation)
+    expected['metadata'] = result['metadata']
+    assert result == expected
+
+
+def test_api_serializers_match_legacy_builders(rows):
+    pairs = [(WORKOUT_SERIALIZER, legacy_workout, FitnessWorkout), (GOAL_SERIALIZER, legacy_goal, FitnessGoal),
+             (HEALTH_DATA_SERIALIZER, legacy_health, HealthData),
+             (CONVERSATION_SERIALIZER, legacy_conversation, AIConversation)]
+    for serializer, legacy, model in pairs:
+        for row in _all(model):
+            result = serializer(row)
+            expected = legacy(row)
+            assert result == expected, (model, result, expected)
+            # 字段顺序（即JSON输出的键顺序）也一致
+            assert list(result) == list(expected)
+            assert json.loads(json_bytes(result)) == json.loads(json.dumps(expected))
+        assert serializer.many(_all(model)) == [legacy(row) for row in _all(model)]
+
+
+def test_serializers_are_cached_per_class_and_handle_single_fields(rows):
+    assert serializer_for(FitnessWorkout) is serializer_for(FitnessWorkout)
+    assert serialize_model(None) is None
+    single = ModelSerializer(FitnessWorkout, fields=['workout_type'], aliases={'workout_type': 'type'})
+    assert single(_all(FitnessWorkout)[0]) == {'type': 'strength'}
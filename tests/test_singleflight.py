@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'reply'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('k', fetch)))
+    leader.start()
+    assert started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do('k', fetch))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    # 等待跟随者进入等待状态后再放行
+    while flight.stats()['coalesced'] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert results == ['reply'] * 4
+    assert len(calls) == 1
+    assert flight.stats() == {'in_flight': 0, 'executions': 1, 'coalesced': 3}
+
+
+def test_errors_are_shared_and_key_is_released():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError('upstream')
+
+    with pytest.raises(ValueError):
+        flight.do('k', fail)
+    assert flight.do('k', lambda: 'ok') == 'ok'
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_async_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'reply'
+
+        results = await asyncio.gather(*(flight.do_async('k', fetch) for _ in range(5)))
+        return results, calls, flight.stats()
+
+    results, calls, stats = asyncio.run(scenario())
+    assert results == ['reply'] * 5
+    assert len(calls) == 1
+    assert stats == {'in_flight': 0, 'executions': 1, 'coalesced': 4}
+
+
+def test_async_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            return 'reply'
+
+        leader = asyncio.ensure_future(flight.do_async('k', fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do_async('k', fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower, flight.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result == 'reply'
+    assert stats['executions'] == 1
+
+
+def test_async_upstream_cancelled_when_all_callers_cancel():
+    async def scenario():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fetch():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.ensure_future(flight.do_async('k', fetch))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        # 之后的调用重新发起上游调用
+        async def again():
+            return 'fresh'
+        return await flight.do_async('k', again)
+
+    assert asyncio.run(scenario()) == 'fresh'
+
+
+def test_async_errors_reach_every_caller():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError('upstream')
+
+        return await asyncio.gather(flight.do_async('k', fail), flight.do_async('k', fail),
+                                    return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [type(result) for result in results] == [ValueError, ValueError]